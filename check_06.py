@@ -1,6 +1,6 @@
 # check_06.py  — ASCII-only / column auto-detection
 import os
-import pandas as pd
+from testpack_plan import load_plan
 
 EXCEL_PATH = os.environ.get("EXCEL_PATH", "TaskManagerAPI_TestPack.xlsx")
 
@@ -15,7 +15,8 @@ def find_col(df, candidates):
                 return c
     return None
 
-df = pd.read_excel(EXCEL_PATH, sheet_name="06_Automation")
+# 06_Automation from the compiled plan cache (re-read only when the workbook changed)
+df = load_plan(EXCEL_PATH)["sheets"]["06_Automation"]
 
 col_method   = find_col(df, ["メソッド", "method"])
 col_status   = find_col(df, ["期待ステータス", "expected", "status"])
@@ -12,6 +12,7 @@ generate_automation_from_02_reqfixed.py
 """
 import os, re, json, sys
 import pandas as pd
+from testpack_plan import load_plan
 
 EXCEL_PATH = os.getenv("EXCEL_PATH", "TaskManagerAPI_TestPack.xlsx")
 
@@ -45,15 +46,12 @@ def strip_completed_from_post(body_str: str) -> str:
     except Exception:
         return body_str
 
-def main():
-    if not os.path.exists(EXCEL_PATH):
-        print(f"[ERROR] Excel not found: {EXCEL_PATH}"); sys.exit(1)
-
-    xls = pd.ExcelFile(EXCEL_PATH)
-    if "02_TestCases" not in xls.sheet_names:
-        print("[ERROR] 02_TestCases シートが見つかりません。"); sys.exit(1)
-    df02 = pd.read_excel(xls, sheet_name="02_TestCases")
+AUTOMATION_COLS = [
+    "テストケースID","メソッド","URL","ボディ(JSON)","期待ステータス","save_as（任意）","expect_contains（任意）"
+]
 
+def build_rows(df02):
+    # 02_TestCases -> 06_Automation rows (cached in the compiled plan, see testpack_plan.py)
     rows = []
     first_post_saved = False
 
@@ -101,10 +99,17 @@ def main():
             expect_status = "422"
 
         rows.append([tcid, method, url, body, expect_status, save_as, expect_contains])
+    return rows
+
+def main():
+    if not os.path.exists(EXCEL_PATH):
+        print(f"[ERROR] Excel not found: {EXCEL_PATH}"); sys.exit(1)
+
+    plan = load_plan(EXCEL_PATH)
+    if plan["generated"] is None:
+        print("[ERROR] 02_TestCases シートが見つかりません。"); sys.exit(1)
 
-    df_auto = pd.DataFrame(rows, columns=[
-        "テストケースID","メソッド","URL","ボディ(JSON)","期待ステータス","save_as（任意）","expect_contains（任意）"
-    ])
+    df_auto = pd.DataFrame(plan["generated"], columns=AUTOMATION_COLS)
 
     with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
         df_auto.to_excel(w, index=False, sheet_name="06_Automation")
@@ -1,26 +1,39 @@
 #!/usr/bin/env python3
-import os, json, datetime, sys, re, math
+import os, json, datetime, sys, math, time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from testpack_plan import load_plan, refresh_plan, render
 
-BASE_URL = os.getenv("BASE_URL", "http://127.0.0.1:8000")
+# INPROCESS=1: call the app object from task.manager2/app/main.py directly (ASGI, no sockets, no uvicorn).
+# Every run starts from a fresh in-memory store, so results do not depend on earlier runs.
+INPROCESS = os.getenv("INPROCESS", "0") == "1"
+APP_DIR = os.getenv("APP_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "task.manager2")
+BASE_URL = "http://testserver" if INPROCESS else os.getenv("BASE_URL", "http://127.0.0.1:8000")
 EXCEL_PATH = os.getenv("EXCEL_PATH", "TaskManagerAPI_TestPack.xlsx")
 RESULTS_DIR = os.getenv("RESULTS_DIR", "./results")
 EXECUTOR = os.getenv("EXECUTOR", "Jun")
 RUN_ID = os.getenv("RUN_ID") or datetime.datetime.now().strftime("run-%Y%m%d-%H%M%S")
+# Number of cases run at the same time. 0/1 = one by one in sheet order.
+# With N > 1, cases linked through {{var}} / save_as keep their order; the rest run concurrently.
+# Cases that look at tasks they did not create (literal ids such as /tasks/999999, list GETs)
+# would see whatever the concurrent cases have written so far, so they run afterwards, one by
+# one in sheet order, against the store the parallel part left behind.
+PARALLEL = int(os.getenv("PARALLEL", "0"))
+TIMEOUT = float(os.getenv("TIMEOUT", "15"))
+# Append-only execution log (one JSON line per executed case, all runs).
+# 03_ExecutionLog is exported from it on demand: python run_all_cases_v2.py --export-log
+EXEC_LOG = os.getenv("EXEC_LOG") or os.path.join(RESULTS_DIR, "execution_log.jsonl")
+
+EXEC_COLS = ["RUN_ID","実行日","実行者","テストケースID","実際の結果","ステータス（Pass/Fail）","証跡（スクショ/ログのパス）","備考"]
+# JSONL record key for each 03_ExecutionLog column
+EXEC_KEYS = ["run_id","executed_at","executor","tcid","body","verdict","evidence","note"]
 
 def ensure_dir(p):
     if not os.path.isdir(p):
         os.makedirs(p, exist_ok=True)
 
-def templ(s, vars):
-    if not isinstance(s, str):
-        return s
-    out = s
-    for k, v in vars.items():
-        out = out.replace("{{"+k+"}}", str(v))
-    return out
-
 def is_nan(x):
     try:
         return isinstance(x, float) and math.isnan(x)
@@ -47,16 +60,48 @@ def body_to_bytes(body):
     except Exception:
         return None
 
-def do_request(method, url, body):
+class InProcessSession:
+    # The part of requests.Session used here, served by the ASGI app in this process
+    def __init__(self):
+        # Settings are read when the app is imported: force a fresh, unjournaled in-memory store
+        os.environ["TASK_STORAGE"] = "memory"
+        os.environ["TASK_JOURNAL_DIR"] = ""
+        if APP_DIR not in sys.path:
+            sys.path.insert(0, APP_DIR)
+        from app.main import app
+        from starlette.testclient import TestClient
+        # Server errors come back as 500 responses, as they would from uvicorn
+        self.client = TestClient(app, base_url=BASE_URL, raise_server_exceptions=False)
+        self.client.__enter__()
+
+    def request(self, method, url, headers=None, data=None, timeout=None):
+        return self.client.request(method, url, headers=headers, content=data)
+
+    def close(self):
+        self.client.__exit__(None, None, None)
+
+def make_session(pool_size):
+    if INPROCESS:
+        return InProcessSession()
+    # One keep-alive connection pool for the whole run instead of a new TCP connection per case
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def do_request(session, method, url, body):
     headers = {}
     data = body_to_bytes(body)
     if data is not None:
         headers["Content-Type"] = "application/json"
     try:
-        resp = requests.request(method=method, url=url, headers=headers, data=data, timeout=15)
+        resp = session.request(method=method, url=url, headers=headers, data=data, timeout=TIMEOUT)
         status = str(resp.status_code)
         text = resp.text
-    except requests.exceptions.RequestException as e:
+    except Exception as e:
+        # requests errors (connection refused, timeout) and, with INPROCESS=1, anything the
+        # in-process client raises: the case is recorded as ERR/Fail and the run goes on
         status = "ERR"
         text = str(e)
     return status, text
@@ -78,88 +123,183 @@ def upsert_report(df_report, key, value):
     else:
         df_report.loc[len(df_report)] = [key, value]
 
+def case_vars(case):
+    # Variables the case reads ({{var}} in URL/body) or writes (save_as)
+    names = set(case["url_parts"][1::2])
+    if case["body_parts"]:
+        names.update(case["body_parts"][1::2])
+    if case["save_as"] and case["save_as"].lower() != "nan":
+        names.add(case["save_as"])
+    return names
+
+def is_shared(case):
+    # No {{var}} and not a create: a literal id or a store-wide read (GET /tasks/),
+    # whose result depends on what every other case has written
+    return not case_vars(case) and case["method"].upper() != "POST"
+
+def build_chains(cases):
+    # Dependency graph over the variables: cases sharing a variable end up in the same chain
+    # (run one by one in sheet order, e.g. POST save_as=task_id -> PUT -> DELETE -> GET 404).
+    # Creates without variables are chains of their own and can run at any time.
+    # Returns (chains, shared): shared cases (is_shared) are left out of the chains and run
+    # one by one after them.
+    shared = [i for i, case in enumerate(cases) if is_shared(case)]
+    parent = list(range(len(cases)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    owner = {}
+    for i, case in enumerate(cases):
+        for name in case_vars(case):
+            if name in owner:
+                parent[find(i)] = find(owner[name])
+            owner[name] = i
+    chains = {}
+    skip = set(shared)
+    for i in range(len(cases)):
+        if i not in skip:
+            chains.setdefault(find(i), []).append(i)
+    # Longest chains first so they are not left waiting at the end
+    return sorted(chains.values(), key=lambda chain: (-len(chain), chain[0])), shared
+
+def run_case(session, case, vars_store):
+    idx, tcid = case["idx"], case["tcid"]
+    url = BASE_URL + render(case["url_parts"], vars_store)
+    body_str = render(case["body_parts"], vars_store) if case["body_parts"] is not None else case["body_raw"]
+
+    started = time.perf_counter()
+    status, text = do_request(session, case["method"], url, body_str)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    save_as = case["save_as"]
+    if save_as:
+        val = extract_save_var(text, keys=("id","task_id"))
+        if val is not None:
+            vars_store[save_as] = val
+
+    ok_set, expect_contains = case["ok_set"], case["expect_contains"]
+    pass_status = (status in ok_set) if ok_set else (status == "200")
+    pass_contains = True
+    if expect_contains:
+        pass_contains = (expect_contains in text)
+    verdict = "Pass" if (pass_status and pass_contains) else "Fail"
+
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "run_id": RUN_ID, "executed_at": now, "executor": EXECUTOR, "tcid": tcid, "row": idx + 1,
+        "method": case["method"], "url": url, "status": status, "elapsed_ms": elapsed_ms,
+        "body": text, "verdict": verdict, "evidence": f"{run_artifact_path()}#{idx+1}", "note": "",
+    }
+
+def run_artifact_path():
+    return os.path.join(RESULTS_DIR, f"{RUN_ID}.jsonl")
+
+def write_jsonl(path, records, mode):
+    # One write for the whole run instead of two small files per case
+    with open(path, mode, encoding="utf-8") as f:
+        f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+def read_jsonl(path):
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+def sheet_exec_records(sheets):
+    # 03_ExecutionLog rows as log records (missing columns and empty cells become "")
+    if "03_ExecutionLog" not in sheets:
+        return []
+    df_exec = sheets["03_ExecutionLog"].reindex(columns=EXEC_COLS, fill_value="")
+    df_exec = df_exec.astype(object).where(df_exec.notna(), "")
+    return [{k: str(v) for k, v in zip(EXEC_KEYS, row)} for row in df_exec.itertuples(index=False)]
+
+def seed_exec_log(sheets):
+    # First run with the log store: carry over the history already in 03_ExecutionLog
+    if os.path.exists(EXEC_LOG) or "03_ExecutionLog" not in sheets:
+        return
+    write_jsonl(EXEC_LOG, sheet_exec_records(sheets), "w")
+
+def merge_sheet_rows(sheets):
+    # Rows that reached 03_ExecutionLog without going through the log store (update_excel.py
+    # appends to the sheet directly, hand edits) are appended to the log before an export,
+    # so rewriting the sheet from the log never drops them
+    logged = {tuple(str(r.get(k, "")) for k in EXEC_KEYS) for r in read_jsonl(EXEC_LOG)}
+    missing = [r for r in sheet_exec_records(sheets) if tuple(r[k] for k in EXEC_KEYS) not in logged]
+    if missing:
+        write_jsonl(EXEC_LOG, missing, "a")
+    return len(missing)
+
+def export_exec_log():
+    # Rewrite 03_ExecutionLog from the log store (the only step whose cost grows with the history)
+    if not os.path.exists(EXEC_LOG):
+        print(f"[ERROR] Execution log not found: {EXEC_LOG}", file=sys.stderr); sys.exit(1)
+    plan = load_plan(EXCEL_PATH)
+    merged = merge_sheet_rows(plan["sheets"])
+    if merged:
+        print(f"[INFO] {merged} rows found only in 03_ExecutionLog were added to {EXEC_LOG}")
+    df_exec = pd.DataFrame([[r.get(k, "") for k in EXEC_KEYS] for r in read_jsonl(EXEC_LOG)], columns=EXEC_COLS)
+    # A re-run RUN_ID keeps its last result per case; rows without a RUN_ID (update_excel.py) are all kept
+    rerun = df_exec.duplicated(subset=["RUN_ID","テストケースID"], keep="last") & (df_exec["RUN_ID"] != "")
+    df_exec = df_exec[~rerun]
+    with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+        df_exec.to_excel(writer, index=False, sheet_name="03_ExecutionLog")
+    refresh_plan(EXCEL_PATH, plan, {"03_ExecutionLog": df_exec})
+    print(f"[OK] 03_ExecutionLog exported: {len(df_exec)} rows -> {EXCEL_PATH}")
+
+def run_chain(session, cases):
+    # Chains never share a variable, so each one gets its own variable store
+    vars_store = {}
+    return [run_case(session, case, vars_store) for case in cases]
+
 def main():
     ensure_dir(RESULTS_DIR)
     if not os.path.exists(EXCEL_PATH):
         print(f"[ERROR] Excel not found: {EXCEL_PATH}", file=sys.stderr); sys.exit(1)
 
-    xls = pd.ExcelFile(EXCEL_PATH)
-    if "06_Automation" not in xls.sheet_names:
+    plan = load_plan(EXCEL_PATH)
+    sheets = plan["sheets"]
+    if plan["cases"] is None:
         print("[ERROR] 06_Automation シートがありません。先に generate_automation_from_02.py を実行してください。", file=sys.stderr)
         sys.exit(1)
-    df_auto = pd.read_excel(xls, sheet_name="06_Automation")
-
-    exec_cols = ["RUN_ID","実行日","実行者","テストケースID","実際の結果","ステータス（Pass/Fail）","証跡（スクショ/ログのパス）","備考"]
-    if "03_ExecutionLog" in xls.sheet_names:
-        df_exec = pd.read_excel(xls, sheet_name="03_ExecutionLog")
-        if "RUN_ID" not in df_exec.columns:
-            df_exec["RUN_ID"] = ""
-            df_exec = df_exec.reindex(columns=exec_cols, fill_value="")
-    else:
-        df_exec = pd.DataFrame(columns=exec_cols)
 
-    if "02_TestCases" in xls.sheet_names:
-        df_tc = pd.read_excel(xls, sheet_name="02_TestCases")
-        total_cases = len(df_tc)
+    seed_exec_log(sheets)
+
+    if "02_TestCases" in sheets:
+        total_cases = len(sheets["02_TestCases"])
     else:
         total_cases = None
 
-    vars_store = {}
+    cases = plan["cases"]
+    session = make_session(PARALLEL)
 
-    run_rows = []
-    for idx, row in df_auto.iterrows():
-        tcid = str(row.get("テストケースID","")).strip()
-        method = str(row.get("メソッド","GET")).strip().upper()
-        url_path = row.get("URL","/")
-        body_raw = row.get("ボディ(JSON)","")
-        expect_status = str(row.get("期待ステータス","200")).strip()
-        save_as = str(row.get("save_as（任意）","")).strip()
-        expect_contains = str(row.get("expect_contains（任意）","")).strip()
-
-        if is_nan(url_path):
-            url_path = "/"
-        if is_nan(body_raw):
-            body_raw = ""
-
-        url = BASE_URL + templ(str(url_path), vars_store)
-        body_str = templ(body_raw, vars_store) if isinstance(body_raw, str) else body_raw
-
-        status, text = do_request(method, url, body_str)
-
-        base = re.sub(r'[^A-Za-z0-9_\-]+','_', f"{idx+1:02d}_{tcid}")
-        with open(os.path.join(RESULTS_DIR, f"{base}.status"), "w", encoding="utf-8") as f:
-            f.write(status)
-        with open(os.path.join(RESULTS_DIR, f"{base}.json"), "w", encoding="utf-8") as f:
-            f.write(text)
-
-        if save_as:
-            val = extract_save_var(text, keys=("id","task_id"))
-            if val is not None:
-                vars_store[save_as] = val
-
-        ok_set = set([s.strip() for s in str(expect_status).split("|") if s.strip()])
-        pass_status = (status in ok_set) if ok_set else (status == "200")
-        pass_contains = True
-        if expect_contains:
-            pass_contains = (expect_contains in text)
-        verdict = "Pass" if (pass_status and pass_contains) else "Fail"
-
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        run_rows.append([RUN_ID, now, EXECUTOR, tcid, text, verdict, os.path.join(RESULTS_DIR, f"{base}.json"), ""])
-
-    df_new = pd.DataFrame(run_rows, columns=exec_cols)
-    df_exec_out = pd.concat([df_exec, df_new], ignore_index=True)
-    df_exec_out = df_exec_out.drop_duplicates(subset=["RUN_ID","テストケースID"], keep="last")
-
-    if "05_Report" in xls.sheet_names:
-        df_report = pd.read_excel(xls, sheet_name="05_Report")
+    if PARALLEL > 1:
+        chains, shared = build_chains(cases)
+        with ThreadPoolExecutor(max_workers=PARALLEL) as pool:
+            done = list(pool.map(lambda chain: run_chain(session, [cases[i] for i in chain]), chains))
+        by_index = {i: row for chain, rows in zip(chains, done) for i, row in zip(chain, rows)}
+        by_index.update(zip(shared, run_chain(session, [cases[i] for i in shared])))
+        run_rows = [by_index[i] for i in range(len(cases))]
+    else:
+        run_rows = run_chain(session, cases)
+    session.close()
+
+    write_jsonl(run_artifact_path(), run_rows, "w")
+    write_jsonl(EXEC_LOG, run_rows, "a")
+
+    if "05_Report" in sheets:
+        df_report = sheets["05_Report"]
     else:
         df_report = pd.DataFrame(columns=["項目","値"])
 
-    df_this = df_exec_out[df_exec_out["RUN_ID"] == RUN_ID]
-    executed = len(df_this)
-    passed = int((df_this["ステータス（Pass/Fail）"] == "Pass").sum())
-    failed = int((df_this["ステータス（Pass/Fail）"] == "Fail").sum())
+    # Same counting as before: one verdict per test case ID (the last one in sheet order)
+    verdicts = {r["tcid"]: r["verdict"] for r in run_rows}
+    executed = len(verdicts)
+    passed = sum(1 for v in verdicts.values() if v == "Pass")
+    failed = sum(1 for v in verdicts.values() if v == "Fail")
 
     def upsert(key, val):
         mask = df_report["項目"] == key
@@ -175,14 +315,18 @@ def main():
     upsert("Fail数（今回RUN）", failed)
     upsert("Pass率（今回RUN）", f"{(passed/executed*100):.1f}%" if executed else "")
 
+    # Only the small report sheet is rewritten; 06_Automation is not modified by a run
     with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df_exec_out.to_excel(writer, index=False, sheet_name="03_ExecutionLog")
         df_report.to_excel(writer, index=False, sheet_name="05_Report")
-        df_auto.to_excel(writer, index=False, sheet_name="06_Automation")
+    refresh_plan(EXCEL_PATH, plan, {"05_Report": df_report})
 
     print(f"[OK] Run complete. RUN_ID={RUN_ID}, executed={executed}, pass={passed}, fail={failed}")
-    print(f"[INFO] Results saved under: {RESULTS_DIR}")
-    print(f"[INFO] Excel updated: {EXCEL_PATH}")
+    print(f"[INFO] Run results: {run_artifact_path()}")
+    print(f"[INFO] Execution log: {EXEC_LOG} (export to Excel: python run_all_cases_v2.py --export-log)")
+    print(f"[INFO] Excel report updated: {EXCEL_PATH}")
 
 if __name__ == "__main__":
-    main()
+    if "--export-log" in sys.argv[1:]:
+        export_exec_log()
+    else:
+        main()
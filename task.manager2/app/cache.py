@@ -0,0 +1,198 @@
+# app/cache.py
+
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .config import settings
+from .lru import ByteLRU
+from .storage import add_repository_hook, add_write_listener, get_repository
+from .storage_async import get_async_repository
+
+# シリアライズ済み JSON レスポンスのキャッシュ（LRU、合計バイト数で上限）
+# キーは ("task", id) と ("page", 一覧のクエリ条件...)。書き込みがあると
+#   - 対象タスクのキー
+#   - すべての一覧ページ
+# を無効化する。
+# Cache of pre-serialised JSON responses (LRU, bounded by total bytes).
+# Keys are ("task", id) and ("page", *list query parameters). A write invalidates
+# the written tasks' keys and every list page.
+
+CacheValue = Tuple[bytes, Dict[str, str]]
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes: int) -> None:
+
+        self.max_bytes = max_bytes
+
+        self.enabled = max_bytes > 0
+
+        self._entries = ByteLRU(max_bytes, lambda key, value: len(value[0]))
+
+        self._pages: set = set()
+
+        self._lock = threading.Lock()
+
+        # 書き込みのたびに進む世代番号。読み取り開始時の世代と違えば put しない
+        # （読み取り中に書き込みが入った古い値を入れないため）
+        # Bumped on every invalidation. put() is ignored when the generation moved
+        # since the read started, so a value read before a write is never cached.
+
+        self.generation = 0
+
+        self.hits = 0
+
+        self.misses = 0
+
+        self.evictions = 0
+
+        # 他のプロセスの書き込みは on_write に届かない。共有ストレージでは validator で
+        # ストア全体のバージョンを読み、前回と違えば全体を捨てる。
+        # async_validator は同じものの async 版（get_async 用。読み取りをイベントループの外で行う）
+        # Writes made by other processes never reach on_write. With shared storage,
+        # `validator` returns the store-wide version and the cache is dropped when it moved.
+        # `async_validator` is the same for get_async, reading off the event loop
+
+        self.validator: Optional[Callable[[], Any]] = None
+
+        self.async_validator: Optional[Callable[[], Awaitable[Any]]] = None
+
+        self._validated: Any = None
+
+    def get(self, key: Hashable) -> Optional[CacheValue]:
+
+        if not self.enabled:
+
+            return None
+
+        if self.validator is not None:
+
+            self._validate(self.validator())
+
+        return self._lookup(key)
+
+    async def get_async(self, key: Hashable) -> Optional[CacheValue]:
+
+        # async ルーター用の get。validator の読み取り（SQLite）でイベントループを止めない
+        # get for the async router: checking the validator (a SQLite read) never blocks the event loop
+
+        if not self.enabled:
+
+            return None
+
+        if self.async_validator is not None:
+
+            self._validate(await self.async_validator())
+
+        return self._lookup(key)
+
+    def _validate(self, token: Any) -> None:
+
+        if token != self._validated:
+
+            self.clear()
+
+            self._validated = token
+
+    def _lookup(self, key: Hashable) -> Optional[CacheValue]:
+
+        with self._lock:
+
+            value = self._entries.get(key)
+
+            if value is None:
+
+                self.misses += 1
+
+                return None
+
+            self.hits += 1
+
+            return value
+
+    def put(self, key: Hashable, body: bytes, headers: Dict[str, str], generation: int) -> None:
+
+        with self._lock:
+
+            if generation != self.generation or key in self._entries:
+
+                return
+
+            evicted = self._entries.put(key, (body, headers))
+
+            if evicted is None:
+
+                return
+
+            if key[0] == "page":
+
+                self._pages.add(key)
+
+            self._pages.difference_update(evicted)
+
+            self.evictions += len(evicted)
+
+    def on_write(self, operation: str, task_ids: List[int]) -> None:
+
+        # ストレージの書き込み通知を受けて無効化する
+        # Storage write listener: invalidate the affected entries
+
+        with self._lock:
+
+            self.generation += 1
+
+            # 作成でもタスクのキーを捨てる（新しいストアは id を再利用するので、同じ id の古い応答が残りうる）
+            # task keys are dropped on create too: a fresh store reuses ids, so an old response for the same id may remain
+
+            for task_id in task_ids:
+
+                self._entries.pop(("task", task_id))
+
+            for key in self._pages:
+
+                self._entries.pop(key)
+
+            self._pages.clear()
+
+    def clear(self) -> None:
+
+        with self._lock:
+
+            self.generation += 1
+
+            self._entries.clear()
+
+            self._pages.clear()
+
+    def stats(self) -> Dict[str, Any]:
+
+        with self._lock:
+
+            return {
+                "entries": len(self._entries),
+                "bytes": self._entries.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+response_cache = ResponseCache(int(settings.response_cache_mb * 1024 * 1024))
+
+add_write_listener(response_cache.on_write)
+
+# 新しいリポジトリ（再起動後のストアなど）には前のストアの応答を返さない
+# a new repository (e.g. the store after a restart) must never see responses from the previous one
+
+add_repository_hook(lambda repo: response_cache.clear())
+
+if settings.storage_backend == "shared":
+
+    response_cache.validator = lambda: get_repository().collection_version()
+
+    # async ルーターはリポジトリのスレッドプールで読む
+    # the async router reads it on the repository's executor
+
+    response_cache.async_validator = lambda: get_async_repository().collection_version()
@@ -0,0 +1,318 @@
+# app/compression.py
+
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from .metrics import timed_phase
+
+# レスポンスの圧縮（Accept-Encoding で zstd / gzip を選ぶ ASGI ミドルウェア）。
+#   - 本文が minimum_size バイト未満の応答、圧縮済み（Content-Encoding あり）の応答、
+#     圧縮に向かない Content-Type（SSE など）は圧縮しない
+#   - クライアントの q 値が高いものを選び、同じならサーバーの優先順（TASK_COMPRESSION の並び）
+#   - ストリーミング応答（/tasks/export）はチャンクごとに圧縮してフラッシュする（受け手はすぐ読める）
+#   - 大きな本文はスレッドプールで圧縮する（zlib / zstd は GIL を離すのでイベントループを止めない）
+#   - zstd は Python 3.14 の compression.zstd か zstandard パッケージがある時だけ使える
+#   - ETag は変えない（どの符号化でも同じ版のタスクを指す。If-Match / If-None-Match はそのまま使える）
+# Response compression: ASGI middleware choosing zstd or gzip from Accept-Encoding.
+#   - bodies under minimum_size bytes, responses that already have a Content-Encoding
+#     and content types that do not benefit (SSE etc.) are sent as they are
+#   - the client's highest q-value wins; ties go to the server's order (TASK_COMPRESSION)
+#   - streaming responses (/tasks/export) are compressed and flushed chunk by chunk, so
+#     the client can read each chunk as soon as it arrives
+#   - large bodies are compressed in the threadpool (zlib and zstd release the GIL, so
+#     the event loop keeps running)
+#   - zstd is only offered with Python 3.14's compression.zstd or the zstandard package
+#   - ETags are left unchanged: every encoding carries the same task versions, so
+#     If-Match / If-None-Match keep working
+
+# この大きさ以上の本文はスレッドプールで圧縮する
+# bodies at least this large are compressed in the threadpool
+
+OFFLOAD_SIZE = 256 * 1024
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+_UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+class _GzipEncoder:
+
+    def __init__(self, level: int) -> None:
+
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+
+        return self._z.compress(data) + self._z.flush()
+
+
+_zstd_encoder: Optional[Callable[[int], Any]] = None
+
+try:
+
+    from compression import zstd
+
+    class _ZstdEncoder:
+
+        def __init__(self, level: int) -> None:
+
+            self._z = zstd.ZstdCompressor(level)
+
+        def chunk(self, data: bytes) -> bytes:
+
+            return self._z.compress(data, zstd.ZstdCompressor.FLUSH_BLOCK)
+
+        def finish(self, data: bytes) -> bytes:
+
+            return self._z.compress(data, zstd.ZstdCompressor.FLUSH_FRAME)
+
+    _zstd_encoder = _ZstdEncoder
+
+except ImportError:
+
+    try:
+
+        import zstandard
+
+        class _ZstandardEncoder:
+
+            def __init__(self, level: int) -> None:
+
+                self._z = zstandard.ZstdCompressor(level=level).compressobj()
+
+            def chunk(self, data: bytes) -> bytes:
+
+                return self._z.compress(data) + self._z.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+            def finish(self, data: bytes) -> bytes:
+
+                return self._z.compress(data) + self._z.flush()
+
+        _zstd_encoder = _ZstandardEncoder
+
+    except ImportError:
+
+        pass
+
+
+def available_encodings() -> List[str]:
+
+    # この環境で使える符号化（サーバーの優先順）
+    # encodings usable here, in the server's order of preference
+
+    return ["zstd", "gzip"] if _zstd_encoder is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: str, offered: List[str]) -> Optional[str]:
+
+    # Accept-Encoding（例: "gzip;q=0.8, zstd"）から offered の中で最も q 値の高いものを選ぶ。無ければ None
+    # Pick the offered encoding with the highest q-value in Accept-Encoding
+    # (e.g. "gzip;q=0.8, zstd"), or None when none is acceptable
+
+    weights: Dict[str, float] = {}
+
+    for item in accept_encoding.split(","):
+
+        name, _, params = item.partition(";")
+
+        name = name.strip().lower()
+
+        q = 1.0
+
+        for param in params.split(";"):
+
+            key, _, value = param.partition("=")
+
+            if key.strip().lower() == "q":
+
+                try:
+
+                    q = float(value)
+
+                except ValueError:
+
+                    q = 0.0
+
+        if name:
+
+            weights[name] = q
+
+    best: Optional[Tuple[float, str]] = None
+
+    for encoding in offered:
+
+        q = weights.get(encoding, weights.get("*", 0.0))
+
+        if q > 0 and (best is None or q > best[0]):
+
+            best = (q, encoding)
+
+    return best[1] if best is not None else None
+
+
+@timed_phase("compression")
+
+def _chunk(encoder: Any, data: bytes) -> bytes:
+
+    return encoder.chunk(data)
+
+@timed_phase("compression")
+
+def _finish(encoder: Any, data: bytes) -> bytes:
+
+    return encoder.finish(data)
+
+
+async def _run(fn: Callable[[Any, bytes], bytes], encoder: Any, data: bytes) -> bytes:
+
+    if len(data) >= OFFLOAD_SIZE:
+
+        return await run_in_threadpool(fn, encoder, data)
+
+    return fn(encoder, data)
+
+
+class CompressionMiddleware:
+
+    def __init__(
+        self,
+        app: Any,
+        encodings: Optional[List[str]] = None,
+        minimum_size: int = 1024,
+        gzip_level: int = 1,
+        zstd_level: int = 3,
+    ) -> None:
+
+        self.app = app
+
+        # 使えない符号化（zstd のライブラリが無いなど）は黙って外す
+        # encodings that are unavailable here (no zstd library etc.) are dropped silently
+
+        self.encodings = [e for e in (encodings or available_encodings()) if e in available_encodings()]
+
+        self.minimum_size = minimum_size
+
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+
+    def _encoder(self, encoding: str) -> Any:
+
+        if encoding == "zstd":
+
+            return _zstd_encoder(self.levels["zstd"])
+
+        return _GzipEncoder(self.levels["gzip"])
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+
+        if scope["type"] != "http":
+
+            await self.app(scope, receive, send)
+
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+
+        if encoding is None:
+
+            await self.app(scope, receive, send)
+
+            return
+
+        start: Optional[Dict[str, Any]] = None
+
+        encoder: Any = None
+
+        # None: 未定（開始メッセージを保留中）、True: 圧縮する、False: そのまま送る
+        # None: undecided (start message held back), True: compressing, False: passing through
+
+        compressing: Optional[bool] = None
+
+        async def send_compressed(message: Dict[str, Any]) -> None:
+
+            nonlocal start, encoder, compressing
+
+            if message["type"] == "http.response.start":
+
+                start = message
+
+                headers = Headers(raw=message["headers"])
+
+                media_type = headers.get("content-type", "")
+
+                if (
+                    "content-encoding" in headers
+                    or "no-transform" in headers.get("cache-control", "")
+                    or not media_type.startswith(_COMPRESSIBLE_TYPES)
+                    or media_type.startswith(_UNCOMPRESSIBLE_TYPES)
+                ):
+
+                    compressing = False
+
+                    await send(message)
+
+                return
+
+            if message["type"] != "http.response.body" or compressing is False:
+
+                await send(message)
+
+                return
+
+            body = message.get("body", b"")
+
+            more_body = message.get("more_body", False)
+
+            if compressing is None:
+
+                # 最初の本文で決める。1回で終わる小さな本文はそのまま送る
+                # decide on the first body message; a small body sent in one piece goes out as is
+
+                headers = MutableHeaders(raw=start["headers"])
+
+                headers.add_vary_header("Accept-Encoding")
+
+                if not more_body and len(body) < self.minimum_size:
+
+                    compressing = False
+
+                    await send(start)
+
+                    await send(message)
+
+                    return
+
+                compressing = True
+
+                encoder = self._encoder(encoding)
+
+                headers["Content-Encoding"] = encoding
+
+                if not more_body:
+
+                    body = await _run(_finish, encoder, body)
+
+                    headers["Content-Length"] = str(len(body))
+
+                    await send(start)
+
+                    await send({"type": "http.response.body", "body": body})
+
+                    return
+
+                del headers["Content-Length"]
+
+                await send(start)
+
+            body = await _run(_chunk if more_body else _finish, encoder, body)
+
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
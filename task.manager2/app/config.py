@@ -0,0 +1,93 @@
+# app/config.py
+
+import os
+from typing import List
+
+# 環境変数から読み込むアプリ設定
+# Application settings read from environment variables
+
+
+class Settings:
+
+    def __init__(self, environ=os.environ) -> None:
+
+        # タスクの保存先: "memory"（既定）、"sqlite"、または "shared"
+        # （SQLite ファイルを uvicorn --workers N の全ワーカーで共有する）
+        # Task storage backend: "memory" (default), "sqlite", or "shared"
+        # (one SQLite file shared by all workers of uvicorn --workers N)
+
+        self.storage_backend: str = environ.get("TASK_STORAGE", "memory").lower()
+
+        self.sqlite_path: str = environ.get("TASK_SQLITE_PATH", "tasks.db")
+
+        # 接続プールの大きさ。同期ハンドラを実行するスレッドプール（既定 40）に合わせる
+        # Connection pool size; matches the threadpool that runs sync handlers (40 by default)
+
+        self.sqlite_pool_size: int = int(environ.get("TASK_SQLITE_POOL_SIZE", "40"))
+
+        # "shared" モードで1回に先取りする id の数
+        # Number of ids a worker leases at a time in "shared" mode
+
+        self.id_block: int = int(environ.get("TASK_ID_BLOCK", "100"))
+
+        # メモリ実装の先行書き込みログの置き場所。空なら永続化しない
+        # Directory for the in-memory store's write-ahead log; empty disables persistence
+
+        self.journal_dir: str = environ.get("TASK_JOURNAL_DIR", "")
+
+        # 前回のスナップショットからこの件数を書き込んだら次のスナップショットを取る
+        # Take a new snapshot after this many writes since the last one
+
+        self.journal_snapshot_every: int = int(environ.get("TASK_JOURNAL_SNAPSHOT_EVERY", "100000"))
+
+        # "commit"（既定、fsync されるまで応答しない）または "background"（fsync を待たずに応答する）
+        # "commit" (default, respond once fsynced) or "background" (respond without waiting for fsync)
+
+        self.journal_fsync: str = environ.get("TASK_JOURNAL_FSYNC", "commit").lower()
+
+        # レスポンスキャッシュの上限（MB）。0 で無効
+        # Response cache budget in MB; 0 disables the cache
+
+        self.response_cache_mb: float = float(environ.get("TASK_RESPONSE_CACHE_MB", "64"))
+
+        # Idempotency-Key 付き作成リクエストの応答を保存する上限（MB）と保存期間（秒）。0 MB で無効
+        # Budget in MB and lifetime in seconds for responses stored for Idempotency-Key; 0 MB disables it
+
+        self.idempotency_cache_mb: float = float(environ.get("TASK_IDEMPOTENCY_CACHE_MB", "16"))
+
+        self.idempotency_ttl: float = float(environ.get("TASK_IDEMPOTENCY_TTL", "86400"))
+
+        # /metrics 用の計測（レイテンシ・ストレージ・シリアライズ）。"0" で無効
+        # Instrumentation for /metrics (latency, storage, serialization); "0" disables it
+
+        self.metrics_enabled: bool = environ.get("TASK_METRICS", "1") != "0"
+
+        # 変更フィード（/tasks/changes）に保持する変更の件数
+        # Number of changes kept for the change feed (/tasks/changes)
+
+        self.change_feed_size: int = int(environ.get("TASK_CHANGE_FEED_SIZE", "10000"))
+
+        # /tasks のハンドラー: "sync"（既定、スレッドプールで実行）または "async"（イベントループで実行）
+        # /tasks handlers: "sync" (default, run in the threadpool) or "async" (run on the event loop)
+
+        self.task_routes: str = environ.get("TASK_ROUTES", "sync").lower()
+
+        # 応答の圧縮に使う符号化（優先順、カンマ区切り）。空で圧縮しない。zstd はライブラリがある時だけ使う
+        # Encodings for response compression, in order of preference (comma separated);
+        # empty disables compression. zstd is only used when a zstd library is available
+
+        self.compression_encodings: List[str] = [
+            e.strip().lower() for e in environ.get("TASK_COMPRESSION", "zstd,gzip").split(",") if e.strip()
+        ]
+
+        # この大きさ（バイト）未満の本文は圧縮しない
+        # Bodies smaller than this many bytes are sent uncompressed
+
+        self.compression_min_size: int = int(environ.get("TASK_COMPRESSION_MIN_SIZE", "1024"))
+
+        self.gzip_level: int = int(environ.get("TASK_GZIP_LEVEL", "1"))
+
+        self.zstd_level: int = int(environ.get("TASK_ZSTD_LEVEL", "3"))
+
+
+settings = Settings()
@@ -0,0 +1,202 @@
+# app/feed.py
+
+import asyncio
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+from .storage import add_repository_hook, add_write_listener
+
+# タスクの変更フィード。書き込み通知ごとに (連番, 操作名, id) をリングバッファ（固定長）に追加する。
+# クライアントは最後に受け取った連番（since）以降だけを読めばよいので、一覧全体を取り直す必要がない。
+#   - 連番はプロセス内で 1 から増える。epoch は起動ごとに変わり、再起動をまたいだ since を検出する
+#   - バッファから押し出された範囲・別の epoch の since を読むと ChangesGone になり、呼び出し側は全件取り直しを促す
+#   - SSE の購読者はイベントループごとの asyncio.Event を共有し、書き込み 1 回につき起こすのは 1 回だけ
+#   - 他のプロセス（"shared" モードの別ワーカー）の書き込みは届かない
+# Change feed of task writes. Every write notification appends (seq, operation, id)
+# to a fixed-size ring buffer, so clients only read what happened after the last
+# sequence number they saw (`since`) instead of re-reading the whole list.
+#   - seq starts at 1 per process; `epoch` changes on every start so a `since` from
+#     before a restart is detected
+#   - reading a `since` older than the buffer or from another epoch raises ChangesGone,
+#     and callers tell the client to resync
+#   - SSE subscribers share one asyncio.Event per event loop, so a write wakes a
+#     loop once however many subscribers it has
+#   - writes made by other processes (other workers in "shared" mode) are not seen
+
+Change = Tuple[int, str, int]
+
+
+class ChangesGone(Exception):
+
+    # since より後の変更がもう読めない（古すぎる・別の epoch）。epoch / last_seq は判定した時点の値
+    # The changes after `since` can no longer be read (too old, or another epoch);
+    # epoch and last_seq are the feed's values when that was decided
+
+    def __init__(self, epoch: str, last_seq: int) -> None:
+
+        super().__init__(epoch, last_seq)
+
+        self.epoch = epoch
+
+        self.last_seq = last_seq
+
+
+class ChangeFeed:
+
+    def __init__(self, capacity: int) -> None:
+
+        self.capacity = max(capacity, 1)
+
+        self.epoch = uuid.uuid4().hex
+
+        self._ring: List[Optional[Change]] = [None] * self.capacity
+
+        # 次に振る連番
+        # sequence number of the next change
+
+        self._next = 1
+
+        self._lock = threading.Lock()
+
+        self._events: Dict[asyncio.AbstractEventLoop, asyncio.Event] = {}
+
+    @property
+    def last_seq(self) -> int:
+
+        return self._next - 1
+
+    @property
+    def oldest_seq(self) -> int:
+
+        # バッファに残っている最も古い連番
+        # oldest sequence number still in the buffer
+
+        return max(1, self._next - self.capacity)
+
+    def on_write(self, operation: str, task_ids: List[int]) -> None:
+
+        # ストレージの書き込み通知を受けて追加し、待っている購読者を起こす
+        # Storage write listener: append the changes and wake waiting subscribers
+
+        with self._lock:
+
+            for task_id in task_ids:
+
+                self._ring[self._next % self.capacity] = (self._next, operation, task_id)
+
+                self._next += 1
+
+            loops = list(self._events)
+
+        self._wake_loops(loops)
+
+    def reset(self) -> None:
+
+        # 新しいリポジトリ用に空にする。epoch が変わるので、購読者は resync（410）を受け取る
+        # Empty the feed for a new repository; the epoch changes, so subscribers get a resync (410)
+
+        with self._lock:
+
+            self.epoch = uuid.uuid4().hex
+
+            self._ring = [None] * self.capacity
+
+            self._next = 1
+
+            loops = list(self._events)
+
+        self._wake_loops(loops)
+
+    def _wake_loops(self, loops: List[asyncio.AbstractEventLoop]) -> None:
+
+        for loop in loops:
+
+            try:
+
+                loop.call_soon_threadsafe(self._wake, loop)
+
+            except RuntimeError:
+
+                # 終了したイベントループ
+                # the loop has been closed
+
+                with self._lock:
+
+                    self._events.pop(loop, None)
+
+    def _wake(self, loop: asyncio.AbstractEventLoop) -> None:
+
+        # イベントループ上で実行。今の Event を立て、次の待機用に新しい Event と差し替える
+        # Runs on the loop: set the current event and replace it for the next wait
+
+        with self._lock:
+
+            event = self._events.pop(loop, None)
+
+        if event is not None:
+
+            event.set()
+
+    def available(self, since: int) -> bool:
+
+        # since より後の変更がすべてバッファに残っているか
+        # whether every change after `since` is still in the buffer
+
+        return self.oldest_seq - 1 <= since <= self.last_seq
+
+    def read(self, since: int, limit: int, epoch: Optional[str] = None) -> List[Change]:
+
+        # since より後の変更を古い順に最大 limit 件。読めるかどうかの確認も同じロックの中で行い、
+        # 読めなければ（epoch を指定した時はそれが今と違っても）ChangesGone
+        # Up to `limit` changes after `since`, oldest first. Availability is checked under
+        # the same lock; ChangesGone when they cannot be read (or `epoch`, if given, is not current)
+
+        with self._lock:
+
+            if (epoch is not None and epoch != self.epoch) or not self.available(since):
+
+                raise ChangesGone(self.epoch, self.last_seq)
+
+            start = max(since + 1, self.oldest_seq)
+
+            end = min(self._next, start + limit)
+
+            return [self._ring[seq % self.capacity] for seq in range(start, end)]
+
+    async def wait(self, since: int, timeout: float) -> bool:
+
+        # since より後の変更が出るまで最大 timeout 秒待つ。出たら True
+        # Wait up to `timeout` seconds for a change after `since`; True once there is one
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+
+            if self.last_seq > since:
+
+                return True
+
+            event = self._events.get(loop)
+
+            if event is None:
+
+                event = self._events[loop] = asyncio.Event()
+
+        try:
+
+            await asyncio.wait_for(event.wait(), timeout)
+
+        except asyncio.TimeoutError:
+
+            pass
+
+        return self.last_seq > since
+
+
+change_feed = ChangeFeed(settings.change_feed_size)
+
+add_write_listener(change_feed.on_write)
+
+add_repository_hook(lambda repo: change_feed.reset())
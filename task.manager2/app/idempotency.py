@@ -0,0 +1,156 @@
+# app/idempotency.py
+
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from .config import settings
+from .lru import ByteLRU
+from .storage import add_repository_hook
+
+# Idempotency-Key ヘッダー付きの作成リクエストの応答を保存し、同じキーの再送には保存した応答を返す
+# （タイムアウト後の再送でタスクが二重に作られないように）。LRU、合計バイト数と有効期限（TTL）で上限。
+#   - キーは (エンドポイント, Idempotency-Key)。同じキーで本文が違えば 422、処理中の同じキーは 409
+#   - 保存するのは 2xx の応答だけ。エラーになった要求は同じキーでやり直せる
+#   - プロセスごとのキャッシュ（"shared" モードで別のワーカーに届いた再送は重複を防げない）
+# Stores the responses of create requests sent with an Idempotency-Key header, and
+# answers a retry with the same key from the stored response, so a retry after a
+# timeout never creates the task twice. LRU, bounded by total bytes and a TTL.
+#   - keys are (endpoint, Idempotency-Key); the same key with a different body gets
+#     422, and a key whose first request is still running gets 409
+#   - only 2xx responses are stored, so a failed request can be retried with its key
+#   - per process (in "shared" mode a retry that reaches another worker is not deduplicated)
+
+StoredResponse = Tuple[int, bytes, Dict[str, str]]
+
+
+class IdempotencyConflict(Exception):
+
+    # 同じキーの最初の要求がまだ処理中（409）
+    # the first request with this key is still being processed (409)
+
+    pass
+
+
+class IdempotencyMismatch(Exception):
+
+    # 同じキーが別の本文で使われた（422）
+    # the key was already used with a different request body (422)
+
+    pass
+
+
+def fingerprint(payload: bytes) -> str:
+
+    return hashlib.sha256(payload).hexdigest()
+
+
+class IdempotencyCache:
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+
+        self.max_bytes = max_bytes
+
+        self.ttl = ttl
+
+        self.enabled = max_bytes > 0
+
+        # キー → (本文の指紋, 期限, 保存した応答)
+        # key -> (body fingerprint, expiry, stored response)
+
+        self._entries = ByteLRU(max_bytes, lambda key, entry: len(entry[2][1]) + len(str(key)))
+
+        self._pending: Set[Hashable] = set()
+
+        self._lock = threading.Lock()
+
+        self.hits = 0
+
+        self.misses = 0
+
+        self.evictions = 0
+
+    def begin(self, key: Hashable, digest: str) -> Optional[StoredResponse]:
+
+        # 保存済みならその応答を返す。無ければ処理中として印を付けて None を返す
+        # （呼び出し側は処理後に complete、失敗したら release を必ず呼ぶ）
+        # Returns the stored response if there is one. Otherwise marks the key as in
+        # progress and returns None; the caller must then call complete, or release on failure
+
+        now = time.monotonic()
+
+        with self._lock:
+
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] <= now:
+
+                self._entries.pop(key)
+
+                entry = None
+
+            if entry is not None:
+
+                if entry[0] != digest:
+
+                    raise IdempotencyMismatch()
+
+                self.hits += 1
+
+                return entry[2]
+
+            if key in self._pending:
+
+                raise IdempotencyConflict()
+
+            self._pending.add(key)
+
+            self.misses += 1
+
+            return None
+
+    def complete(self, key: Hashable, digest: str, response: StoredResponse) -> None:
+
+        with self._lock:
+
+            self._pending.discard(key)
+
+            evicted = self._entries.put(key, (digest, time.monotonic() + self.ttl, response))
+
+            self.evictions += len(evicted or ())
+
+    def release(self, key: Hashable) -> None:
+
+        with self._lock:
+
+            self._pending.discard(key)
+
+    def clear(self) -> None:
+
+        with self._lock:
+
+            self._entries.clear()
+
+            self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+
+        with self._lock:
+
+            return {
+                "entries": len(self._entries),
+                "bytes": self._entries.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+idempotency_cache = IdempotencyCache(int(settings.idempotency_cache_mb * 1024 * 1024), settings.idempotency_ttl)
+
+# 保存した応答は作った時のストアのタスクを指すので、リポジトリが作り直されたら捨てる
+# stored responses refer to tasks of the store they were made against, so drop them when the repository is recreated
+
+add_repository_hook(lambda repo: idempotency_cache.clear())
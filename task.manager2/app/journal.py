@@ -0,0 +1,608 @@
+# app/journal.py
+
+import atexit
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from .storage import JournalError, TaskRecord
+
+# メモリ上のストア用の先行書き込みログ（WAL）とスナップショット
+#   wal.NNNNNNNN.log : 作成・更新・削除を1行1件の JSON で追記するログ（セグメントごとに1ファイル）
+#   snapshot.bin     : ある時点の全タスク（列ごとのバイナリ）と、その続きのセグメント番号
+# 書き込みはバッファに積み、専用スレッドがまとめて write + fsync する（グループコミット）。
+# 起動時はスナップショットを mmap で読み込み、それ以降のセグメントを再生する。
+# Write-ahead log and snapshots for the in-memory store.
+#   wal.NNNNNNNN.log : creates/updates/deletes appended as one JSON line each, one file per segment
+#   snapshot.bin     : every task at one point in time (column-wise binary) plus the segment that follows it
+# Writes are buffered and a dedicated thread writes and fsyncs them in batches
+# (group commit). On startup the snapshot is memory-mapped and later segments are replayed.
+
+_SNAPSHOT = "snapshot.bin"
+
+_MAGIC = b"TASKSNP1"
+
+# 件数, 次の id, 続きのセグメント番号, タイトル部の長さ, 説明部の長さ
+# count, next id, following segment, title blob length, description blob length
+
+_HEADER = struct.Struct("<QQQQQ")
+
+# completed と「description あり」のフラグ
+# flags for completed and "has a description"
+
+_COMPLETED = 1
+
+_HAS_DESCRIPTION = 2
+
+
+def _segment_name(number: int) -> str:
+
+    return f"wal.{number:08d}.log"
+
+
+def _segment_numbers(directory: str) -> List[int]:
+
+    numbers = []
+
+    for name in os.listdir(directory):
+
+        if name.startswith("wal.") and name.endswith(".log"):
+
+            numbers.append(int(name[4:-4]))
+
+    return sorted(numbers)
+
+
+def _fsync_directory(directory: str) -> None:
+
+    # rename / 新規ファイル作成をディレクトリ側でも永続化する（Windows では不要・不可）
+    # Make renames and new files durable in the directory itself (not needed/possible on Windows)
+
+    if os.name == "nt":
+
+        return
+
+    fd = os.open(directory, os.O_RDONLY)
+
+    try:
+
+        os.fsync(fd)
+
+    finally:
+
+        os.close(fd)
+
+
+def encode_put(record: TaskRecord) -> bytes:
+
+    return json.dumps(
+        ["p", record.id, record.title, record.description, record.completed, record.version],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode() + b"\n"
+
+
+def encode_delete(task_id: int) -> bytes:
+
+    return b'["d",%d]\n' % task_id
+
+
+def write_snapshot(path: str, records: List[TaskRecord], next_id: int, segment: int) -> None:
+
+    # 一時ファイルに書いて fsync してから置き換えるので、途中で落ちても前のスナップショットが残る
+    # Written to a temporary file, fsynced, then renamed over the old one, so a crash
+    # mid-write leaves the previous snapshot intact
+
+    ids = array("q", (r.id for r in records))
+
+    versions = array("q", (r.version for r in records))
+
+    flags = bytes(
+        (_COMPLETED if r.completed else 0) | (_HAS_DESCRIPTION if r.description is not None else 0)
+        for r in records
+    )
+
+    titles = [r.title.encode() for r in records]
+
+    descriptions = [(r.description or "").encode() for r in records]
+
+    title_lengths = array("I", map(len, titles))
+
+    description_lengths = array("I", map(len, descriptions))
+
+    title_blob = b"".join(titles)
+
+    description_blob = b"".join(descriptions)
+
+    tmp = path + ".tmp"
+
+    with open(tmp, "wb") as f:
+
+        f.write(_MAGIC)
+
+        f.write(_HEADER.pack(len(records), next_id, segment, len(title_blob), len(description_blob)))
+
+        for part in (ids, versions, flags, title_lengths, description_lengths, title_blob, description_blob):
+
+            f.write(part)
+
+        f.flush()
+
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+
+    _fsync_directory(os.path.dirname(path))
+
+
+def read_snapshot(path: str) -> Tuple[List[TaskRecord], int, int]:
+
+    # (id 昇順のレコード, 次の id, 続きのセグメント番号)。スナップショットが無ければ空
+    # (records in id order, next id, following segment); empty when there is no snapshot
+
+    if not os.path.exists(path):
+
+        return [], 1, 0
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+        if mm[: len(_MAGIC)] != _MAGIC:
+
+            raise ValueError(f"{path} is not a task snapshot")
+
+        offset = len(_MAGIC)
+
+        count, next_id, segment, title_size, description_size = _HEADER.unpack_from(mm, offset)
+
+        offset += _HEADER.size
+
+        def column(typecode: str) -> array:
+
+            nonlocal offset
+
+            values = array(typecode)
+
+            end = offset + values.itemsize * count
+
+            values.frombytes(mm[offset:end])
+
+            offset = end
+
+            return values
+
+        ids = column("q")
+
+        versions = column("q")
+
+        flags = mm[offset : offset + count]
+
+        offset += count
+
+        title_lengths = column("I")
+
+        description_lengths = column("I")
+
+        title_blob = mm[offset : offset + title_size]
+
+        offset += title_size
+
+        description_blob = mm[offset : offset + description_size]
+
+    def strings(blob: bytes, lengths: array) -> List[str]:
+
+        ends = list(accumulate(lengths))
+
+        return [blob[start:end].decode() for start, end in zip([0] + ends[:-1], ends)]
+
+    records = [
+        TaskRecord(task_id, title, description if flag & _HAS_DESCRIPTION else None, bool(flag & _COMPLETED), version)
+        for task_id, title, description, flag, version in zip(
+            ids, strings(title_blob, title_lengths), strings(description_blob, description_lengths), flags, versions
+        )
+    ]
+
+    return records, next_id, segment
+
+
+def replay(path: str, tasks: Dict[int, TaskRecord]) -> int:
+
+    # セグメントの操作を tasks に適用し、見つかった最大の id を返す。
+    # 書きかけの最終行（クラッシュ時）はそこで打ち切る
+    # Apply a segment's operations to `tasks` and return the largest id seen.
+    # A torn final line (from a crash) ends the replay
+
+    max_id = 0
+
+    with open(path, "rb") as f:
+
+        for line in f:
+
+            try:
+
+                entry = json.loads(line)
+
+            except ValueError:
+
+                return max_id
+
+            if entry[0] == "p":
+
+                tasks[entry[1]] = TaskRecord(entry[1], entry[2], entry[3], entry[4], entry[5])
+
+            else:
+
+                tasks.pop(entry[1], None)
+
+            max_id = max(max_id, entry[1])
+
+    return max_id
+
+
+class TaskJournal:
+
+    def __init__(self, directory: str, snapshot_every: int = 100_000, wait_for_commit: bool = True) -> None:
+
+        self.directory = directory
+
+        self.snapshot_every = snapshot_every
+
+        # True なら書き込みは fsync 済みになるまで返らない（False ならバッファに積んだ時点で返る）
+        # When True a write returns only once it is fsynced (when False, once it is buffered)
+
+        self.wait_for_commit = wait_for_commit
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending: List[object] = []
+
+        self._appended = 0
+
+        self._committed = 0
+
+        self._since_snapshot = 0
+
+        self._segment = 0
+
+        self._file = None
+
+        self._snapshotting = False
+
+        self._snapshot_seq = 0
+
+        self._closed = False
+
+        # フラッシュ用スレッドで起きた OSError（ENOSPC, EIO など）。一度失敗したらログは止まったまま
+        # OSError raised on the flusher thread (ENOSPC, EIO, ...); once set the log stays stopped
+
+        self._error: Optional[OSError] = None
+
+        self._cond = threading.Condition()
+
+        self._flusher: Optional[threading.Thread] = None
+
+        self._writer: Optional[threading.Thread] = None
+
+        self.commits = 0
+
+        self.snapshots = 0
+
+    def recover(self) -> Tuple[List[TaskRecord], int]:
+
+        # スナップショット + 続きのセグメントから状態を復元し、(id 昇順のレコード, 次の id) を返す。
+        # 以後の追記は新しいセグメントに書く（書きかけの可能性がある古いファイルには追記しない）
+        # Rebuild the state from the snapshot plus the following segments and return
+        # (records in id order, next id). New writes go to a fresh segment, never to a
+        # file that may end in a torn line.
+
+        records, next_id, base = read_snapshot(os.path.join(self.directory, _SNAPSHOT))
+
+        numbers = _segment_numbers(self.directory)
+
+        tail = [n for n in numbers if n >= base]
+
+        if tail:
+
+            tasks = {record.id: record for record in records}
+
+            for number in tail:
+
+                max_id = replay(os.path.join(self.directory, _segment_name(number)), tasks)
+
+                next_id = max(next_id, max_id + 1)
+
+            records = [tasks[task_id] for task_id in sorted(tasks)]
+
+        for number in numbers:
+
+            if number < base:
+
+                os.remove(os.path.join(self.directory, _segment_name(number)))
+
+        self._segment = max(numbers + [base - 1]) + 1
+
+        self._file = open(os.path.join(self.directory, _segment_name(self._segment)), "ab", buffering=0)
+
+        _fsync_directory(self.directory)
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="task-journal", daemon=True)
+
+        self._flusher.start()
+
+        atexit.register(self.close)
+
+        return records, next_id
+
+    def append(self, entry: bytes) -> int:
+
+        # 1件（または複数行）を追記キューに積み、コミット待ちに使う通し番号を返す
+        # Queue one entry (one or more lines) and return its sequence number for wait()
+
+        with self._cond:
+
+            self._check()
+
+            self._pending.append(entry)
+
+            self._appended += 1
+
+            self._since_snapshot += 1
+
+            self._cond.notify_all()
+
+            return self._appended
+
+    @property
+    def committed(self) -> int:
+
+        # fsync 済みの最後の通し番号
+        # last sequence number known to be fsynced
+
+        return self._committed
+
+    def log_put(self, records: List[TaskRecord]) -> int:
+
+        return self.append(b"".join(map(encode_put, records)))
+
+    def log_delete(self, task_id: int) -> int:
+
+        return self.append(encode_delete(task_id))
+
+    def wait(self, seq: int) -> None:
+
+        # seq までの追記が fsync されるまで待つ
+        # Block until everything up to `seq` is fsynced
+
+        if not self.wait_for_commit:
+
+            return
+
+        with self._cond:
+
+            while self._committed < seq and not self._closed and self._error is None:
+
+                self._cond.wait()
+
+            if self._committed < seq:
+
+                self._check()
+
+    def _check(self) -> None:
+
+        # フラッシュが失敗していれば JournalError を投げる（呼び出し側で _cond を保持していること）
+        # Raise JournalError if the flusher failed (caller must hold _cond)
+
+        if self._error is not None:
+
+            raise JournalError(f"task journal write failed: {self._error}") from self._error
+
+    def _flush_loop(self) -> None:
+
+        # その時点で溜まっている分をまとめて1回の write + fsync で書く。fsync 中に来た書き込みは次の回にまとまる
+        # Write everything queued so far with one write + fsync; writes arriving during
+        # the fsync form the next batch
+
+        while True:
+
+            with self._cond:
+
+                while not self._pending and not self._closed:
+
+                    self._cond.wait()
+
+                if not self._pending and self._closed:
+
+                    return
+
+                batch, self._pending = self._pending, []
+
+                upto = self._appended
+
+            try:
+
+                self._flush(batch)
+
+            except OSError as e:
+
+                # どこまで書けたか分からないので、以後は受け付けない。待っている書き込みを起こして失敗させる
+                # How much reached the disk is unknown, so stop accepting writes and wake
+                # the waiters so their requests fail instead of hanging
+
+                with self._cond:
+
+                    self._error = e
+
+                    self._cond.notify_all()
+
+                return
+
+            with self._cond:
+
+                self._committed = upto
+
+                self.commits += 1
+
+                self._cond.notify_all()
+
+    def _flush(self, batch: List[object]) -> None:
+
+        chunk: List[bytes] = []
+
+        for item in batch:
+
+            if isinstance(item, int):
+
+                # セグメントの切り替え（スナップショット開始の印）
+                # segment switch (marks the start of a snapshot)
+
+                self._write(chunk)
+
+                chunk = []
+
+                self._file.close()
+
+                self._file = open(os.path.join(self.directory, _segment_name(item)), "ab", buffering=0)
+
+                _fsync_directory(self.directory)
+
+            else:
+
+                chunk.append(item)
+
+        self._write(chunk)
+
+    def _write(self, chunk: List[bytes]) -> None:
+
+        if chunk:
+
+            self._file.write(b"".join(chunk))
+
+        os.fsync(self._file.fileno())
+
+    def snapshot_due(self) -> bool:
+
+        return self._since_snapshot >= self.snapshot_every and not self._snapshotting
+
+    def begin_snapshot(self) -> Optional[int]:
+
+        # 呼び出し側はストアの状態を書き換えられないようにした状態で呼ぶ（メモリ実装では _index_lock）。
+        # 以後の追記を新しいセグメントへ切り替え、そのセグメント番号を返す。既に実行中なら None
+        # The caller must hold the store still while calling this (the in-memory store holds
+        # _index_lock). Later appends go to a new segment, whose number is returned; None if a
+        # snapshot is already running
+
+        with self._cond:
+
+            if self._snapshotting or self._closed or self._error is not None:
+
+                return None
+
+            self._snapshotting = True
+
+            self._since_snapshot = 0
+
+            self._segment += 1
+
+            self._pending.append(self._segment)
+
+            self._appended += 1
+
+            self._snapshot_seq = self._appended
+
+            self._cond.notify_all()
+
+            return self._segment
+
+    def finish_snapshot(self, records: List[TaskRecord], next_id: int, segment: int) -> None:
+
+        # begin_snapshot 時点のレコードを別スレッドでファイルに書く
+        # Write the records taken at begin_snapshot to the file on a background thread
+
+        self._writer = threading.Thread(
+            target=self._write_snapshot,
+            args=(records, next_id, segment),
+            name="task-snapshot",
+            daemon=True,
+        )
+
+        self._writer.start()
+
+    def _write_snapshot(self, records: List[TaskRecord], next_id: int, segment: int) -> None:
+
+        # スナップショットを書き、それより前のセグメントを消す。
+        # 消すのは、フラッシュ用スレッドが新しいセグメントへ切り替えた後
+        # Write the snapshot and delete the segments before it.
+        # Deletion waits until the flusher has switched to the new segment
+
+        try:
+
+            records.sort(key=lambda record: record.id)
+
+            write_snapshot(os.path.join(self.directory, _SNAPSHOT), records, next_id, segment)
+
+            with self._cond:
+
+                while self._committed < self._snapshot_seq and self._error is None:
+
+                    self._cond.wait()
+
+                if self._error is not None:
+
+                    # 新しいセグメントへ切り替わっていないので、古いセグメントは消さない
+                    # the flusher never reached the new segment, so keep the old ones
+
+                    return
+
+            for number in _segment_numbers(self.directory):
+
+                if number < segment:
+
+                    os.remove(os.path.join(self.directory, _segment_name(number)))
+
+            self.snapshots += 1
+
+        finally:
+
+            with self._cond:
+
+                self._snapshotting = False
+
+    def close(self) -> None:
+
+        with self._cond:
+
+            if self._closed:
+
+                return
+
+            self._closed = True
+
+            self._cond.notify_all()
+
+        if self._flusher is not None:
+
+            self._flusher.join()
+
+        if self._writer is not None:
+
+            self._writer.join()
+
+        if self._file is not None:
+
+            self._file.close()
+
+    def stats(self) -> Dict[str, int]:
+
+        with self._cond:
+
+            return {
+                "segment": self._segment,
+                "appended": self._appended,
+                "committed": self._committed,
+                "commits": self.commits,
+                "snapshots": self.snapshots,
+            }
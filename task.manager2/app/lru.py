@@ -0,0 +1,91 @@
+# app/lru.py
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+# 値の合計バイト数で上限を決める LRU。app/cache.py（レスポンス）と app/idempotency.py（保存した応答）が使う。
+# ロックは持たない（呼び出し側が自分のロックの中で使う）
+# LRU bounded by the total size of its values, used by app/cache.py (responses) and
+# app/idempotency.py (stored replies). It has no lock of its own: callers use it under theirs.
+
+
+class ByteLRU:
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Hashable, Any], int]) -> None:
+
+        self.max_bytes = max_bytes
+
+        self.size = 0
+
+        self._sizeof = sizeof
+
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+
+        # あれば最近使ったものとして末尾に移す
+        # a hit moves the entry to the most recently used end
+
+        value = self._entries.get(key)
+
+        if value is not None:
+
+            self._entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: Hashable, value: Any) -> Optional[List[Hashable]]:
+
+        # 入れて（同じキーは置き換え）、上限に収まるまで古いものを追い出し、追い出したキーを返す。
+        # 1件で上限の1/4を超えるものは入れずに None（他の全エントリを追い出してしまうため）
+        # Store the value (replacing the same key) and evict the least recently used entries
+        # until the total fits; returns the evicted keys. A value above a quarter of the
+        # budget is not stored and gives None, since it would evict everything else.
+
+        size = self._sizeof(key, value)
+
+        if size > self.max_bytes // 4:
+
+            return None
+
+        self.pop(key)
+
+        self._entries[key] = value
+
+        self.size += size
+
+        evicted: List[Hashable] = []
+
+        while self.size > self.max_bytes:
+
+            old_key, old_value = self._entries.popitem(last=False)
+
+            self.size -= self._sizeof(old_key, old_value)
+
+            evicted.append(old_key)
+
+        return evicted
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+
+        value = self._entries.pop(key, None)
+
+        if value is not None:
+
+            self.size -= self._sizeof(key, value)
+
+        return value
+
+    def clear(self) -> None:
+
+        self._entries.clear()
+
+        self.size = 0
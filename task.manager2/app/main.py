@@ -1,10 +1,86 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers.tasks import router as tasks_router  
-app = FastAPI(title="Task Manager API", version="1.0.0")
+from fastapi.responses import PlainTextResponse
+from app import metrics
+from app.cache import response_cache
+from app.compression import CompressionMiddleware
+from app.config import settings
+from app.idempotency import idempotency_cache
+from app.responses import FastJSONResponse
+from app.routers.feed import router as feed_router
+from app.storage import close_repository, get_repository
+if settings.task_routes == "async":
+   from app.routers.tasks_async import router as tasks_router
+else:
+   from app.routers.tasks import router as tasks_router
+# ストレージは起動時に開き（ジャーナルの復元などを最初のリクエストに持ち越さない）、終了時に閉じる。
+# OpenAPI スキーマは FastAPI が最初の /openapi.json で作る
+#  storage is opened at startup (journal recovery etc. is not left to the first request) and
+#  closed on shutdown; FastAPI builds the OpenAPI schema on the first /openapi.json request
+@asynccontextmanager
+async def lifespan(app):
+   get_repository()
+   yield
+   close_repository()
+
+app = FastAPI(title="Task Manager API", version="1.0.0", lifespan=lifespan)
+# Accept-Encoding に応じて zstd / gzip で圧縮（app/compression.py）。計測より内側に置き、圧縮時間も計測に含める
+#  zstd / gzip compression negotiated from Accept-Encoding (app/compression.py); added before
+#  the metrics middleware so it runs inside it and compression time is measured too
+if settings.compression_encodings:
+   app.add_middleware(
+      CompressionMiddleware,
+      encodings=settings.compression_encodings,
+      minimum_size=settings.compression_min_size,
+      gzip_level=settings.gzip_level,
+      zstd_level=settings.zstd_level,
+   )
+# ルート・ステータス別のレイテンシを計測（/metrics で公開）
+#  per-route latency, exposed at /metrics
+if settings.metrics_enabled:
+   app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get("/")
 def hello():
-   return {"message": "Hello FastAPI!"}
+   return FastJSONResponse({"message": "Hello FastAPI!"})
+
+# キャッシュなどの内部統計（ヒット数・ミス数など）。FastJSONResponse を直接返し jsonable_encoder を通さない
+#  internal statistics such as cache hits/misses, returned as FastJSONResponse to skip jsonable_encoder
+@app.get("/stats")
+def stats():
+   repo = get_repository()
+   result = {"response_cache": response_cache.stats(), "idempotency": idempotency_cache.stats()}
+   if getattr(repo, "journal", None) is not None:
+      result["journal"] = repo.journal.stats()
+   return FastJSONResponse(result)
+
+# Prometheus 形式のメトリクス
+#  metrics in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+   cache = response_cache.stats()
+   idempotency = idempotency_cache.stats()
+   body = metrics.render(
+      get_repository(),
+      gauges={
+         "task_response_cache_entries": cache["entries"],
+         "task_response_cache_bytes": cache["bytes"],
+         "task_idempotency_cache_entries": idempotency["entries"],
+         "task_idempotency_cache_bytes": idempotency["bytes"],
+      },
+      counters={
+         "task_response_cache_hits_total": cache["hits"],
+         "task_response_cache_misses_total": cache["misses"],
+         "task_response_cache_evictions_total": cache["evictions"],
+         "task_idempotency_cache_hits_total": idempotency["hits"],
+         "task_idempotency_cache_misses_total": idempotency["misses"],
+         "task_idempotency_cache_evictions_total": idempotency["evictions"],
+      },
+   )
+   return PlainTextResponse(body, media_type=metrics.CONTENT_TYPE)
+# 変更フィード（/tasks/changes）。/tasks/{task_id} より先に登録する
+#  change feed (/tasks/changes), registered before /tasks/{task_id}
+app.include_router(feed_router)
 # /tasks 配下のCRUDを登録
 #  register CRUD under /tasks
 app.include_router(tasks_router)
\ No newline at end of file
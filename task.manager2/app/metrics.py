@@ -0,0 +1,410 @@
+# app/metrics.py
+
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.routing import APIRoute
+
+from .config import settings
+from .storage import TaskRepository, add_repository_hook
+
+# Prometheus 形式のメトリクス（外部ライブラリなし）。本番で常時有効にできるよう、1リクエストあたりの
+# 追加処理は時刻の取得と配列の加算だけにしている。
+#   http_request_duration_seconds       : ルート（パスのテンプレート）・メソッド・ステータス別の処理時間
+#   task_request_phase_duration_seconds : 1リクエスト内の validation / storage / serialization / compression の合計時間
+#   task_storage_operation_seconds      : ストレージ操作（create, get, page ...）ごとの時間
+#   task_store_size                     : 保存されているタスク数（取得時に数える）
+# Prometheus-format metrics without an external library. To stay cheap enough to
+# leave on in production, the per-request work is a few clock reads and array
+# increments.
+#   http_request_duration_seconds       : latency per route template, method and status
+#   task_request_phase_duration_seconds : time per request spent in validation / storage / serialization / compression
+#   task_storage_operation_seconds      : time per storage operation (create, get, page ...)
+#   task_store_size                     : number of stored tasks (counted on scrape)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒単位のバケット（0.1ms〜10s）
+# buckets in seconds (0.1 ms to 10 s)
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ストレージ操作として計測するリポジトリのメソッド
+# repository methods timed as storage operations
+
+STORAGE_OPERATIONS = (
+    "create",
+    "create_many",
+    "get",
+    "update",
+    "update_many",
+    "remove",
+    "remove_many",
+    "page",
+    "search",
+    "count",
+    "collection_version",
+)
+
+PHASES = ("validation", "storage", "serialization", "compression")
+
+
+class Histogram:
+
+    # ラベルの値の組ごとに [各バケットの件数..., 合計] を持つ。出力時に累積にする
+    # Per label-value tuple keeps [count per bucket..., sum]; made cumulative on output
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+
+        self.name = name
+
+        self.help = help
+
+        self.labels = tuple(labels)
+
+        self.buckets = tuple(buckets)
+
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+
+            series = self._series.get(label_values)
+
+            if series is None:
+
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+
+            series[index] += 1
+
+            series[-1] += value
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+
+        for label_values, series in snapshot:
+
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+
+            prefix = labels + "," if labels else ""
+
+            suffix = f"{{{labels}}}" if labels else ""
+
+            total = 0
+
+            for bound, count in zip(self.buckets, series):
+
+                total += count
+
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {total}')
+
+            total += series[len(self.buckets)]
+
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {total}')
+
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+
+            lines.append(f"{self.name}_count{suffix} {total}")
+
+        return lines
+
+
+def _escape(value: str) -> str:
+
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code.",
+    ("method", "route", "status"),
+)
+
+phase_duration = Histogram(
+    "task_request_phase_duration_seconds",
+    "Time per request spent in request validation, storage, response serialization and compression.",
+    ("phase", "method", "route"),
+)
+
+storage_duration = Histogram(
+    "task_storage_operation_seconds",
+    "Time spent in each storage operation.",
+    ("operation",),
+)
+
+# 処理中のリクエストのフェーズ別の合計時間（ミドルウェアが用意し、各所が加算する）
+# Per-phase totals of the current request (set up by the middleware, added to by each phase)
+
+_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("task_request_phases", default=None)
+
+
+def _add_phase(phase: str, seconds: float) -> None:
+
+    phases = _phases.get()
+
+    if phases is not None:
+
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def timed_phase(phase: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+
+    # 関数の実行時間を現在のリクエストの phase に加算するデコレーター
+    # Decorator adding the function's run time to `phase` of the current request
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+
+        if not settings.metrics_enabled:
+
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+
+            start = time.perf_counter()
+
+            try:
+
+                return fn(*args, **kwargs)
+
+            finally:
+
+                _add_phase(phase, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+def instrument_repository(repo: TaskRepository) -> None:
+
+    # リポジトリのインスタンスのメソッドを計測付きに差し替える（クラスは変えないので isinstance はそのまま）
+    # Replace the instance's methods with timed ones (the class is unchanged, so isinstance still holds)
+
+    for operation in STORAGE_OPERATIONS:
+
+        setattr(repo, operation, _timed_operation(getattr(repo, operation), operation))
+
+
+def _timed_operation(method: Callable[..., Any], operation: str) -> Callable[..., Any]:
+
+    @wraps(method)
+    def timed(*args: Any, **kwargs: Any) -> Any:
+
+        start = time.perf_counter()
+
+        try:
+
+            return method(*args, **kwargs)
+
+        finally:
+
+            elapsed = time.perf_counter() - start
+
+            storage_duration.observe(elapsed, operation)
+
+            _add_phase("storage", elapsed)
+
+    return timed
+
+
+class InstrumentedRoute(APIRoute):
+
+    # FastAPI のルート。リクエスト処理の開始からエンドポイント関数の開始まで（ボディの読み取りと検証。
+    # 同期ハンドラーではスレッドプールの空き待ちも含む）を validation、エンドポイント関数の終了から
+    # 応答の完成まで（response_model による変換）を serialization に数える
+    # FastAPI route that counts the time from the start of request handling to the start
+    # of the endpoint (reading and validating the body; for sync handlers this includes
+    # waiting for a threadpool thread) as validation, and from the end of the endpoint
+    # to the finished response (response_model conversion) as serialization
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+
+        super().__init__(path, _mark_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[..., Any]:
+
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Any) -> Any:
+
+            phases = _phases.get()
+
+            if phases is not None:
+
+                phases["_handler_start"] = time.perf_counter()
+
+            response = await handler(request)
+
+            if phases is not None and "_endpoint_end" in phases:
+
+                _add_phase("serialization", time.perf_counter() - phases.pop("_endpoint_end"))
+
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+
+    # エンドポイント関数の開始・終了時刻を記録する（シグネチャは wraps で FastAPI から同じに見える）
+    # Record when the endpoint starts and ends (wraps keeps the signature FastAPI inspects)
+
+    def start() -> None:
+
+        phases = _phases.get()
+
+        if phases is not None and "_handler_start" in phases:
+
+            _add_phase("validation", time.perf_counter() - phases.pop("_handler_start"))
+
+    def end() -> None:
+
+        phases = _phases.get()
+
+        if phases is not None:
+
+            phases["_endpoint_end"] = time.perf_counter()
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def async_endpoint(*args: Any, **kwargs: Any) -> Any:
+
+            start()
+
+            try:
+
+                return await endpoint(*args, **kwargs)
+
+            finally:
+
+                end()
+
+        return async_endpoint
+
+    @wraps(endpoint)
+    def sync_endpoint(*args: Any, **kwargs: Any) -> Any:
+
+        start()
+
+        try:
+
+            return endpoint(*args, **kwargs)
+
+        finally:
+
+            end()
+
+    return sync_endpoint
+
+
+# ルーターに渡すルートクラス（計測が無効なら FastAPI 標準のまま）
+# Route class for the routers (FastAPI's own when metrics are disabled)
+
+route_class = InstrumentedRoute if settings.metrics_enabled else APIRoute
+
+
+class MetricsMiddleware:
+
+    # ASGI ミドルウェア。応答の送信完了までを計測し、ルートのテンプレート（/tasks/{task_id} など）をラベルにする。
+    # どのルートにも一致しなかったリクエストは "unmatched" にまとめる（ラベルの種類が増え続けないように）
+    # ASGI middleware timing each request until its response is sent, labelled by the
+    # route template (/tasks/{task_id} etc.). Requests matching no route share the label
+    # "unmatched" so the label set stays bounded.
+
+    def __init__(self, app: Any) -> None:
+
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+
+        if scope["type"] != "http":
+
+            await self.app(scope, receive, send)
+
+            return
+
+        start = time.perf_counter()
+
+        phases: Dict[str, float] = {}
+
+        token = _phases.set(phases)
+
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+
+                status = message["status"]
+
+            await send(message)
+
+        try:
+
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+
+            _phases.reset(token)
+
+            route = scope.get("route")
+
+            template = getattr(route, "path", None) or "unmatched"
+
+            request_duration.observe(time.perf_counter() - start, scope["method"], template, str(status))
+
+            if isinstance(route, InstrumentedRoute):
+
+                for phase in PHASES:
+
+                    phase_duration.observe(phases.get(phase, 0.0), phase, scope["method"], template)
+
+
+def render(
+    repo: TaskRepository,
+    gauges: Optional[Dict[str, float]] = None,
+    counters: Optional[Dict[str, float]] = None,
+) -> str:
+
+    # /metrics の本文。gauges / counters は {メトリクス名: 値}（キャッシュの統計など）
+    # Body of /metrics; `gauges` and `counters` map metric names to values (cache statistics etc.)
+
+    lines: List[str] = []
+
+    for histogram in (request_duration, phase_duration, storage_duration):
+
+        lines.extend(histogram.render())
+
+    for kind, values in (("gauge", {"task_store_size": repo.count(), **(gauges or {})}), ("counter", counters or {})):
+
+        for name, value in values.items():
+
+            lines.append(f"# TYPE {name} {kind}")
+
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+if settings.metrics_enabled:
+
+    add_repository_hook(instrument_repository)
@@ -0,0 +1,51 @@
+# app/responses.py
+
+from typing import Any
+
+import pydantic_core
+from fastapi.responses import JSONResponse
+
+try:
+
+    import orjson
+
+except ImportError:
+
+    orjson = None
+
+# JSON のエンコードとレスポンスクラス。
+#   dumps             : orjson があれば orjson、無ければ pydantic-core（どちらも Rust 実装）で dict / list を JSON にする。
+#                       出力は FastAPI の既定（区切りは空白なし・非 ASCII はそのまま）と同じバイト列
+#   FastJSONResponse  : dumps で本文を作るレスポンス。bytes はエンコード済みとしてそのまま送る。
+#                       ルートから直接返すと jsonable_encoder を通らない
+# アプリ全体の既定（default_response_class）にはしない。response_model のあるルートは FastAPI が
+# pydantic-core で直接 JSON にする高速経路を使っており、独自の既定クラスを設定するとその経路が外れるため。
+# JSON encoding and the response class built on it.
+#   dumps            : dicts / lists to JSON with orjson when installed, pydantic-core otherwise
+#                      (both in Rust). The bytes equal FastAPI's default output (compact
+#                      separators, non-ASCII left as is).
+#   FastJSONResponse : response whose body is made by dumps; bytes are sent as already
+#                      encoded. Returned directly from a route, it skips jsonable_encoder.
+# It is not the app-wide default_response_class: routes with a response_model already
+# take FastAPI's pydantic-core path straight to JSON bytes, and a custom default class
+# would switch that path off.
+
+
+def dumps(content: Any) -> bytes:
+
+    if orjson is not None:
+
+        return orjson.dumps(content)
+
+    return pydantic_core.to_json(content)
+
+
+class FastJSONResponse(JSONResponse):
+
+    def render(self, content: Any) -> bytes:
+
+        if isinstance(content, bytes):
+
+            return content
+
+        return dumps(content)
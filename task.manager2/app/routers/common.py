@@ -0,0 +1,409 @@
+# app/routers/common.py
+
+import base64
+
+import binascii
+
+import json
+
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, Response, status
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.idempotency import IdempotencyConflict, IdempotencyMismatch, fingerprint, idempotency_cache
+
+from app.metrics import timed_phase
+
+from app.responses import FastJSONResponse, dumps
+
+from app.schemes import BulkResult, TaskBulkDeleteItem, TaskBulkUpdateItem, TaskCreate, TaskUpdate
+
+from app.storage import TaskRecord
+
+# app/routers/tasks.py（同期版）と app/routers/tasks_async.py（async 版）の両方が使う定数と処理。
+# ETag・カーソル・一括結果の組み立て・Idempotency-Key など、リポジトリを呼ばない部分だけを置く
+# Constants and helpers shared by app/routers/tasks.py (sync) and app/routers/tasks_async.py
+# (async): ETags, cursors, bulk results, Idempotency-Key handling, nothing that calls the repository.
+
+# 1ページあたりの最大件数と、次ページのカーソルを返すヘッダー名
+# max page size and the header carrying the next-page cursor
+
+MAX_PAGE_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# エクスポート時にストレージから一度に読む件数
+# number of tasks read from storage per chunk when exporting
+
+EXPORT_CHUNK_SIZE = 1000
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+ETAG_HEADER = "ETag"
+
+# 検索: 既定の件数、offset の上限（深いページほど順位付けの対象が増えるため）、一致総数のヘッダー名
+# search: default page size, max offset (deeper pages rank more matches), header with the total match count
+
+SEARCH_PAGE_SIZE = 20
+
+MAX_SEARCH_OFFSET = 10000
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# 作成リクエストの再送を見分けるヘッダー（app/idempotency.py）と、保存した応答を返したことを示すヘッダー
+# header identifying retries of a create request (app/idempotency.py), and the header marking a replayed response
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+create_batch = TypeAdapter(List[TaskCreate])
+
+update_batch = TypeAdapter(List[TaskBulkUpdateItem])
+
+delete_batch = TypeAdapter(List[TaskBulkDeleteItem])
+
+@timed_phase("validation")
+
+def validate_batch(adapter: TypeAdapter, items: List[Any]) -> Tuple[List[Tuple[int, Any]], Dict[int, list]]:
+
+    # バッチ全体を1回で検証する。不正な行があればその行だけ除いてもう1回検証し、
+    # 行ごとのエラーを返す（1行の不正でバッチ全体を失敗させない）
+    # Validate the whole batch in one call. If some rows are invalid, collect their
+    # errors by row and validate the remaining rows again in one more call, so a
+    # bad row never aborts the batch.
+
+    try:
+
+        return list(enumerate(adapter.validate_python(items))), {}
+
+    except ValidationError as e:
+
+        errors: Dict[int, list] = {}
+
+        for err in e.errors(include_url=False, include_context=False):
+
+            index, *loc = err["loc"]
+
+            errors.setdefault(index, []).append({**err, "loc": loc})
+
+    keep = [i for i in range(len(items)) if i not in errors]
+
+    valid = adapter.validate_python([items[i] for i in keep])
+
+    return list(zip(keep, valid)), errors
+
+def changed_fields(payload: TaskUpdate) -> Dict[str, Any]:
+
+    # リクエストで実際に送られたフィールド（model_fields_set）だけを取り出す。None は無視
+    # Only the fields the client actually sent (model_fields_set); None is ignored
+
+    return {
+        name: value
+        for name in payload.model_fields_set
+        if name != "id" and (value := getattr(payload, name)) is not None
+    }
+
+def task_etag(repo: Any, record: TaskRecord) -> str:
+
+    # タスクの ETag（ストアの識別子 + id + バージョン）
+    # per-task ETag: store identifier + id + version
+
+    return f'"{repo.epoch}-{record.id}.{record.version}"'
+
+def collection_etag(epoch: str, version: int) -> str:
+
+    # 一覧の ETag。どのタスクへの書き込みでも変わる
+    # list ETag; changes with every write to any task
+
+    return f'"{epoch}-c{version}"'
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+
+    # If-None-Match は弱い比較（W/ を無視）
+    # If-None-Match uses the weak comparison (W/ is ignored)
+
+    if if_none_match is None:
+
+        return False
+
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+    return "*" in tags or etag in tags
+
+def if_match_versions(repo: Any, task_id: int, if_match: Optional[str]) -> Optional[Set[int]]:
+
+    # If-Match の ETag から、このタスクの許容バージョンを取り出す。条件なし（ヘッダー無し / *）は None。
+    # 一致する ETag が無ければ空集合になり、ストレージ側で必ず 412 になる
+    # Versions of this task accepted by If-Match; None when unconditional (no header or *).
+    # An empty set (no ETag of this task) always fails the precondition.
+
+    if if_match is None:
+
+        return None
+
+    tags = [tag.strip() for tag in if_match.split(",")]
+
+    if "*" in tags:
+
+        return None
+
+    prefix = f'"{repo.epoch}-{task_id}.'
+
+    return {
+        int(tag[len(prefix):-1])
+        for tag in tags
+        if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix):-1].isdigit()
+    }
+
+def task_response(repo: Any, record: TaskRecord, status_code: int = status.HTTP_200_OK) -> Response:
+
+    # 検証済みのタスクをそのまま JSON にして返す。Response を直接返すと response_model による
+    # 再検証と jsonable_encoder を通した再シリアライズが省かれる
+    # Serialise an already-validated task straight to JSON. Returning a Response directly
+    # skips response_model re-validation and the jsonable_encoder round trip.
+
+    return FastJSONResponse(
+        dump_task(record),
+        status_code=status_code,
+        headers={ETAG_HEADER: task_etag(repo, record)},
+    )
+
+def not_modified_response(etag: str) -> Response:
+
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={ETAG_HEADER: etag})
+
+def precondition_failed() -> HTTPException:
+
+    return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Task has been modified")
+
+# レスポンス本文の組み立て（/metrics の serialization として計測する）。
+# Task モデルを経由せず、レコードの dict を orjson / pydantic-core で直接 JSON にする（app/responses.py）
+# Response body builders (timed as serialization for /metrics). Records go straight to
+# JSON as dicts through orjson / pydantic-core (app/responses.py), without building Task models.
+
+@timed_phase("serialization")
+
+def dump_task(record: TaskRecord) -> bytes:
+
+    return dumps(record.to_dict())
+
+@timed_phase("serialization")
+
+def dump_tasks(records: List[TaskRecord]) -> bytes:
+
+    return dumps([record.to_dict() for record in records])
+
+@timed_phase("serialization")
+
+def dump_ndjson(records: List[TaskRecord]) -> bytes:
+
+    return b"".join(dumps(record.to_dict()) + b"\n" for record in records)
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+
+    return FastJSONResponse(body, headers=headers)
+
+def encode_cursor(sort: str, record: TaskRecord) -> str:
+
+    # X-Next-Cursor の値。id 順はページ最後の id、タイトル順は [タイトル, id] の JSON を URL 用 base64 にしたもの
+    # X-Next-Cursor value: the page's last id in id order, URL-safe base64 of the JSON [title, id] in title order
+
+    if sort.lstrip("-") != "title":
+
+        return str(record.id)
+
+    return base64.urlsafe_b64encode(json.dumps([record.title, record.id], ensure_ascii=False).encode()).decode().rstrip("=")
+
+def decode_cursor(sort: str, cursor: str) -> Optional[Tuple[Optional[str], int]]:
+
+    # encode_cursor の逆。(after_title, after_id) を返し、この並び順のカーソルでなければ None
+    # inverse of encode_cursor: (after_title, after_id), or None if it is not a cursor for this order
+
+    if sort.lstrip("-") != "title":
+
+        return (None, int(cursor)) if cursor.isdigit() else None
+
+    try:
+
+        title, task_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+    except (binascii.Error, ValueError, TypeError):
+
+        return None
+
+    if not isinstance(title, str) or type(task_id) is not int:
+
+        return None
+
+    return title, task_id
+
+def page_query(
+    sort: str,
+    after_id: Optional[int],
+    cursor: Optional[str],
+    min_id: Optional[int],
+    max_id: Optional[int],
+) -> Dict[str, Any]:
+
+    # 一覧のクエリ引数をストレージの page() の引数にする。続きは cursor（前のページの X-Next-Cursor）で読む。
+    # after_id は従来どおり id 順の続きにだけ使える
+    # Turn the list query parameters into arguments for the storage page(). Later pages
+    # are read with `cursor` (the previous page's X-Next-Cursor); after_id still works
+    # for id order only.
+
+    query: Dict[str, Any] = {
+        "sort": sort,
+        "after_id": after_id,
+        "after_title": None,
+        "min_id": min_id,
+        "max_id": max_id,
+    }
+
+    if cursor is not None:
+
+        position = decode_cursor(sort, cursor)
+
+        if position is None:
+
+            raise HTTPException(status_code=422, detail=f"Invalid cursor for sort={sort}")
+
+        query["after_title"], query["after_id"] = position
+
+    elif after_id is not None and sort.lstrip("-") == "title":
+
+        raise HTTPException(status_code=422, detail="after_id pages in id order; use cursor with sort=title")
+
+    return query
+
+def search_response(items: List[TaskRecord], total: int, offset: int) -> Response:
+
+    # 一致総数と、続きがあれば次の offset をヘッダーで返す
+    # the total match count, and the next offset when more matches follow, go in headers
+
+    headers = {TOTAL_COUNT_HEADER: str(total)}
+
+    if offset + len(items) < total:
+
+        headers[NEXT_CURSOR_HEADER] = str(offset + len(items))
+
+    return json_response(dump_tasks(items), headers)
+
+# 一括処理で id が見つからなかった行のエラー（検証エラーと同じ形）
+# the error of a bulk row whose id does not exist (same shape as a validation error)
+
+NOT_FOUND = [{"loc": ["id"], "msg": "Task not found", "type": "not_found"}]
+
+def bulk_result(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+
+    results.sort(key=lambda r: r["index"])
+
+    failed = sum(1 for r in results if r["status"] >= 400)
+
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
+
+def created_result(valid: List[Tuple[int, Any]], errors: Dict[int, list], created: List[TaskRecord]) -> Dict[str, Any]:
+
+    results = [{"index": i, "status": 422, "error": err} for i, err in errors.items()]
+
+    results += [{"index": i, "status": 201, "id": t.id, "task": t.to_task()} for (i, _), t in zip(valid, created)]
+
+    return bulk_result(results)
+
+def updated_result(
+    valid: List[Tuple[int, Any]],
+    errors: Dict[int, list],
+    updated: List[Optional[TaskRecord]],
+) -> Dict[str, Any]:
+
+    results = [{"index": i, "status": 422, "error": err} for i, err in errors.items()]
+
+    for (i, p), t in zip(valid, updated):
+
+        if t is None:
+
+            results.append({"index": i, "status": 404, "id": p.id, "error": NOT_FOUND})
+
+        else:
+
+            results.append({"index": i, "status": 200, "id": t.id, "task": t.to_task()})
+
+    return bulk_result(results)
+
+def deleted_result(valid: List[Tuple[int, int]], errors: Dict[int, list], removed: List[bool]) -> Dict[str, Any]:
+
+    results = [{"index": i, "status": 422, "error": err} for i, err in errors.items()]
+
+    results += [
+        {"index": i, "status": 200, "id": task_id} if ok
+        else {"index": i, "status": 404, "id": task_id, "error": NOT_FOUND}
+        for (i, task_id), ok in zip(valid, removed)
+    ]
+
+    return bulk_result(results)
+
+@timed_phase("serialization")
+
+def bulk_response(result: Dict[str, Any]) -> Response:
+
+    return json_response(BulkResult.model_validate(result).model_dump_json().encode())
+
+def idempotency_begin(scope: str, idempotency_key: str, payload: bytes) -> Tuple[Hashable, str, Optional[Response]]:
+
+    # 同じキーの保存済み応答があれば (キー, 指紋, その応答)、無ければ応答は None（処理中として登録済み）
+    # (key, fingerprint, stored response) for a retry; the response is None for a new key, now marked in progress
+
+    key, digest = (scope, idempotency_key), fingerprint(payload)
+
+    try:
+
+        stored = idempotency_cache.begin(key, digest)
+
+    except IdempotencyConflict:
+
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A request with this Idempotency-Key is still in progress")
+
+    except IdempotencyMismatch:
+
+        raise HTTPException(
+            status_code=422,
+            detail="This Idempotency-Key was already used with a different request body",
+        )
+
+    if stored is None:
+
+        return key, digest, None
+
+    status_code, body, headers = stored
+
+    return key, digest, Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={**headers, IDEMPOTENT_REPLAYED_HEADER: "true"},
+    )
+
+def idempotency_complete(key: Hashable, digest: str, response: Response) -> Response:
+
+    # 成功した応答だけ保存する（失敗は同じキーでやり直せるように）
+    # only successful responses are stored, so a failed request can be retried with the same key
+
+    if 200 <= response.status_code < 300:
+
+        headers = {name: response.headers[name] for name in (ETAG_HEADER,) if name in response.headers}
+
+        idempotency_cache.complete(key, digest, (response.status_code, response.body, headers))
+
+    else:
+
+        idempotency_cache.release(key)
+
+    return response
+
+def bulk_fingerprint(items: List[Any]) -> bytes:
+
+    return json.dumps(items, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
@@ -0,0 +1,188 @@
+# app/routers/feed.py
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Query, status
+
+from fastapi.responses import StreamingResponse
+
+from app.feed import Change, ChangesGone, change_feed
+
+from app.metrics import route_class
+
+from app.routers.common import MAX_PAGE_SIZE
+
+from app.schemes import TaskChange, TaskChanges
+
+from app.storage_async import get_async_repository
+
+# 変更フィード（app/feed.py）の API。同期・async どちらのルーター構成でも同じものを使う。
+# /tasks/{task_id} に吸い込まれないよう、main.py ではタスクのルーターより先に登録する。
+#   GET /tasks/changes?since=N          : N より後の変更（JSON）。古すぎる・再起動前の since は 410
+#   GET /tasks/changes/stream?since=N   : 同じ変更を Server-Sent Events で流し続ける
+# API for the change feed (app/feed.py), shared by the sync and async router setups.
+# main.py registers it before the tasks router so /tasks/{task_id} does not catch it.
+#   GET /tasks/changes?since=N        : changes after N as JSON; 410 when N is too old or from before a restart
+#   GET /tasks/changes/stream?since=N : the same changes as a Server-Sent Events stream
+
+router = APIRouter(prefix="/tasks", tags=["tasks"], route_class=route_class)
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# SSE で接続を保つためのコメントを送る間隔（秒）
+# seconds between keep-alive comments on an idle SSE stream
+
+SSE_KEEPALIVE = 15.0
+
+def _resync_required(gone: ChangesGone) -> HTTPException:
+
+    return HTTPException(
+        status_code=status.HTTP_410_GONE,
+        detail={
+            "message": "Changes since this point are no longer available; reload GET /tasks/ and continue from last_seq",
+            "epoch": gone.epoch,
+            "last_seq": gone.last_seq,
+        },
+    )
+
+async def _with_tasks(changes: List[Change]) -> List[Dict[str, Any]]:
+
+    # 各変更に現在のタスクを付ける（同じ id は1回だけ読む）
+    # attach each task's current state (each id is read once)
+
+    repo = get_async_repository()
+
+    tasks: Dict[int, Any] = {}
+
+    for _, op, task_id in changes:
+
+        if task_id not in tasks:
+
+            record = await repo.get(task_id)
+
+            tasks[task_id] = record.to_task() if record is not None else None
+
+    return [{"seq": seq, "op": op, "id": task_id, "task": tasks[task_id]} for seq, op, task_id in changes]
+
+@router.get("/changes", response_model=TaskChanges)
+
+async def list_changes(
+
+    since: int = Query(0, ge=0),
+
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+
+    epoch: Optional[str] = None,
+
+) -> Dict[str, Any]:
+
+    # since より後の変更を古い順に返す。続きは since=last_seq で読む
+    # changes after `since`, oldest first; continue with since=last_seq
+
+    # epoch を省略した時は今の epoch として読む（読む前に作り直されていれば 410）
+    # without an epoch, read as the current one (410 if the feed is reset before the read)
+
+    current = change_feed.epoch if epoch is None else epoch
+
+    try:
+
+        changes = change_feed.read(since, limit, epoch=current)
+
+    except ChangesGone as gone:
+
+        raise _resync_required(gone)
+
+    return {
+        "epoch": current,
+        "last_seq": changes[-1][0] if changes else since,
+        "changes": await _with_tasks(changes),
+    }
+
+def _parse_event_id(last_event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+
+    # SSE のイベント id は "<epoch>:<seq>"
+    # SSE event ids are "<epoch>:<seq>"
+
+    if not last_event_id:
+
+        return None
+
+    epoch, _, seq = last_event_id.rpartition(":")
+
+    return (epoch, int(seq)) if seq.isdigit() else None
+
+def _sse(event: str, data: str, event_id: Optional[str] = None) -> bytes:
+
+    lines = [f"id: {event_id}"] if event_id else []
+
+    lines += [f"event: {event}", f"data: {data}", "", ""]
+
+    return "\n".join(lines).encode("utf-8")
+
+@router.get("/changes/stream")
+
+async def stream_changes(
+
+    since: Optional[int] = Query(None, ge=0),
+
+    last_event_id: Optional[str] = Header(None),
+
+) -> StreamingResponse:
+
+    # 変更を SSE で流す。再接続時はブラウザが送る Last-Event-ID から続ける。
+    # 続けられない場合（古すぎる・再起動前）は resync イベントを送り、現在の位置から流す
+    # stream changes as SSE. on reconnect, continue from the Last-Event-ID the browser sends.
+    # when that is impossible (too old, before a restart) a resync event is sent and the
+    # stream continues from the current position
+
+    resume = _parse_event_id(last_event_id)
+
+    if resume is not None:
+
+        epoch, position = resume
+
+    else:
+
+        epoch, position = change_feed.epoch, change_feed.last_seq if since is None else since
+
+    async def events() -> AsyncIterator[bytes]:
+
+        nonlocal epoch, position
+
+        while True:
+
+            # 続けられない位置（再起動前・リポジトリの作り直し・読む前にバッファから押し出された）なら resync
+            # resync when the position cannot be continued (before a restart, a recreated
+            # repository, or overwritten in the buffer before this subscriber read it)
+
+            if epoch != change_feed.epoch or not change_feed.available(position):
+
+                epoch, position = change_feed.epoch, change_feed.last_seq
+
+                yield _sse("resync", f'{{"epoch": "{epoch}", "last_seq": {position}}}')
+
+            if not await change_feed.wait(position, SSE_KEEPALIVE):
+
+                yield b": keep-alive\n\n"
+
+                continue
+
+            try:
+
+                changes = change_feed.read(position, MAX_PAGE_SIZE, epoch=epoch)
+
+            except ChangesGone:
+
+                continue
+
+            for change in await _with_tasks(changes):
+
+                yield _sse(change["op"], TaskChange(**change).model_dump_json(), f"{epoch}:{change['seq']}")
+
+            position = changes[-1][0]
+
+    return StreamingResponse(
+        events(),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,108 +1,384 @@
 # app/routers/tasks.py
 
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Response, status
 
-from app.schemes import Task, TaskCreate, TaskUpdate
+from fastapi.responses import StreamingResponse
 
-from app.storage import tasks, alloc_id, find_index
+from app.cache import response_cache
 
-router = APIRouter(prefix="/tasks", tags=["tasks"])
+from app.idempotency import idempotency_cache
+
+from app.metrics import route_class
+
+from app.routers.common import (
+    ETAG_HEADER,
+    EXPORT_CHUNK_SIZE,
+    MAX_IDEMPOTENCY_KEY_LENGTH,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_OFFSET,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    SEARCH_PAGE_SIZE,
+    bulk_fingerprint,
+    bulk_response,
+    changed_fields,
+    collection_etag,
+    create_batch,
+    created_result,
+    delete_batch,
+    deleted_result,
+    dump_ndjson,
+    dump_task,
+    dump_tasks,
+    encode_cursor,
+    idempotency_begin,
+    idempotency_complete,
+    if_match_versions,
+    json_response,
+    not_modified,
+    not_modified_response,
+    page_query,
+    precondition_failed,
+    search_response,
+    task_etag,
+    task_response,
+    update_batch,
+    updated_result,
+    validate_batch,
+)
+
+from app.schemes import MAX_BULK_ITEMS, BulkResult, Task, TaskCreate, TaskUpdate
+
+from app.storage import SortOrder, VersionConflict, get_repository
+
+router = APIRouter(prefix="/tasks", tags=["tasks"], route_class=route_class)
+
+def _idempotent(scope: str, idempotency_key: Optional[str], payload: bytes, handler: Callable[[], Response]) -> Response:
+
+    # Idempotency-Key があれば、同じキーの再送に保存済みの応答を返す
+    # with an Idempotency-Key, a retry with the same key gets the stored response
+
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return handler()
+
+    key, digest, replay = idempotency_begin(scope, idempotency_key, payload)
+
+    if replay is not None:
+
+        return replay
+
+    try:
+
+        response = handler()
+
+    except BaseException:
+
+        idempotency_cache.release(key)
+
+        raise
+
+    return idempotency_complete(key, digest, response)
 
 @router.post("/", response_model=Task, status_code=status.HTTP_201_CREATED)
 
-def create_task(payload: TaskCreate) -> Task:
+def create_task(
+
+    payload: TaskCreate,
+
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+
+) -> Task:
+
+    # タスクを新規作成（idはサーバー側で採番、completedはFalse固定）。Idempotency-Key 付きの再送は最初の応答を返す
+    # create new task. a retry carrying the same Idempotency-Key gets the first response back
+
+    repo = get_repository()
+
+    def create() -> Response:
+
+        return task_response(repo, repo.create(payload.title, payload.description), status.HTTP_201_CREATED)
+
+    # 本文の指紋（再シリアライズ）はキー付きの時だけ作る
+    # the body fingerprint (a re-serialisation) is only built for requests with a key
+
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return create()
+
+    return _idempotent("create", idempotency_key, payload.model_dump_json().encode(), create)
+
+@router.post("/bulk", response_model=BulkResult)
+
+def create_tasks_bulk(
 
-    # タスクを新規作成（idはサーバー側で採番、completedはFalse固定）
-    # create new task
-    
-    
+    items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS),
 
-    new_task = Task(
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
 
-        id=alloc_id(),
+) -> Dict[str, Any]:
 
-        title=payload.title,
+    # 複数タスクを一括作成。id はまとめて予約し、ストレージへは1回で反映する。結果は行ごとに返す
+    # create many tasks at once: ids are reserved as one block and applied to storage in one pass
 
-        description=payload.description,
+    def create() -> Any:
 
-        completed=False,
+        valid, errors = validate_batch(create_batch, items)
 
-    )
+        created = get_repository().create_many([(p.title, p.description) for _, p in valid])
 
-    tasks.append(new_task)
+        return created_result(valid, errors, created)
 
-    return new_task
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return create()
+
+    return _idempotent("bulk_create", idempotency_key, bulk_fingerprint(items), lambda: bulk_response(create()))
+
+@router.patch("/bulk", response_model=BulkResult)
+
+def update_tasks_bulk(items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS)) -> Dict[str, Any]:
+
+    # 複数タスクを一括で部分更新（各行は id + 任意フィールド）。存在しない id の行は 404
+    # partial update of many tasks (each row is id + any fields). rows with an unknown id get 404
+
+    valid, errors = validate_batch(update_batch, items)
+
+    changes = [(p.id, changed_fields(p)) for _, p in valid]
+
+    updated = get_repository().update_many(changes)
+
+    return updated_result(valid, errors, updated)
+
+@router.delete("/bulk", response_model=BulkResult)
+
+def delete_tasks_bulk(items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS)) -> Dict[str, Any]:
+
+    # id の配列で一括削除。存在しない id の行は 404、id として不正な行は 422
+    # delete many tasks by id. ids that do not exist get 404, rows that are not a valid id get 422
+
+    valid, errors = validate_batch(delete_batch, items)
+
+    removed = get_repository().remove_many([task_id for _, task_id in valid])
+
+    return deleted_result(valid, errors, removed)
 
 @router.get("/", response_model=List[Task])
 
-def list_tasks() -> List[Task]:
+def list_tasks(
+
+    completed: Optional[bool] = None,
+
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+
+    after_id: Optional[int] = Query(None, ge=0),
+
+    sort: SortOrder = "id",
+
+    cursor: Optional[str] = Query(None, max_length=2048),
+
+    min_id: Optional[int] = Query(None, ge=0),
+
+    max_id: Optional[int] = Query(None, ge=0),
+
+    if_none_match: Optional[str] = Header(None),
+
+) -> List[Task]:
+
+    # タスクを sort の順（id / -id / title / -title）の配列で返す。completed で絞り込み、
+    # min_id / max_id で id の範囲（両端を含む）に限る。limit/cursor でカーソルページング
+    # return tasks as an array in `sort` order (id, -id, title, -title). filter by completed,
+    # restrict to an inclusive id range with min_id / max_id, page with limit/cursor.
+    # 続きがある場合は次の cursor を X-Next-Cursor ヘッダーで返す（id 順では after_id にも使える）
+    # when more tasks follow, the next cursor is returned in the X-Next-Cursor header (in id order it also works as after_id)
+    # ETag はストア全体のバージョンから作り、If-None-Match が一致すれば 304 を返す
+    # the ETag comes from the store-wide version; a matching If-None-Match gets 304
+
+    # 同じ条件の一覧はシリアライズ済みの JSON をキャッシュから返す（書き込みで無効化）
+    # identical list queries are served from the pre-serialised cache (invalidated on write)
+
+    query = page_query(sort, after_id, cursor, min_id, max_id)
+
+    key = ("page", completed, limit, *query.values())
+
+    cached = response_cache.get(key)
+
+    if cached is not None:
 
-    # 全タスクを配列で返す
-    # return all tasks as an array
-    return tasks
+        if not_modified(if_none_match, cached[1][ETAG_HEADER]):
+
+            return not_modified_response(cached[1][ETAG_HEADER])
+
+        return json_response(*cached)
+
+    repo = get_repository()
+
+    generation = response_cache.generation
+
+    # バージョンはページより先に読む（間に書き込みが入っても、ETag が古い側にずれるだけ）
+    # read the version before the page, so a racing write can only make the ETag stale, never ahead
+
+    etag = collection_etag(repo.epoch, repo.collection_version())
+
+    if not_modified(if_none_match, etag):
+
+        return not_modified_response(etag)
+
+    items, next_cursor = repo.page(limit=limit, completed=completed, **query)
+
+    body = dump_tasks(items)
+
+    headers = {ETAG_HEADER: etag}
+
+    if next_cursor is not None:
+
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, items[-1])
+
+    response_cache.put(key, body, headers, generation)
+
+    return json_response(body, headers)
+
+@router.get("/search", response_model=List[Task])
+
+def search_tasks(
+
+    q: str = Query(..., min_length=1, max_length=200),
+
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+
+) -> List[Task]:
+
+    # タイトル・説明を全文検索し、関連度順に返す（q の語をすべて含むタスク。日本語も可）
+    # full-text search over title and description, in relevance order (tasks containing every word of q; Japanese works too)
+    # 一致総数は X-Total-Count、次ページの offset は X-Next-Cursor ヘッダーで返す
+    # the total match count is in X-Total-Count and the next page's offset in X-Next-Cursor
+
+    items, total = get_repository().search(q, limit, offset)
+
+    return search_response(items, total, offset)
+
+def _export_chunks(completed: Optional[bool]) -> Iterator[bytes]:
+
+    # ストレージをカーソルで少しずつ読み、1行1タスクの JSON にして返す（全件をメモリに載せない）
+    # Walk storage by cursor and yield one JSON line per task, never holding the whole store
+
+    repo = get_repository()
+
+    after_id: Optional[int] = None
+
+    while True:
+
+        items, after_id = repo.page(limit=EXPORT_CHUNK_SIZE, after_id=after_id, completed=completed)
+
+        if items:
+
+            yield dump_ndjson(items)
+
+        if after_id is None:
+
+            return
+
+@router.get("/export", response_class=StreamingResponse)
+
+def export_tasks(completed: Optional[bool] = None) -> StreamingResponse:
+
+    # 全タスクを NDJSON でストリーミング出力（メモリ使用量と最初のバイトまでの時間は件数に依存しない）
+    # stream every task as NDJSON; memory use and time-to-first-byte do not grow with the store
+
+    return StreamingResponse(_export_chunks(completed), media_type=NDJSON_MEDIA_TYPE)
 
 @router.get("/{task_id}", response_model=Task)
 
-def get_task(task_id: int) -> Task:
+def get_task(task_id: int, if_none_match: Optional[str] = Header(None)) -> Task:
 
-    # id指定で単一タスクを返す。無ければ404
-    # return a single task by id. if no task exist return 404
+    # id指定で単一タスクを返す。無ければ404。If-None-Match が ETag と一致すれば 304
+    # return a single task by id. if no task exist return 404. 304 when If-None-Match matches the ETag
 
-    idx = find_index(task_id)
+    cached = response_cache.get(("task", task_id))
 
-    if idx is None:
+    if cached is not None:
 
-        raise HTTPException(status_code=404, detail="Task not found")
+        if not_modified(if_none_match, cached[1][ETAG_HEADER]):
 
-    return tasks[idx]
+            return not_modified_response(cached[1][ETAG_HEADER])
 
-@router.put("/{task_id}", response_model=Task)
+        return json_response(*cached)
 
-def update_task(task_id: int, payload: TaskUpdate) -> Task:
+    repo = get_repository()
 
-    # 任意フィールド（title/description/completed）の部分更新。無ければ404
-    # partial update of any field (title/description/completed) .if no task exist return 404
+    generation = response_cache.generation
 
-    idx = find_index(task_id)
+    record = repo.get(task_id)
 
-    if idx is None:
+    if record is None:
 
         raise HTTPException(status_code=404, detail="Task not found")
 
-    current = tasks[idx]
+    etag = task_etag(repo, record)
+
+    if not_modified(if_none_match, etag):
+
+        return not_modified_response(etag)
+
+    body = dump_task(record)
+
+    headers = {ETAG_HEADER: etag}
+
+    response_cache.put(("task", task_id), body, headers, generation)
+
+    return json_response(body, headers)
+
+@router.put("/{task_id}", response_model=Task)
+
+def update_task(task_id: int, payload: TaskUpdate, if_match: Optional[str] = Header(None)) -> Task:
+
+    # 任意フィールド（title/description/completed）の部分更新。無ければ404
+    # partial update of any field (title/description/completed) .if no task exist return 404
+    # If-Match の ETag が現在のバージョンと違えば 412（楽観的排他制御）
+    # 412 when the If-Match ETag is not the current version (optimistic concurrency)
 
     # None（未指定）は無視。指定があれば上書き。
     # None will be ignored. if specified it will be overwritten
 
-    updated = current.copy(update={
+    repo = get_repository()
 
-        "title": payload.title if payload.title is not None else current.title,
+    try:
 
-        "description": payload.description if payload.description is not None else current.description,
+        updated = repo.update(task_id, changed_fields(payload), if_versions=if_match_versions(repo, task_id, if_match))
 
-        "completed": payload.completed if payload.completed is not None else current.completed,
+    except VersionConflict:
 
-    })
+        raise precondition_failed()
 
-    tasks[idx] = updated
+    if updated is None:
 
-    return updated
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return task_response(repo, updated)
 
 @router.delete("/{task_id}")
 
-def delete_task(task_id: int):
+def delete_task(task_id: int, if_match: Optional[str] = Header(None)):
 
-    # id指定で削除。無ければ404。成功時はメッセージを返す
-    # delete by id. if no task exist return 404. if succeseful return message 
-    idx = find_index(task_id)
+    # id指定で削除。無ければ404。成功時はメッセージを返す。If-Match は更新と同じ
+    # delete by id. if no task exist return 404. if succeseful return message. If-Match works as for update
+    repo = get_repository()
 
-    if idx is None:
+    try:
 
-        raise HTTPException(status_code=404, detail="Task not found")
+        removed = repo.remove(task_id, if_versions=if_match_versions(repo, task_id, if_match))
+
+    except VersionConflict:
 
-    del tasks[idx]
+        raise precondition_failed()
+
+    if not removed:
+
+        raise HTTPException(status_code=404, detail="Task not found")
 
     return {"message": "Task deleted successfully."}
  
\ No newline at end of file
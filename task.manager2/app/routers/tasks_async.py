@@ -0,0 +1,381 @@
+# app/routers/tasks_async.py
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Response, status
+
+from fastapi.concurrency import run_in_threadpool
+
+from fastapi.responses import StreamingResponse
+
+from app.cache import response_cache
+
+from app.idempotency import idempotency_cache
+
+from app.metrics import route_class
+
+from app.routers.common import (
+    ETAG_HEADER,
+    EXPORT_CHUNK_SIZE,
+    MAX_IDEMPOTENCY_KEY_LENGTH,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_OFFSET,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    SEARCH_PAGE_SIZE,
+    bulk_fingerprint,
+    bulk_response,
+    changed_fields,
+    collection_etag,
+    create_batch,
+    created_result,
+    delete_batch,
+    deleted_result,
+    dump_ndjson,
+    dump_task,
+    dump_tasks,
+    encode_cursor,
+    idempotency_begin,
+    idempotency_complete,
+    if_match_versions,
+    json_response,
+    not_modified,
+    not_modified_response,
+    page_query,
+    precondition_failed,
+    search_response,
+    task_etag,
+    task_response,
+    update_batch,
+    updated_result,
+    validate_batch,
+)
+
+from app.schemes import MAX_BULK_ITEMS, BulkResult, Task, TaskCreate, TaskUpdate
+
+from app.storage import SortOrder, VersionConflict
+
+from app.storage_async import get_async_repository
+
+# app/routers/tasks.py と同じ API を async def で実装したもの（TASK_ROUTES=async で有効）。
+# ハンドラーがイベントループ上で動くので、Starlette のスレッドプールへの受け渡しが無い。
+# 共通の処理（ETag・カーソル・一括結果の組み立て）は同期版と同じ app/routers/common.py を使う。
+# The same API as app/routers/tasks.py implemented with async def (enabled by
+# TASK_ROUTES=async). Handlers run on the event loop, so there is no hop through
+# Starlette's threadpool. Shared logic (ETags, cursors, bulk results) comes from
+# app/routers/common.py, like the sync router's.
+
+router = APIRouter(prefix="/tasks", tags=["tasks"], route_class=route_class)
+
+async def _idempotent(
+    scope: str,
+    idempotency_key: Optional[str],
+    payload: bytes,
+    handler: Callable[[], Awaitable[Response]],
+) -> Response:
+
+    # 同期版の _idempotent と同じ（Idempotency-Key の再送には保存済みの応答を返す）
+    # same as the sync _idempotent: a retry with the same Idempotency-Key gets the stored response
+
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return await handler()
+
+    key, digest, replay = idempotency_begin(scope, idempotency_key, payload)
+
+    if replay is not None:
+
+        return replay
+
+    try:
+
+        response = await handler()
+
+    except BaseException:
+
+        idempotency_cache.release(key)
+
+        raise
+
+    return idempotency_complete(key, digest, response)
+
+@router.post("/", response_model=Task, status_code=status.HTTP_201_CREATED)
+
+async def create_task(
+
+    payload: TaskCreate,
+
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+
+) -> Task:
+
+    # タスクを新規作成（idはサーバー側で採番、completedはFalse固定）。Idempotency-Key 付きの再送は最初の応答を返す
+    # create new task. a retry carrying the same Idempotency-Key gets the first response back
+
+    repo = get_async_repository()
+
+    async def create() -> Response:
+
+        return task_response(repo, await repo.create(payload.title, payload.description), status.HTTP_201_CREATED)
+
+    # 本文の指紋（再シリアライズ）はキー付きの時だけ作る
+    # the body fingerprint (a re-serialisation) is only built for requests with a key
+
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return await create()
+
+    return await _idempotent("create", idempotency_key, payload.model_dump_json().encode(), create)
+
+@router.post("/bulk", response_model=BulkResult)
+
+async def create_tasks_bulk(
+
+    items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS),
+
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+
+) -> Dict[str, Any]:
+
+    # 一括作成。最大 MAX_BULK_ITEMS 件の検証は重いのでスレッドプールで行い、イベントループを止めない
+    # bulk create. validating up to MAX_BULK_ITEMS rows is CPU-heavy, so it runs in the threadpool
+
+    async def create() -> Any:
+
+        valid, errors = await run_in_threadpool(validate_batch, create_batch, items)
+
+        created = await get_async_repository().create_many([(p.title, p.description) for _, p in valid])
+
+        return created_result(valid, errors, created)
+
+    if idempotency_key is None or not idempotency_cache.enabled:
+
+        return await create()
+
+    async def create_response() -> Response:
+
+        return bulk_response(await create())
+
+    return await _idempotent("bulk_create", idempotency_key, bulk_fingerprint(items), create_response)
+
+@router.patch("/bulk", response_model=BulkResult)
+
+async def update_tasks_bulk(items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS)) -> Dict[str, Any]:
+
+    # 一括部分更新（各行は id + 任意フィールド）。存在しない id の行は 404
+    # bulk partial update (each row is id + any fields). rows with an unknown id get 404
+
+    valid, errors = await run_in_threadpool(validate_batch, update_batch, items)
+
+    updated = await get_async_repository().update_many([(p.id, changed_fields(p)) for _, p in valid])
+
+    return updated_result(valid, errors, updated)
+
+@router.delete("/bulk", response_model=BulkResult)
+
+async def delete_tasks_bulk(items: List[Any] = Body(..., max_length=MAX_BULK_ITEMS)) -> Dict[str, Any]:
+
+    # id の配列で一括削除。存在しない id の行は 404、id として不正な行は 422
+    # delete many tasks by id. ids that do not exist get 404, rows that are not a valid id get 422
+
+    valid, errors = await run_in_threadpool(validate_batch, delete_batch, items)
+
+    removed = await get_async_repository().remove_many([task_id for _, task_id in valid])
+
+    return deleted_result(valid, errors, removed)
+
+@router.get("/", response_model=List[Task])
+
+async def list_tasks(
+
+    completed: Optional[bool] = None,
+
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+
+    after_id: Optional[int] = Query(None, ge=0),
+
+    sort: SortOrder = "id",
+
+    cursor: Optional[str] = Query(None, max_length=2048),
+
+    min_id: Optional[int] = Query(None, ge=0),
+
+    max_id: Optional[int] = Query(None, ge=0),
+
+    if_none_match: Optional[str] = Header(None),
+
+) -> List[Task]:
+
+    # 一覧（並び順・範囲・ページング・絞り込み・ETag・キャッシュの扱いは同期版と同じ）
+    # list tasks (order, range, paging, filter, ETag and cache behave as in the sync router)
+
+    query = page_query(sort, after_id, cursor, min_id, max_id)
+
+    key = ("page", completed, limit, *query.values())
+
+    cached = await response_cache.get_async(key)
+
+    if cached is not None:
+
+        if not_modified(if_none_match, cached[1][ETAG_HEADER]):
+
+            return not_modified_response(cached[1][ETAG_HEADER])
+
+        return json_response(*cached)
+
+    repo = get_async_repository()
+
+    generation = response_cache.generation
+
+    etag = collection_etag(repo.epoch, await repo.collection_version())
+
+    if not_modified(if_none_match, etag):
+
+        return not_modified_response(etag)
+
+    items, next_cursor = await repo.page(limit=limit, completed=completed, **query)
+
+    body = dump_tasks(items)
+
+    headers = {ETAG_HEADER: etag}
+
+    if next_cursor is not None:
+
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, items[-1])
+
+    response_cache.put(key, body, headers, generation)
+
+    return json_response(body, headers)
+
+@router.get("/search", response_model=List[Task])
+
+async def search_tasks(
+
+    q: str = Query(..., min_length=1, max_length=200),
+
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+
+) -> List[Task]:
+
+    # 全文検索（関連度順・ヘッダーの扱いは同期版と同じ）
+    # full-text search (ranking and headers as in the sync router)
+
+    items, total = await get_async_repository().search(q, limit, offset)
+
+    return search_response(items, total, offset)
+
+async def _export_chunks(completed: Optional[bool]) -> AsyncIterator[bytes]:
+
+    repo = get_async_repository()
+
+    after_id: Optional[int] = None
+
+    while True:
+
+        items, after_id = await repo.page(limit=EXPORT_CHUNK_SIZE, after_id=after_id, completed=completed)
+
+        if items:
+
+            yield dump_ndjson(items)
+
+        if after_id is None:
+
+            return
+
+@router.get("/export", response_class=StreamingResponse)
+
+async def export_tasks(completed: Optional[bool] = None) -> StreamingResponse:
+
+    # 全タスクを NDJSON でストリーミング出力
+    # stream every task as NDJSON
+
+    return StreamingResponse(_export_chunks(completed), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/{task_id}", response_model=Task)
+
+async def get_task(task_id: int, if_none_match: Optional[str] = Header(None)) -> Task:
+
+    # id指定で単一タスクを返す。無ければ404。If-None-Match が ETag と一致すれば 304
+    # return a single task by id. if no task exist return 404. 304 when If-None-Match matches the ETag
+
+    cached = await response_cache.get_async(("task", task_id))
+
+    if cached is not None:
+
+        if not_modified(if_none_match, cached[1][ETAG_HEADER]):
+
+            return not_modified_response(cached[1][ETAG_HEADER])
+
+        return json_response(*cached)
+
+    repo = get_async_repository()
+
+    generation = response_cache.generation
+
+    record = await repo.get(task_id)
+
+    if record is None:
+
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    etag = task_etag(repo, record)
+
+    if not_modified(if_none_match, etag):
+
+        return not_modified_response(etag)
+
+    body = dump_task(record)
+
+    headers = {ETAG_HEADER: etag}
+
+    response_cache.put(("task", task_id), body, headers, generation)
+
+    return json_response(body, headers)
+
+@router.put("/{task_id}", response_model=Task)
+
+async def update_task(task_id: int, payload: TaskUpdate, if_match: Optional[str] = Header(None)) -> Task:
+
+    # 部分更新。無ければ404、If-Match が現在のバージョンと違えば 412
+    # partial update. 404 if the task does not exist, 412 if If-Match is not the current version
+
+    repo = get_async_repository()
+
+    try:
+
+        updated = await repo.update(task_id, changed_fields(payload), if_versions=if_match_versions(repo, task_id, if_match))
+
+    except VersionConflict:
+
+        raise precondition_failed()
+
+    if updated is None:
+
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return task_response(repo, updated)
+
+@router.delete("/{task_id}")
+
+async def delete_task(task_id: int, if_match: Optional[str] = Header(None)):
+
+    # id指定で削除。無ければ404。成功時はメッセージを返す
+    # delete by id. if no task exist return 404. if succeseful return message
+
+    repo = get_async_repository()
+
+    try:
+
+        removed = await repo.remove(task_id, if_versions=if_match_versions(repo, task_id, if_match))
+
+    except VersionConflict:
+
+        raise precondition_failed()
+
+    if not removed:
+
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return {"message": "Task deleted successfully."}
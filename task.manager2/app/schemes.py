@@ -1,9 +1,14 @@
 # app/schemas.py
 
-from typing import Optional
+from typing import Annotated, List, Optional, Union
 
 from pydantic import BaseModel, Field
 
+# 一括APIで1リクエストに含められる最大件数
+# max rows per request for the bulk endpoints
+
+MAX_BULK_ITEMS = 10000
+
 class Task(BaseModel):
 
    #  レスポンス用：サーバーが返す完全なタスク形
@@ -35,4 +40,76 @@ class TaskUpdate(BaseModel):
     description: Optional[str] = Field(None, max_length=2000)
 
     completed: Optional[bool] = None
- 
\ No newline at end of file
+
+class TaskBulkUpdateItem(TaskUpdate):
+
+   #  一括更新の1件分：更新対象の id と任意フィールド
+   #  one row of a bulk update: target id plus any of the update fields
+
+    id: int = Field(..., ge=1)
+
+#  一括削除の1件分：削除する id（リクエストは作成・更新と同じく最上位が配列）
+#  one row of a bulk delete: the id to delete (the body is a top-level array, as for create and update)
+
+TaskBulkDeleteItem = Annotated[int, Field(ge=1)]
+
+class BulkItemError(BaseModel):
+
+   #  一括処理の1件分のエラー。422 の検証エラーと同じ形（loc / msg / type）で、404 も同じ形で返す
+   #  one error of a bulk row, shaped like a 422 validation error (loc / msg / type); 404 rows use it too
+
+    loc: List[Union[str, int]]
+
+    msg: str
+
+    type: str
+
+class BulkItemResult(BaseModel):
+
+   #  一括処理の1件ごとの結果（status は単体APIと同じHTTPステータス）
+   #  per-row result of a bulk call (status is the code the single-item API would return)
+
+    index: int = Field(..., description="リクエスト配列内の位置")
+
+    status: int
+
+    id: Optional[int] = None
+
+    task: Optional[Task] = None
+
+    error: Optional[List[BulkItemError]] = None
+
+class BulkResult(BaseModel):
+
+   #  一括処理のレスポンス：成功・失敗件数と1件ごとの結果
+   #  bulk response: success/failure counts and per-row results
+
+    succeeded: int
+
+    failed: int
+
+    results: List[BulkItemResult]
+
+class TaskChange(BaseModel):
+
+   #  変更フィードの1件：操作（create / update / delete）と対象 id。task は読み取り時点の内容（削除済みなら null）
+   #  one change-feed entry: operation (create / update / delete) and id; task is its state when read (null once deleted)
+
+    seq: int
+
+    op: str
+
+    id: int
+
+    task: Optional[Task] = None
+
+class TaskChanges(BaseModel):
+
+   #  変更フィードのレスポンス：次回は since=last_seq で続きを読む
+   #  change-feed response: read on with since=last_seq
+
+    epoch: str
+
+    last_seq: int
+
+    changes: List[TaskChange]
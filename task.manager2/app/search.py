@@ -0,0 +1,206 @@
+# app/search.py
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# タイトルと説明の全文検索（転置インデックス）
+#   トークン化: NFKC 正規化 + 小文字化のあと、英数字などは単語ごと、
+#              日本語（ひらがな・カタカナ・漢字）の連続は 2 文字ずつ（バイグラム）に区切る。
+#              1 文字だけの検索語にも当たるよう、索引側には 1 文字のトークンも入れる。
+#   検索: 検索語のトークンをすべて含むタスク（AND）を BM25 で順位付けする。タイトルの一致は 2 倍に数える。
+# Full-text search over title and description (inverted index).
+#   Tokens: after NFKC normalisation and lower-casing, words for Latin text and
+#           digits, and overlapping two-character grams (bigrams) for runs of
+#           Japanese (hiragana, katakana, kanji). Single characters are indexed as
+#           well, so one-character queries match.
+#   Search: tasks containing every query token (AND), ranked with BM25; a match in
+#           the title counts twice.
+
+TITLE_WEIGHT = 2
+
+# ひらがな・カタカナ、CJK 統合漢字（拡張A・互換を含む）、々〆
+# hiragana/katakana, CJK unified ideographs (incl. extension A and compatibility), 々〆
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3005\u3006"
+
+_TOKEN = re.compile(f"([{_CJK}]+)|([^\\W_{_CJK}]+)")
+
+# BM25 のパラメータ（一般的な既定値）
+# BM25 parameters (the usual defaults)
+
+_K1 = 1.2
+
+_B = 0.75
+
+
+def tokenize(text: Optional[str], query: bool = False) -> List[str]:
+
+    # query=True では日本語はバイグラムだけ（1 文字の時はその 1 文字）にする
+    # With query=True, Japanese runs give only bigrams (or the character itself when alone)
+
+    if not text:
+
+        return []
+
+    tokens: List[str] = []
+
+    for cjk, word in _TOKEN.findall(unicodedata.normalize("NFKC", text).lower()):
+
+        if word:
+
+            tokens.append(word)
+
+        elif len(cjk) == 1:
+
+            tokens.append(cjk)
+
+        else:
+
+            if not query:
+
+                tokens.extend(cjk)
+
+            tokens.extend(cjk[i : i + 2] for i in range(len(cjk) - 1))
+
+    return tokens
+
+
+def document_terms(title: str, description: Optional[str]) -> Dict[str, int]:
+
+    # トークンごとの出現回数（タイトルは TITLE_WEIGHT 倍）
+    # Occurrences per token, with title tokens counted TITLE_WEIGHT times
+
+    terms: Dict[str, int] = {}
+
+    for token in tokenize(title):
+
+        terms[token] = terms.get(token, 0) + TITLE_WEIGHT
+
+    for token in tokenize(description):
+
+        terms[token] = terms.get(token, 0) + 1
+
+    return terms
+
+
+class SearchIndex:
+
+    # トークン → {タスク id: 出現回数} の転置インデックス。書き込みのたびに差分で更新する
+    # Inverted index token -> {task id: occurrences}, updated incrementally on every write
+
+    def __init__(self) -> None:
+
+        self._postings: Dict[str, Dict[int, int]] = {}
+
+        self._docs: Dict[int, Dict[str, int]] = {}
+
+        self._lengths: Dict[int, int] = {}
+
+        self._total_length = 0
+
+        self._lock = threading.Lock()
+
+    def add(self, task_id: int, title: str, description: Optional[str]) -> None:
+
+        # 既に入っていれば置き換える
+        # Replaces the task if it is already indexed
+
+        terms = document_terms(title, description)
+
+        with self._lock:
+
+            self._remove(task_id)
+
+            for token, count in terms.items():
+
+                self._postings.setdefault(token, {})[task_id] = count
+
+            length = sum(terms.values())
+
+            self._docs[task_id] = terms
+
+            self._lengths[task_id] = length
+
+            self._total_length += length
+
+    def add_many(self, items: Iterable[Tuple[int, str, Optional[str]]]) -> None:
+
+        for task_id, title, description in items:
+
+            self.add(task_id, title, description)
+
+    def remove(self, task_id: int) -> None:
+
+        with self._lock:
+
+            self._remove(task_id)
+
+    def _remove(self, task_id: int) -> None:
+
+        terms = self._docs.pop(task_id, None)
+
+        if terms is None:
+
+            return
+
+        for token in terms:
+
+            posting = self._postings[token]
+
+            del posting[task_id]
+
+            if not posting:
+
+                del self._postings[token]
+
+        self._total_length -= self._lengths.pop(task_id)
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[int], int]:
+
+        # (スコア順の id の offset 件目から limit 件, 一致した総数)。同点は id 昇順
+        # (ids ranked by score, `limit` of them from `offset`; total matches). Ties go by id
+
+        tokens = set(tokenize(query, query=True))
+
+        if not tokens:
+
+            return [], 0
+
+        with self._lock:
+
+            postings = [self._postings.get(token) for token in tokens]
+
+            if not all(postings):
+
+                return [], 0
+
+            # 一番短いポスティングから候補を取り、残りで絞り込む
+            # Take candidates from the shortest posting list and filter by the others
+
+            postings.sort(key=len)
+
+            matches = [task_id for task_id in postings[0] if all(task_id in p for p in postings[1:])]
+
+            count = len(self._docs)
+
+            average = self._total_length / count
+
+            idf = [math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+
+            def score(task_id: int) -> float:
+
+                norm = _K1 * (1 - _B + _B * self._lengths[task_id] / average)
+
+                return sum(w * p[task_id] * (_K1 + 1) / (p[task_id] + norm) for w, p in zip(idf, postings))
+
+            ranked = heapq.nsmallest(offset + limit, matches, key=lambda task_id: (-score(task_id), task_id))
+
+        return ranked[offset:], len(matches)
+
+    def __len__(self) -> int:
+
+        return len(self._docs)
@@ -1,42 +1,1148 @@
 # app/storage.py
 
-from typing import List, Optional
+import heapq
+import sys
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Container, Deque, Dict, Iterator, List, Literal, Optional, Tuple, get_args
 
+from .config import settings
 from .schemes import Task
 
-# メモリ上の簡易ストレージ（アプリ再起動で消える）
-# Simple storage in memory (disappears when the app is restarted)
+if TYPE_CHECKING:
 
-tasks: List[Task] = []
+    # 検索インデックスは最初の検索で作るので、import もその時まで遅らせる（起動時間）
+    # The search index is built on the first search, so its import waits until then (startup time)
 
-# 自動採番用のカウンタ
-# Automatic numbering counter
+    from .search import SearchIndex
 
-_next_id: int = 1
+# タスクの保存先はリポジトリインターフェース越しに扱う。実装は設定（TASK_STORAGE）で選ぶ
+#   memory: メモリ上の簡易ストレージ（TASK_JOURNAL_DIR を設定しなければアプリ再起動で消える）
+#   sqlite: SQLite ファイル（WAL モード、app/storage_sqlite.py）
+# Task storage is accessed through the repository interface; the implementation
+# is chosen by configuration (TASK_STORAGE):
+#   memory: simple storage in memory (lost on restart unless TASK_JOURNAL_DIR is set)
+#   sqlite: a SQLite file in WAL mode (app/storage_sqlite.py)
 
-def alloc_id() -> int:
+# 書き込みの通知先。各実装は書き込みが反映された後に (操作名, id の配列) で呼び出す。
+# 操作名は "create" / "update" / "delete"。レスポンスキャッシュの無効化などに使う
+# Write listeners. Every implementation calls them with (operation, ids) once a write
+# is visible; operation is "create", "update" or "delete". Used e.g. to invalidate
+# the response cache.
 
-   #  新しい一意IDを払い出す（1,2,3,... と連番）
-   # Issue a new unique ID (sequential numbers 1, 2, 3, ...)
+WriteListener = Callable[[str, List[int]], None]
 
-    global _next_id
+# 一覧の並び順。"-" 付きは降順。タイトルが同じタスクは id 順（降順なら id も降順）
+# List orders; a leading "-" means descending. Equal titles are ordered by id (descending too for "-title")
 
-    value = _next_id
+SortOrder = Literal["id", "-id", "title", "-title"]
 
-    _next_id += 1
+SORT_ORDERS: Tuple[str, ...] = get_args(SortOrder)
 
-    return value
+_write_listeners: List[WriteListener] = []
 
-def find_index(task_id: int) -> Optional[int]:
 
-   #  指定idのタスクが tasks の何番目にあるかを返す。見つからなければ None。
-   # Returns the position of the task with the specified id in tasks. If not found, returns None.
+def add_write_listener(listener: WriteListener) -> None:
 
-    for i, t in enumerate(tasks):
+    _write_listeners.append(listener)
 
-        if t.id == task_id:
 
-            return i
+class TaskRecord:
 
-    return None
- 
\ No newline at end of file
+    # ストレージ内部でのタスクの持ち方。__slots__ で属性辞書を持たず、タイトルは intern して
+    # 同じ文字列を共有する。Pydantic の Task はAPIへ返す時（to_task）にだけ組み立てる。
+    # version は作成時 1 で、更新のたびに 1 ずつ増える（ETag / If-Match に使う）。
+    # Internal representation of a task. __slots__ avoids a per-instance __dict__ and
+    # titles are interned so repeated titles share one string. The Pydantic Task is
+    # only built when a task reaches the API (to_task). `version` starts at 1 and
+    # grows by one on every update (used for ETag / If-Match).
+
+    __slots__ = ("id", "title", "description", "completed", "version")
+
+    def __init__(self, id: int, title: str, description: Optional[str], completed: bool, version: int = 1) -> None:
+
+        self.id = id
+
+        self.title = sys.intern(title)
+
+        self.description = description
+
+        self.completed = completed
+
+        self.version = version
+
+    def replace(self, changes: Dict[str, Any]) -> "TaskRecord":
+
+        # 変更を反映した新しいレコードを返す（読み手が途中の状態を見ないよう、元は書き換えない）
+        # Return a new record with `changes` applied; the original is never mutated,
+        # so lock-free readers always see a consistent task
+
+        return TaskRecord(
+            self.id,
+            changes.get("title", self.title),
+            changes.get("description", self.description),
+            changes.get("completed", self.completed),
+            self.version + 1,
+        )
+
+    def to_task(self) -> Task:
+
+        # 書き込み時に検証済みなので model_construct で検証なしに組み立てる
+        # Values were validated on write, so build the model without re-validation
+
+        return Task.model_construct(
+            id=self.id,
+            title=self.title,
+            description=self.description,
+            completed=self.completed,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+
+        # API の Task と同じフィールド・順序の dict（Task を組み立てずに app/responses.py の dumps で JSON にする）
+        # Dict with the API Task's fields in the same order, encoded by app/responses.py's
+        # dumps without building a Task
+
+        return {"id": self.id, "title": self.title, "description": self.description, "completed": self.completed}
+
+
+class VersionConflict(Exception):
+
+    # If-Match で指定されたバージョンと現在のバージョンが違う
+    # The version given with If-Match is not the current one
+
+    pass
+
+
+class JournalError(Exception):
+
+    # ログへの書き込み（write / fsync / セグメント切り替え）が失敗した。以後の書き込みはすべてこれで失敗する
+    # Writing the log (write / fsync / segment switch) failed; every later write fails with this too
+
+    pass
+
+
+class TaskRepository(ABC):
+
+    # ETag に含める識別子。メモリ実装は起動ごとに変わり、再起動前の ETag と一致しない
+    # Identifier included in ETags. The in-memory store gets a new one per start,
+    # so ETags issued before a restart never match.
+
+    epoch: str = ""
+
+    def _notify(self, operation: str, task_ids: List[int]) -> None:
+
+        if task_ids:
+
+            for listener in _write_listeners:
+
+                listener(operation, task_ids)
+
+    @abstractmethod
+    def create(self, title: str, description: Optional[str] = None) -> TaskRecord:
+
+        # 新しい id を採番してタスクを保存する（completed は False）
+        # Allocate a new id and store the task (completed is False)
+
+        ...
+
+    @abstractmethod
+    def get(self, task_id: int) -> Optional[TaskRecord]:
+
+        # 見つからなければ None
+        # Returns None if not found
+
+        ...
+
+    @abstractmethod
+    def update(
+        self,
+        task_id: int,
+        changes: Dict[str, Any],
+        if_versions: Optional[Container[int]] = None,
+    ) -> Optional[TaskRecord]:
+
+        # changes のフィールドだけを上書きして返す。無ければ None。
+        # if_versions を渡すと、現在のバージョンが含まれない時に VersionConflict
+        # Apply `changes` and return the updated task, or None if it does not exist.
+        # With if_versions, raises VersionConflict unless the current version is in it.
+
+        ...
+
+    @abstractmethod
+    def remove(self, task_id: int, if_versions: Optional[Container[int]] = None) -> bool:
+
+        # 削除できたら True（if_versions は update と同じ）
+        # True if the task was removed (if_versions as for update)
+
+        ...
+
+    @abstractmethod
+    def page(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        sort: str = "id",
+        after_title: Optional[str] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+    ) -> Tuple[List[TaskRecord], Optional[int]]:
+
+        # sort の順（SORT_ORDERS）でカーソルより後ろのタスクを最大 limit 件と、続きがあれば次のカーソル
+        # （ページ最後の id）を返す。カーソルは id 順なら after_id、タイトル順なら (after_title, after_id)。
+        # min_id / max_id は id の範囲（両端を含む）
+        # Up to `limit` tasks after the cursor in `sort` order (SORT_ORDERS), plus the next
+        # cursor (id of the page's last task) if more follow. The cursor is after_id in id
+        # order and (after_title, after_id) in title order. min_id / max_id bound the id range (inclusive).
+
+        ...
+
+    @abstractmethod
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[TaskRecord], int]:
+
+        # タイトル・説明の全文検索（app/search.py）。スコア順に offset 件目から最大 limit 件と、一致した総数
+        # Full-text search over title and description (app/search.py): up to `limit`
+        # matches from `offset` in rank order, plus the total number of matches
+
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+
+        ...
+
+    @abstractmethod
+    def collection_version(self) -> int:
+
+        # 書き込みのたびに増えるストア全体のバージョン（一覧の ETag に使う）
+        # Store-wide version, bumped by every write (used for the list ETag)
+
+        ...
+
+    # 一括操作。既定では1件ずつの操作を繰り返すだけなので、各実装で1パスの処理に置き換える
+    # Bulk operations. The defaults just loop over the single-item calls;
+    # implementations override them with a single-pass apply.
+
+    def create_many(self, items: List[Tuple[str, Optional[str]]]) -> List[TaskRecord]:
+
+        return [self.create(title, description) for title, description in items]
+
+    def update_many(self, items: List[Tuple[int, Dict[str, Any]]]) -> List[Optional[TaskRecord]]:
+
+        return [self.update(task_id, changes) for task_id, changes in items]
+
+    def remove_many(self, task_ids: List[int]) -> List[bool]:
+
+        return [self.remove(task_id) for task_id in task_ids]
+
+    def close(self) -> None:
+
+        # 接続などの後始末
+        # Release connections etc.
+
+        pass
+
+# ルーターは同期 def なのでスレッドプールから並行に呼ばれる。ロックの取り方は
+#   1. タスク単位のストライプロック（同じタスクへの読み取り→更新を直列化）
+#   2. インデックスロック（dict と二次インデックスの構造変更を保護、保持時間は短い）
+#   3. 全文検索インデックスのロック（app/search.py）
+# の順で、逆順には取らない。
+# The routers are sync defs, so the threadpool calls into the store concurrently.
+# Locks are always taken in this order, never the reverse:
+#   1. a per-task stripe lock (serialises read-modify-write on one task)
+#   2. the index lock (guards the dict and secondary indexes, held briefly)
+#   3. the full-text index lock (app/search.py)
+
+_LOCK_STRIPES = 64
+
+
+class _SortedList:
+
+    # 昇順のキーを小さなリストに分割して持つ（挿入・削除は O(√n)、シークは O(log n)）
+    # Sorted keys split into small sub-lists: insert/remove touch one sub-list,
+    # seek is a bisect over the sub-list maxima.
+
+    _LOAD = 512
+
+    def __init__(self) -> None:
+
+        self._lists: List[list] = []
+
+        self._maxes: list = []
+
+        self._len = 0
+
+    def add(self, key) -> None:
+
+        if not self._lists:
+
+            self._lists.append([key])
+
+            self._maxes.append(key)
+
+        else:
+
+            pos = bisect_left(self._maxes, key)
+
+            if pos == len(self._maxes):
+
+                # 末尾への追加（新規 id は常に最大）が一番多い
+                # appending past the max is the common case (new ids always grow)
+
+                pos -= 1
+
+                self._lists[pos].append(key)
+
+                self._maxes[pos] = key
+
+            else:
+
+                insort(self._lists[pos], key)
+
+            self._split(pos)
+
+        self._len += 1
+
+    def discard(self, key) -> None:
+
+        pos = bisect_left(self._maxes, key)
+
+        if pos == len(self._maxes):
+
+            return
+
+        sub = self._lists[pos]
+
+        idx = bisect_left(sub, key)
+
+        if idx == len(sub) or sub[idx] != key:
+
+            return
+
+        del sub[idx]
+
+        self._len -= 1
+
+        if not sub:
+
+            del self._lists[pos]
+
+            del self._maxes[pos]
+
+        elif idx == len(sub):
+
+            self._maxes[pos] = sub[-1]
+
+    def irange_after(self, key=None) -> Iterator:
+
+        # key より大きいキーを昇順で返す（None なら先頭から）
+        # Yield keys strictly greater than key in ascending order (all keys if None)
+
+        if key is None:
+
+            pos, idx = 0, 0
+
+        else:
+
+            pos = bisect_right(self._maxes, key)
+
+            if pos == len(self._maxes):
+
+                return
+
+            idx = bisect_right(self._lists[pos], key)
+
+        for sub in self._lists[pos:]:
+
+            yield from sub[idx:]
+
+            idx = 0
+
+    def irange_before(self, key=None) -> Iterator:
+
+        # key より小さいキーを降順で返す（None なら末尾から）
+        # Yield keys strictly less than key in descending order (all keys if None)
+
+        if not self._lists:
+
+            return
+
+        if key is None:
+
+            pos, idx = len(self._lists) - 1, len(self._lists[-1])
+
+        else:
+
+            pos = bisect_left(self._maxes, key)
+
+            if pos == len(self._maxes):
+
+                pos, idx = len(self._lists) - 1, len(self._lists[-1])
+
+            else:
+
+                idx = bisect_left(self._lists[pos], key)
+
+        for sub in reversed(self._lists[: pos + 1]):
+
+            yield from reversed(sub[:idx])
+
+            idx = None
+
+    def load(self, keys: list) -> None:
+
+        # 昇順に並んだキーで中身を置き換える（起動時の一括構築用）
+        # Replace the contents with already sorted keys (bulk build at startup)
+
+        self._lists = [keys[i : i + self._LOAD] for i in range(0, len(keys), self._LOAD)]
+
+        self._maxes = [sub[-1] for sub in self._lists]
+
+        self._len = len(keys)
+
+    def _split(self, pos: int) -> None:
+
+        sub = self._lists[pos]
+
+        if len(sub) > 2 * self._LOAD:
+
+            half = sub[self._LOAD:]
+
+            del sub[self._LOAD:]
+
+            self._maxes[pos] = sub[-1]
+
+            self._lists.insert(pos + 1, half)
+
+            self._maxes.insert(pos + 1, half[-1])
+
+    def __len__(self) -> int:
+
+        return self._len
+
+
+def _aborts_on_journal_error(method: Callable[..., Any]) -> Callable[..., Any]:
+
+    # 書き込みメソッド用。JournalError ならまだ fsync されていない書き込みを戻してから投げ直す
+    # For write methods: on JournalError, undo the writes not yet fsynced, then re-raise
+
+    @wraps(method)
+    def wrapper(self: "InMemoryTaskRepository", *args: Any, **kwargs: Any) -> Any:
+
+        try:
+
+            return method(self, *args, **kwargs)
+
+        except JournalError:
+
+            self._abort()
+
+            raise
+
+    return wrapper
+
+
+class InMemoryTaskRepository(TaskRepository):
+
+    # id をキーにした辞書でタスクを保持する。dict は挿入順を保つので一覧の順序も変わらない。
+    # Tasks are kept in a dict keyed by id. dict preserves insertion order,
+    # so list order is unchanged while lookup/update/delete are O(1).
+
+    def __init__(self, journal=None) -> None:
+
+        self._tasks: Dict[int, TaskRecord] = {}
+
+        self.epoch = uuid.uuid4().hex[:8]
+
+        self._version = 0
+
+        # ページング用の二次インデックス（id 昇順、completed 別の id 昇順）
+        # Secondary indexes for paging: all ids, and ids per completed value
+
+        self._ids = _SortedList()
+
+        self._by_completed: Dict[bool, _SortedList] = {False: _SortedList(), True: _SortedList()}
+
+        # タイトル順の二次インデックス（キーは (タイトル, id)、completed 別）。絞り込みなしの一覧は
+        # 2つをマージしてたどる（全体用のインデックスを別に持つとタスクごとにタプルがもう1つ増える）
+        # Title-order secondary indexes keyed by (title, id), per completed value. Unfiltered
+        # lists merge the two while walking; an extra all-tasks index would cost another
+        # tuple per task
+
+        self._titles_by_completed: Dict[bool, _SortedList] = {False: _SortedList(), True: _SortedList()}
+
+        # 自動採番用のカウンタ
+        # Automatic numbering counter
+
+        self._next_id: int = 1
+
+        self._id_lock = threading.Lock()
+
+        self._index_lock = threading.Lock()
+
+        self._stripes = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+        # 全文検索のインデックス。最初の検索で全件から作り、以後は書き込みのたびに更新する
+        # （検索を使わなければ書き込みにもメモリにも負担をかけない）
+        # Full-text index. Built from every task on the first search and maintained on
+        # each write from then on, so it costs nothing while search is unused
+
+        self._search: Optional["SearchIndex"] = None
+
+        # ログにはあるがまだ fsync されていない書き込み（通し番号, 前のレコード, 後のレコード）。
+        # ログが失敗したらこれを新しい順に戻す（ディスクに無い変更を読ませ続けない）
+        # Writes in the journal but not yet fsynced: (sequence number, record before,
+        # record after). When the journal fails they are undone newest first, so no change
+        # that never reached the disk stays visible
+
+        self._uncommitted: Deque[Tuple[int, Optional[TaskRecord], Optional[TaskRecord]]] = deque()
+
+        # 先行書き込みログ（app/journal.py）。あれば起動時に内容を復元し、書き込みを追記する
+        # Write-ahead log (app/journal.py). When set, the state is recovered from it and every write is appended
+
+        self.journal = journal
+
+        if journal is not None:
+
+            self._restore(*journal.recover())
+
+    def _restore(self, records: List[TaskRecord], next_id: int) -> None:
+
+        # id 昇順のレコードで中身とインデックスを一括で組み立てる
+        # Bulk-build the dict and indexes from records in id order
+
+        self._tasks = {record.id: record for record in records}
+
+        self._ids.load([record.id for record in records])
+
+        for completed in (False, True):
+
+            self._by_completed[completed].load([r.id for r in records if r.completed is completed])
+
+            self._titles_by_completed[completed].load(sorted((r.title, r.id) for r in records if r.completed is completed))
+
+        self._next_id = next_id
+
+    def _log_put(self, records: List[TaskRecord]) -> int:
+
+        # ログの通し番号を返す（ログが無ければ -1）。
+        # 呼び出し側で _index_lock を保持していること（ログの順序 = 反映の順序にするため）
+        # Returns the journal sequence number (-1 without a journal).
+        # Caller must hold _index_lock, so the log order is the order writes were applied
+
+        return self.journal.log_put(records) if self.journal is not None else -1
+
+    def _log_delete(self, task_id: int) -> int:
+
+        # _log_put と同じ
+        # As for _log_put
+
+        return self.journal.log_delete(task_id) if self.journal is not None else -1
+
+    def _commit(self, seq: int) -> None:
+
+        # ログがあれば fsync を待ち、必要ならスナップショットを取る
+        # With a journal, wait for the fsync and take a snapshot when one is due
+
+        if self.journal is None:
+
+            return
+
+        self.journal.wait(seq)
+
+        if self.journal.snapshot_due():
+
+            self.snapshot()
+
+    def snapshot(self) -> None:
+
+        # 全レコードの一覧（レコードは不変なので浅いコピーで一貫する）を取ってログを切り替える。
+        # ファイルへの書き出しは journal が別スレッドで行う
+        # Take the list of records (records are immutable, so a shallow copy is consistent)
+        # and switch log segments under the index lock; the journal writes the file on another thread
+
+        with self._index_lock:
+
+            segment = self.journal.begin_snapshot()
+
+            if segment is None:
+
+                return
+
+            records = list(self._tasks.values())
+
+            next_id = self._next_id
+
+        self.journal.finish_snapshot(records, next_id, segment)
+
+    def close(self) -> None:
+
+        if self.journal is not None:
+
+            self.journal.close()
+
+    def alloc_id(self) -> int:
+
+        # 新しい一意IDを払い出す（1,2,3,... と連番）
+        # Issue a new unique ID (sequential numbers 1, 2, 3, ...)
+
+        with self._id_lock:
+
+            value = self._next_id
+
+            self._next_id += 1
+
+        return value
+
+    def alloc_ids(self, count: int) -> range:
+
+        # count 件分の連続した id をまとめて予約する
+        # Reserve a block of `count` consecutive ids at once
+
+        with self._id_lock:
+
+            start = self._next_id
+
+            self._next_id += count
+
+        return range(start, start + count)
+
+    def _stripe(self, task_id: int) -> threading.Lock:
+
+        return self._stripes[task_id % _LOCK_STRIPES]
+
+    def _swap(self, old: Optional[TaskRecord], new: Optional[TaskRecord]) -> None:
+
+        # old を new に置き換え、dict と二次インデックス・検索インデックスを合わせる。
+        # old が None なら追加、new が None なら削除。呼び出し側で _index_lock を保持していること
+        # Replace `old` with `new` in the dict, the secondary indexes and the search index;
+        # old None is an insert, new None a delete. Caller must hold _index_lock
+
+        task_id = old.id if new is None else new.id
+
+        if new is None:
+
+            del self._tasks[task_id]
+
+            self._ids.discard(task_id)
+
+        else:
+
+            self._tasks[task_id] = new
+
+            if old is None:
+
+                self._ids.add(task_id)
+
+        self._version += 1
+
+        if old is not None and (new is None or old.completed != new.completed):
+
+            self._by_completed[old.completed].discard(task_id)
+
+        if new is not None and (old is None or old.completed != new.completed):
+
+            self._by_completed[new.completed].add(task_id)
+
+        if old is None or new is None or old.title != new.title or old.completed != new.completed:
+
+            if old is not None:
+
+                self._titles_by_completed[old.completed].discard((old.title, task_id))
+
+            if new is not None:
+
+                self._titles_by_completed[new.completed].add((new.title, task_id))
+
+        if self._search is not None:
+
+            if new is None:
+
+                self._search.remove(task_id)
+
+            elif old is None or old.title != new.title or old.description != new.description:
+
+                self._search.add(task_id, new.title, new.description)
+
+    def _apply(self, seq: int, old: Optional[TaskRecord], new: Optional[TaskRecord]) -> None:
+
+        # ログに追記済み（seq）の書き込みを反映する。ログがあれば fsync まで取り消せるように覚えておく。
+        # 呼び出し側で _index_lock を保持していること
+        # Apply a write already appended to the journal as `seq`; with a journal, remember
+        # it until it is fsynced so it can be undone. Caller must hold _index_lock
+
+        self._swap(old, new)
+
+        if self.journal is None:
+
+            return
+
+        committed = self.journal.committed
+
+        while self._uncommitted and self._uncommitted[0][0] <= committed:
+
+            self._uncommitted.popleft()
+
+        self._uncommitted.append((seq, old, new))
+
+    def _abort(self) -> None:
+
+        # ログが失敗した。fsync されなかった書き込みを新しい順に戻し、読み手が見たかもしれない変更として通知する
+        # The journal failed: undo every write that was not fsynced, newest first, and
+        # notify listeners, since readers may already have seen those changes
+
+        reverted: List[Tuple[str, int]] = []
+
+        with self._index_lock:
+
+            committed = self.journal.committed
+
+            while self._uncommitted and self._uncommitted[-1][0] > committed:
+
+                _, old, new = self._uncommitted.pop()
+
+                self._swap(new, old)
+
+                operation = "delete" if old is None else "create" if new is None else "update"
+
+                reverted.append((operation, (old or new).id))
+
+        for operation, task_id in reverted:
+
+            self._notify(operation, [task_id])
+
+    @_aborts_on_journal_error
+    def create(self, title: str, description: Optional[str] = None) -> TaskRecord:
+
+        record = TaskRecord(self.alloc_id(), title, description, False)
+
+        # ログへの追記を先に行う（ログが失敗していれば何も変えずに JournalError）
+        # Append to the journal first, so a failed journal raises JournalError before anything changes
+
+        with self._index_lock:
+
+            seq = self._log_put([record])
+
+            self._apply(seq, None, record)
+
+        self._commit(seq)
+
+        self._notify("create", [record.id])
+
+        return record
+
+    @_aborts_on_journal_error
+    def create_many(self, items: List[Tuple[str, Optional[str]]]) -> List[TaskRecord]:
+
+        # id をまとめて予約し、インデックスロックは1回だけ取って全件を追加する
+        # Reserve the ids as one block and insert everything under a single index lock
+
+        created = [
+            TaskRecord(task_id, title, description, False)
+            for task_id, (title, description) in zip(self.alloc_ids(len(items)), items)
+        ]
+
+        with self._index_lock:
+
+            seq = self._log_put(created)
+
+            for record in created:
+
+                self._apply(seq, None, record)
+
+        self._commit(seq)
+
+        self._notify("create", [record.id for record in created])
+
+        return created
+
+    def get(self, task_id: int) -> Optional[TaskRecord]:
+
+        return self._tasks.get(task_id)
+
+    @_aborts_on_journal_error
+    def update(
+        self,
+        task_id: int,
+        changes: Dict[str, Any],
+        if_versions: Optional[Container[int]] = None,
+    ) -> Optional[TaskRecord]:
+
+        updated, seq = self._update(task_id, changes, if_versions)
+
+        if seq:
+
+            self._commit(seq)
+
+            self._notify("update", [task_id])
+
+        return updated
+
+    def _update(
+        self,
+        task_id: int,
+        changes: Dict[str, Any],
+        if_versions: Optional[Container[int]] = None,
+    ) -> Tuple[Optional[TaskRecord], int]:
+
+        # changes のフィールドだけを上書きした新しいタスクを保存して返す。無ければ None。
+        # 書き込んだ場合はログの通し番号（_log_put）も返す（書き込まなければ 0）。
+        # 読み取りから書き込みまでストライプロックを保持するので、同時更新が消えたり
+        # 削除済みタスクへ書き込んだりしない。
+        # Store and return a copy of the task with `changes` applied, or None if it
+        # does not exist, plus the journal sequence number of the write (_log_put; 0
+        # when nothing was written). The stripe lock is held from read to write, so
+        # concurrent updates are not lost and a concurrent delete cannot be resurrected.
+
+        with self._stripe(task_id):
+
+            current = self._tasks.get(task_id)
+
+            if current is None:
+
+                return None, 0
+
+            if if_versions is not None and current.version not in if_versions:
+
+                raise VersionConflict(task_id)
+
+            if not changes:
+
+                return current, 0
+
+            # 検証済みの値だけなので再検証せずに新しいレコードで差し替える
+            # Both sides are already validated, so swap in a new record without re-validation
+
+            updated = current.replace(changes)
+
+            with self._index_lock:
+
+                seq = self._log_put([updated])
+
+                self._apply(seq, current, updated)
+
+        return updated, seq
+
+    @_aborts_on_journal_error
+    def update_many(self, items: List[Tuple[int, Dict[str, Any]]]) -> List[Optional[TaskRecord]]:
+
+        # ログの fsync 待ちと書き込み通知は最後に1回だけ行う
+        # Wait for the journal fsync and notify listeners once for the whole batch
+
+        results: List[Optional[TaskRecord]] = []
+
+        updated: List[int] = []
+
+        last = 0
+
+        for task_id, changes in items:
+
+            record, seq = self._update(task_id, changes)
+
+            results.append(record)
+
+            if seq:
+
+                updated.append(task_id)
+
+                last = max(last, seq)
+
+        self._commit(last)
+
+        self._notify("update", updated)
+
+        return results
+
+    @_aborts_on_journal_error
+    def remove(self, task_id: int, if_versions: Optional[Container[int]] = None) -> bool:
+
+        # 削除できたら True。dict からの削除なので後続要素のシフトは起きない
+        # True if removed. Deleting from a dict does not shift the tail
+
+        seq = self._remove(task_id, if_versions)
+
+        if seq:
+
+            self._commit(seq)
+
+            self._notify("delete", [task_id])
+
+        return bool(seq)
+
+    def _remove(self, task_id: int, if_versions: Optional[Container[int]] = None) -> int:
+
+        # 削除した場合はログの通し番号（_log_delete）、無ければ 0 を返す
+        # Returns the journal sequence number (_log_delete) if removed, 0 if not found
+
+        with self._stripe(task_id), self._index_lock:
+
+            record = self._tasks.get(task_id)
+
+            if record is None:
+
+                return 0
+
+            if if_versions is not None and record.version not in if_versions:
+
+                raise VersionConflict(task_id)
+
+            seq = self._log_delete(task_id)
+
+            self._apply(seq, record, None)
+
+            return seq
+
+    @_aborts_on_journal_error
+    def remove_many(self, task_ids: List[int]) -> List[bool]:
+
+        seqs = [self._remove(task_id) for task_id in task_ids]
+
+        self._commit(max(seqs, default=0))
+
+        self._notify("delete", [task_id for task_id, seq in zip(task_ids, seqs) if seq])
+
+        return [bool(seq) for seq in seqs]
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        sort: str = "id",
+        after_title: Optional[str] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+    ) -> Tuple[List[TaskRecord], Optional[int]]:
+
+        # 並び順に合った二次インデックスをカーソル位置からたどり、最大 limit 件返す（O(log n + limit)）。
+        # id 順では id の範囲もインデックス上の開始位置と終了条件になる。タイトル順での id の範囲は
+        # たどりながらの絞り込みなので、範囲外のタスクを読み飛ばす分だけ遅くなる
+        # Walk the secondary index for the requested order from the cursor and return up
+        # to `limit` tasks, O(log n + limit). In id order the id range is also the start
+        # and stop position in the index; in title order it is a filter applied while
+        # walking, so tasks outside the range are skipped over at a cost.
+
+        descending = sort.startswith("-")
+
+        by_title = sort.lstrip("-") == "title"
+
+        if by_title:
+
+            indexes = list(self._titles_by_completed.values()) if completed is None else [self._titles_by_completed[completed]]
+
+            start = (after_title, after_id) if after_title is not None and after_id is not None else None
+
+        else:
+
+            indexes = [self._ids if completed is None else self._by_completed[completed]]
+
+            # 範囲の端（両端を含む）を排他的な開始位置に直し、カーソルと近い方を使う
+            # turn the inclusive range bound into an exclusive start and take the tighter of it and the cursor
+
+            if descending:
+
+                bounds = [bound for bound in (after_id, None if max_id is None else max_id + 1) if bound is not None]
+
+                start = min(bounds) if bounds else None
+
+            else:
+
+                bounds = [bound for bound in (after_id, None if min_id is None else min_id - 1) if bound is not None]
+
+                start = max(bounds) if bounds else None
+
+        records: List[TaskRecord] = []
+
+        next_cursor: Optional[int] = None
+
+        with self._index_lock:
+
+            walks = [index.irange_before(start) if descending else index.irange_after(start) for index in indexes]
+
+            keys = walks[0] if len(walks) == 1 else heapq.merge(*walks, reverse=descending)
+
+            for key in keys:
+
+                task_id = key[1] if by_title else key
+
+                if (min_id is not None and task_id < min_id) or (max_id is not None and task_id > max_id):
+
+                    if by_title:
+
+                        continue
+
+                    # id 順では範囲を出たらそれ以上は無い
+                    # in id order nothing further is inside the range
+
+                    break
+
+                if limit is not None and len(records) == limit:
+
+                    next_cursor = records[-1].id
+
+                    break
+
+                records.append(self._tasks[task_id])
+
+        return records, next_cursor
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[TaskRecord], int]:
+
+        if self._search is None:
+
+            with self._index_lock:
+
+                if self._search is None:
+
+                    from .search import SearchIndex
+
+                    index = SearchIndex()
+
+                    index.add_many((r.id, r.title, r.description) for r in self._tasks.values())
+
+                    self._search = index
+
+        task_ids, total = self._search.search(query, limit, offset)
+
+        # 検索とレコードの読み取りの間に削除されたものは除く
+        # Drop tasks deleted between the search and the record lookup
+
+        records = [record for record in map(self._tasks.get, task_ids) if record is not None]
+
+        return records, total
+
+    def count(self) -> int:
+
+        return len(self._tasks)
+
+    def collection_version(self) -> int:
+
+        return self._version
+
+    def all(self) -> List[TaskRecord]:
+
+        with self._index_lock:
+
+            return list(self._tasks.values())
+
+    def __iter__(self) -> Iterator[TaskRecord]:
+
+        return iter(self.all())
+
+    def __len__(self) -> int:
+
+        return len(self._tasks)
+
+
+_repository: Optional[TaskRepository] = None
+
+_repository_lock = threading.Lock()
+
+# get_repository() がリポジトリを作った時に呼ばれるフック（計測の組み込みなど）
+# Hooks called with each repository get_repository() creates (e.g. to add instrumentation)
+
+RepositoryHook = Callable[[TaskRepository], None]
+
+_repository_hooks: List[RepositoryHook] = []
+
+
+def add_repository_hook(hook: RepositoryHook) -> None:
+
+    # 既に作られていれば、そのリポジトリにもすぐ適用する
+    # Applied at once as well when the repository already exists
+
+    _repository_hooks.append(hook)
+
+    if _repository is not None:
+
+        hook(_repository)
+
+
+def create_repository(backend: Optional[str] = None) -> TaskRepository:
+
+    # 設定に応じたリポジトリを作る。SQLite 実装は必要な時だけ import する
+    # Build the configured repository. The SQLite implementation is imported only when used
+
+    backend = backend or settings.storage_backend
+
+    if backend == "memory":
+
+        if not settings.journal_dir:
+
+            return InMemoryTaskRepository()
+
+        from .journal import TaskJournal
+
+        journal = TaskJournal(
+            settings.journal_dir,
+            snapshot_every=settings.journal_snapshot_every,
+            wait_for_commit=settings.journal_fsync == "commit",
+        )
+
+        return InMemoryTaskRepository(journal)
+
+    if backend == "sqlite":
+
+        from .storage_sqlite import SQLiteTaskRepository
+
+        return SQLiteTaskRepository(settings.sqlite_path, pool_size=settings.sqlite_pool_size)
+
+    if backend == "shared":
+
+        # 複数ワーカーで1つの SQLite ファイルを共有し、id はブロック単位で先取りする
+        # One SQLite file shared by every worker, with ids leased in blocks
+
+        from .storage_sqlite import SQLiteTaskRepository
+
+        return SQLiteTaskRepository(
+            settings.sqlite_path,
+            pool_size=settings.sqlite_pool_size,
+            id_block=settings.id_block,
+        )
+
+    raise ValueError(f"Unknown TASK_STORAGE backend: {backend!r}")
+
+
+def close_repository() -> None:
+
+    # プロセス内のリポジトリを閉じる（アプリ終了時。次の get_repository() は新しく作る）
+    # Close the process-wide repository (on shutdown); the next get_repository() creates a new one
+
+    global _repository
+
+    with _repository_lock:
+
+        repo, _repository = _repository, None
+
+    if repo is not None:
+
+        repo.close()
+
+
+def get_repository() -> TaskRepository:
+
+    # プロセス内で共有するリポジトリ（初回呼び出し時に作成）
+    # The process-wide repository, created on first use
+
+    global _repository
+
+    if _repository is None:
+
+        with _repository_lock:
+
+            if _repository is None:
+
+                repo = create_repository()
+
+                for hook in _repository_hooks:
+
+                    hook(repo)
+
+                _repository = repo
+
+    return _repository
@@ -0,0 +1,220 @@
+# app/storage_async.py
+
+import asyncio
+import contextvars
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Container, Dict, List, Optional, Tuple, TypeVar
+
+from .config import settings
+from .storage import InMemoryTaskRepository, TaskRecord, TaskRepository, get_repository
+
+# async ルーター用のストレージインターフェース。同期リポジトリ（get_repository()）を包むので、
+# データ・書き込み通知（キャッシュ無効化など）は同期ルーターと共有される。
+#   メモリ実装   : 処理はマイクロ秒単位なのでイベントループ上でそのまま実行する（スレッドへ渡さない）。
+#                  書き込みは asyncio.Lock で直列化する
+#   それ以外(SQLite): ブロッキング I/O なので専用のスレッドプールで実行する
+#                  （Starlette の既定スレッドプール = 40 トークンの取り合いに参加しない）
+# Storage interface for the async router. It wraps the sync repository from
+# get_repository(), so data and write listeners (cache invalidation etc.) are shared
+# with the sync router.
+#   in-memory : operations take microseconds, so they run inline on the event loop
+#               (no threadpool hop); writes are serialised with an asyncio.Lock
+#   other (SQLite): blocking I/O runs on a dedicated executor, not Starlette's
+#               default 40-token threadpool
+
+T = TypeVar("T")
+
+
+class AsyncTaskRepository(ABC):
+
+    def __init__(self, repo: TaskRepository) -> None:
+
+        self.sync = repo
+
+    @property
+    def epoch(self) -> str:
+
+        return self.sync.epoch
+
+    @abstractmethod
+    async def _read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+
+        # 読み取りの fn を実行する
+        # Run a read-only fn
+
+        ...
+
+    @abstractmethod
+    async def _write(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+
+        # 書き込みの fn を実行する
+        # Run a writing fn
+
+        ...
+
+    def close(self) -> None:
+
+        # スレッドなどの後始末（同期リポジトリは閉じない）
+        # Release threads etc. (the sync repository is not closed)
+
+        pass
+
+    async def create(self, title: str, description: Optional[str] = None) -> TaskRecord:
+
+        return await self._write(self.sync.create, title, description)
+
+    async def get(self, task_id: int) -> Optional[TaskRecord]:
+
+        return await self._read(self.sync.get, task_id)
+
+    async def update(
+        self,
+        task_id: int,
+        changes: Dict[str, Any],
+        if_versions: Optional[Container[int]] = None,
+    ) -> Optional[TaskRecord]:
+
+        return await self._write(self.sync.update, task_id, changes, if_versions=if_versions)
+
+    async def remove(self, task_id: int, if_versions: Optional[Container[int]] = None) -> bool:
+
+        return await self._write(self.sync.remove, task_id, if_versions=if_versions)
+
+    async def page(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        sort: str = "id",
+        after_title: Optional[str] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+    ) -> Tuple[List[TaskRecord], Optional[int]]:
+
+        return await self._read(
+            self.sync.page,
+            limit=limit,
+            after_id=after_id,
+            completed=completed,
+            sort=sort,
+            after_title=after_title,
+            min_id=min_id,
+            max_id=max_id,
+        )
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[TaskRecord], int]:
+
+        return await self._read(self.sync.search, query, limit, offset)
+
+    async def count(self) -> int:
+
+        return await self._read(self.sync.count)
+
+    async def collection_version(self) -> int:
+
+        return await self._read(self.sync.collection_version)
+
+    async def create_many(self, items: List[Tuple[str, Optional[str]]]) -> List[TaskRecord]:
+
+        return await self._write(self.sync.create_many, items)
+
+    async def update_many(self, items: List[Tuple[int, Dict[str, Any]]]) -> List[Optional[TaskRecord]]:
+
+        return await self._write(self.sync.update_many, items)
+
+    async def remove_many(self, task_ids: List[int]) -> List[bool]:
+
+        return await self._write(self.sync.remove_many, task_ids)
+
+
+class AsyncInMemoryTaskRepository(AsyncTaskRepository):
+
+    def __init__(self, repo: InMemoryTaskRepository) -> None:
+
+        super().__init__(repo)
+
+        self._lock = asyncio.Lock()
+
+    async def _read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+
+        return fn(*args, **kwargs)
+
+    async def _write(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+
+        async with self._lock:
+
+            return fn(*args, **kwargs)
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[TaskRecord], int]:
+
+        # 検索は一致件数に比例して時間がかかり、初回はインデックスの構築も入るのでスレッドで実行する
+        # Search time grows with the number of matches and the first call builds the
+        # index, so it runs on a thread rather than inline
+
+        call = partial(contextvars.copy_context().run, self.sync.search, query, limit, offset)
+
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+class AsyncThreadedTaskRepository(AsyncTaskRepository):
+
+    def __init__(self, repo: TaskRepository, max_workers: int) -> None:
+
+        super().__init__(repo)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-storage")
+
+    async def _read(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+
+        # run_in_executor は contextvars を引き継がないので、呼び出し元のコンテキストで実行する（計測用）
+        # run_in_executor does not carry contextvars over, so run in the caller's context (for metrics)
+
+        call = partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    _write = _read
+
+    def close(self) -> None:
+
+        # 実行中・キュー済みの呼び出しは最後まで走らせ、待たずに戻る
+        # Running and queued calls still finish; this does not wait for them
+
+        self._executor.shutdown(wait=False)
+
+
+_async_repository: Optional[AsyncTaskRepository] = None
+
+
+def get_async_repository() -> AsyncTaskRepository:
+
+    # プロセス内で共有する async リポジトリ（初回呼び出し時に作成）
+    # The process-wide async repository, created on first use
+
+    global _async_repository
+
+    repo = get_repository()
+
+    if _async_repository is None or _async_repository.sync is not repo:
+
+        # リポジトリが作り直された（アプリの再起動など）。古いラッパーのスレッドを止める
+        # The repository was recreated (app restart etc.); stop the old wrapper's threads
+
+        if _async_repository is not None:
+
+            _async_repository.close()
+
+        # ログ（fsync 待ち）付きのメモリ実装はイベントループを止めないようスレッドで動かす
+        # A journaled in-memory store waits for fsync, so it runs on threads to keep the loop free
+
+        if isinstance(repo, InMemoryTaskRepository) and repo.journal is None:
+
+            _async_repository = AsyncInMemoryTaskRepository(repo)
+
+        else:
+
+            _async_repository = AsyncThreadedTaskRepository(repo, max_workers=settings.sqlite_pool_size)
+
+    return _async_repository
@@ -0,0 +1,641 @@
+# app/storage_sqlite.py
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Container, Dict, Iterator, List, Optional, Tuple
+
+from .search import tokenize
+from .storage import TaskRecord, TaskRepository, VersionConflict
+
+# SQLite によるタスクの永続化（WAL モード）
+# Persistent task storage on SQLite (WAL mode)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        title       TEXT    NOT NULL,
+        description TEXT,
+        completed   INTEGER NOT NULL DEFAULT 0,
+        version     INTEGER NOT NULL DEFAULT 1
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tasks_completed ON tasks (completed, id)",
+    # タイトル順の一覧用（id はタイトルが同じ時の順序とカーソル）
+    # for title-ordered lists (id breaks ties between equal titles and is part of the cursor)
+    "CREATE INDEX IF NOT EXISTS ix_tasks_title ON tasks (title, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_completed_title ON tasks (completed, title, id)",
+    # ストア全体のバージョンと ETag 用の識別子
+    # store-wide version and the identifier used in ETags
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('epoch', lower(hex(randomblob(4))))",
+)
+
+# 全文検索用の FTS5 テーブル（rowid = タスクの id）。本文は app/search.py でトークン化して空白区切りで入れるので、
+# 日本語のバイグラムもメモリ実装と同じ単位で引ける。順位は BM25（タイトルの一致を 2 倍）
+# FTS5 table for full-text search (rowid = task id). Text is stored as tokens from
+# app/search.py joined by spaces, so Japanese bigrams match the same way as in the
+# in-memory store. Ranked by BM25 with title matches weighted twice.
+
+_SEARCH_SCHEMA = (
+    "CREATE VIRTUAL TABLE tasks_search USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 0')",
+    "INSERT INTO tasks_search (tasks_search, rank) VALUES ('rank', 'bm25(2.0, 1.0)')",
+)
+
+# SQL 文は固定文字列にして、接続ごとのステートメントキャッシュ（プリペアド）を効かせる
+# SQL is kept as constant strings so each connection's prepared-statement cache is reused
+
+_INSERT = "INSERT INTO tasks (title, description, completed, version) VALUES (?, ?, 0, 1)"
+
+_INSERT_WITH_ID = "INSERT INTO tasks (id, title, description, completed, version) VALUES (?, ?, ?, 0, 1)"
+
+_LAST_ID = "SELECT seq FROM sqlite_sequence WHERE name = 'tasks'"
+
+_SET_LAST_ID = "UPDATE sqlite_sequence SET seq = ? WHERE name = 'tasks'"
+
+_INIT_LAST_ID = "INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)"
+
+_COLUMNS = "id, title, description, completed, version"
+
+_SELECT = f"SELECT {_COLUMNS} FROM tasks WHERE id = ?"
+
+_UPDATE = "UPDATE tasks SET title = ?, description = ?, completed = ?, version = ? WHERE id = ?"
+
+_DELETE = "DELETE FROM tasks WHERE id = ?"
+
+_COUNT = "SELECT COUNT(*) FROM tasks"
+
+_META = "SELECT value FROM meta WHERE key = ?"
+
+_SEARCH_INSERT = "INSERT INTO tasks_search (title, description, rowid) VALUES (?, ?, ?)"
+
+_SEARCH_UPDATE = "UPDATE tasks_search SET title = ?, description = ? WHERE rowid = ?"
+
+_SEARCH_DELETE = "DELETE FROM tasks_search WHERE rowid = ?"
+
+_SEARCH = (
+    f"SELECT {_COLUMNS} FROM tasks JOIN ("
+    "SELECT rowid, rank FROM tasks_search WHERE tasks_search MATCH ? ORDER BY rank, rowid LIMIT ? OFFSET ?"
+    ") AS hit ON tasks.id = hit.rowid ORDER BY hit.rank, hit.rowid"
+)
+
+_SEARCH_COUNT = "SELECT COUNT(*) FROM tasks_search WHERE tasks_search MATCH ?"
+
+_BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'version'"
+
+
+@lru_cache(maxsize=None)
+def _page_query(sort: str, completed: bool, cursor: bool, min_id: bool, max_id: bool) -> str:
+
+    # 一覧の SQL を条件の有無の組み合わせごとに1回だけ組み立てる（文字列が同じなのでステートメントキャッシュも効く）。
+    # 条件と ORDER BY は上の索引の列順に合わせてあり、索引を開始位置から読むだけで済む
+    # （タイトル順で id の範囲がある時は、範囲を読んで並べ替える方が安ければ SQLite がそちらを選ぶ）
+    # Build the list SQL once per combination of conditions (the text is identical, so the
+    # statement cache still applies). Conditions and ORDER BY follow the column order of the
+    # indexes above, so SQLite reads the index from the start position without sorting
+    # (for an id range in title order it may instead sort the range when that is cheaper).
+
+    descending = sort.startswith("-")
+
+    direction, compare = (" DESC", "<") if descending else ("", ">")
+
+    where = ["completed = ?"] if completed else []
+
+    if cursor:
+
+        where.append(f"(title, id) {compare} (?, ?)" if sort.lstrip("-") == "title" else f"id {compare} ?")
+
+    if min_id:
+
+        where.append("id >= ?")
+
+    if max_id:
+
+        where.append("id <= ?")
+
+    order = f"title{direction}, id{direction}" if sort.lstrip("-") == "title" else f"id{direction}"
+
+    condition = f" WHERE {' AND '.join(where)}" if where else ""
+
+    return f"SELECT {_COLUMNS} FROM tasks{condition} ORDER BY {order} LIMIT ?"
+
+
+def _to_record(row) -> TaskRecord:
+
+    return TaskRecord(row[0], row[1], row[2], bool(row[3]), row[4])
+
+
+def _record_params(record: TaskRecord) -> tuple:
+
+    return (record.title, record.description, int(record.completed), record.version, record.id)
+
+
+def _search_params(task_id: int, title: str, description: Optional[str]) -> tuple:
+
+    return (" ".join(tokenize(title)), " ".join(tokenize(description)), task_id)
+
+
+def _match_expression(query: str) -> Optional[str]:
+
+    # 検索語の全トークンを含む（AND）FTS5 の MATCH 式。トークンが無ければ None
+    # FTS5 MATCH expression requiring every query token (AND); None when there are no tokens
+
+    tokens = sorted(set(tokenize(query, query=True)))
+
+    return " ".join(f'"{token}"' for token in tokens) or None
+
+
+class _ConnectionPool:
+
+    # スレッド間で使い回す接続のプール。足りなければ size まで作り、それ以上は空くのを待つ
+    # Connections shared between threads. Opens up to `size` lazily, then waits for a free one
+
+    def __init__(self, path: str, size: int) -> None:
+
+        self._path = path
+
+        self._size = size
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+
+        self._opened = 0
+
+        self._lock = threading.Lock()
+
+        self._all: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+
+        # autocommit（isolation_level=None）にして、書き込みは明示的に BEGIN IMMEDIATE する
+        # autocommit mode (isolation_level=None); writes issue BEGIN IMMEDIATE explicitly
+
+        conn = sqlite3.connect(
+            self._path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+
+        conn.execute("PRAGMA journal_mode=WAL")
+
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        conn.execute("PRAGMA busy_timeout=5000")
+
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+
+        try:
+
+            conn = self._idle.get_nowait()
+
+        except queue.Empty:
+
+            with self._lock:
+
+                grow = self._opened < self._size
+
+                if grow:
+
+                    self._opened += 1
+
+            if grow:
+
+                conn = self._open()
+
+                with self._lock:
+
+                    self._all.append(conn)
+
+            else:
+
+                conn = self._idle.get()
+
+        try:
+
+            yield conn
+
+        finally:
+
+            self._idle.put(conn)
+
+    def close(self) -> None:
+
+        with self._lock:
+
+            for conn in self._all:
+
+                conn.close()
+
+            self._all.clear()
+
+            self._opened = 0
+
+        self._idle = queue.LifoQueue()
+
+
+class _IdLeaser:
+
+    # 複数プロセス（uvicorn --workers N）で同じファイルを使う時の id 払い出し。
+    # AUTOINCREMENT のシーケンスを block 件ぶん先に進めて、その範囲をこのプロセス専用にする。
+    # 払い出しはメモリ上のカウンターで行い、ファイルに触るのは block 件ごとに1回だけ。
+    # シーケンス自体を進めるので、通常の AUTOINCREMENT の INSERT と混在しても衝突しない。
+    # id はプロセスごとの範囲から出るため、作成順と id 順はプロセス間では一致しない。
+    # Id allocation for several processes (uvicorn --workers N) sharing one file.
+    # A lease advances the AUTOINCREMENT sequence by `block` and keeps that range for
+    # this process; ids are then handed out from memory, touching the file once per
+    # block. Because the sequence itself moves, leased ids never collide with plain
+    # AUTOINCREMENT inserts. Ids come from per-process ranges, so across processes id
+    # order is not creation order.
+
+    def __init__(self, pool: _ConnectionPool, block: int) -> None:
+
+        self._pool = pool
+
+        self._block = block
+
+        self._next = 0
+
+        self._end = 0
+
+        self._lock = threading.Lock()
+
+    def _lease(self, count: int) -> range:
+
+        with self._pool.connection() as conn:
+
+            conn.execute("BEGIN IMMEDIATE")
+
+            try:
+
+                row = conn.execute(_LAST_ID).fetchone()
+
+                start = (row[0] if row else 0) + 1
+
+                conn.execute(_SET_LAST_ID if row else _INIT_LAST_ID, (start + count - 1,))
+
+            except BaseException:
+
+                conn.execute("ROLLBACK")
+
+                raise
+
+            conn.execute("COMMIT")
+
+        return range(start, start + count)
+
+    def alloc_ids(self, count: int) -> range:
+
+        # 手元の範囲に収まらない大きな要求は、それだけで1回の払い出しにする
+        # A request larger than a block gets a lease of its own
+
+        if count > self._block:
+
+            return self._lease(count)
+
+        with self._lock:
+
+            if self._end - self._next < count:
+
+                leased = self._lease(self._block)
+
+                self._next, self._end = leased.start, leased.stop
+
+            start = self._next
+
+            self._next += count
+
+        return range(start, start + count)
+
+
+class SQLiteTaskRepository(TaskRepository):
+
+    def __init__(self, path: str, pool_size: int = 40, id_block: int = 0) -> None:
+
+        self._pool = _ConnectionPool(path, pool_size)
+
+        # id_block > 0 で id をブロック単位で先取りする（複数プロセス共有モード）
+        # id_block > 0 leases ids in blocks (multi-process shared mode)
+
+        self._ids = _IdLeaser(self._pool, id_block) if id_block > 0 else None
+
+        # version 列が無い古いファイルは列を追加してから索引などを作る。
+        # 複数のワーカーが同時に起動しても一度だけ行われるよう、書き込みトランザクションの中で行う
+        # Older files without the version column get it added before the rest of the schema.
+        # Done inside a write transaction so workers starting together migrate only once
+
+        with self._pool.connection() as conn:
+
+            conn.execute("BEGIN IMMEDIATE")
+
+            conn.execute(_SCHEMA[0])
+
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+
+            if "version" not in columns:
+
+                conn.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+            for ddl in _SCHEMA[1:]:
+
+                conn.execute(ddl)
+
+            # 検索テーブルが無いファイル（検索追加前に作られたもの）は作って既存のタスクを入れる
+            # Files created before search was added get the table and the existing tasks
+
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_search'").fetchone() is None:
+
+                for ddl in _SEARCH_SCHEMA:
+
+                    conn.execute(ddl)
+
+                rows = conn.execute("SELECT id, title, description FROM tasks")
+
+                conn.executemany(_SEARCH_INSERT, (_search_params(*row) for row in rows))
+
+            conn.execute("COMMIT")
+
+            self.epoch = conn.execute(_META, ("epoch",)).fetchone()[0]
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+
+        # 書き込みトランザクション。BEGIN IMMEDIATE で最初から書き込みロックを取り、
+        # 行が実際に変わった時だけ同じトランザクションでストア全体のバージョンを進める
+        # （無い id の更新・削除や変更なしの更新では一覧の ETag を変えない。メモリ実装と同じ）
+        # Write transaction; BEGIN IMMEDIATE takes the write lock up front, and the
+        # store-wide version is bumped in the same transaction only when a row actually
+        # changed (updating or removing a missing id, or an empty update, leaves the list
+        # ETag alone, as in the in-memory store)
+
+        with self._pool.connection() as conn:
+
+            conn.execute("BEGIN IMMEDIATE")
+
+            changes = conn.total_changes
+
+            try:
+
+                yield conn
+
+                if conn.total_changes != changes:
+
+                    conn.execute(_BUMP_VERSION)
+
+            except BaseException:
+
+                conn.execute("ROLLBACK")
+
+                raise
+
+            conn.execute("COMMIT")
+
+    def create(self, title: str, description: Optional[str] = None) -> TaskRecord:
+
+        if self._ids is not None:
+
+            return self._insert_many(self._ids.alloc_ids(1), [(title, description)])[0]
+
+        with self._write() as conn:
+
+            task_id = conn.execute(_INSERT, (title, description)).lastrowid
+
+            conn.execute(_SEARCH_INSERT, _search_params(task_id, title, description))
+
+        self._notify("create", [task_id])
+
+        return TaskRecord(task_id, title, description, False)
+
+    def create_many(self, items: List[Tuple[str, Optional[str]]]) -> List[TaskRecord]:
+
+        # 1トランザクションで AUTOINCREMENT の続きから id をまとめて確保し、executemany で挿入する
+        # In one transaction, take a block of ids after the AUTOINCREMENT sequence and insert with executemany
+
+        if self._ids is not None:
+
+            return self._insert_many(self._ids.alloc_ids(len(items)), items)
+
+        with self._write() as conn:
+
+            row = conn.execute(_LAST_ID).fetchone()
+
+            start = (row[0] if row else 0) + 1
+
+            rows = [(start + i, title, description) for i, (title, description) in enumerate(items)]
+
+            conn.executemany(_INSERT_WITH_ID, rows)
+
+            conn.executemany(_SEARCH_INSERT, [_search_params(*row) for row in rows])
+
+        self._notify("create", [row[0] for row in rows])
+
+        return [TaskRecord(i, t, d, False) for i, t, d in rows]
+
+    def _insert_many(self, ids: range, items: List[Tuple[str, Optional[str]]]) -> List[TaskRecord]:
+
+        rows = [(task_id, title, description) for task_id, (title, description) in zip(ids, items)]
+
+        with self._write() as conn:
+
+            conn.executemany(_INSERT_WITH_ID, rows)
+
+            conn.executemany(_SEARCH_INSERT, [_search_params(*row) for row in rows])
+
+        self._notify("create", list(ids))
+
+        return [TaskRecord(i, t, d, False) for i, t, d in rows]
+
+    def get(self, task_id: int) -> Optional[TaskRecord]:
+
+        with self._pool.connection() as conn:
+
+            row = conn.execute(_SELECT, (task_id,)).fetchone()
+
+        return None if row is None else _to_record(row)
+
+    def update(
+        self,
+        task_id: int,
+        changes: Dict[str, Any],
+        if_versions: Optional[Container[int]] = None,
+    ) -> Optional[TaskRecord]:
+
+        with self._write() as conn:
+
+            row = conn.execute(_SELECT, (task_id,)).fetchone()
+
+            if row is None:
+
+                return None
+
+            current = _to_record(row)
+
+            if if_versions is not None and current.version not in if_versions:
+
+                raise VersionConflict(task_id)
+
+            if not changes:
+
+                return current
+
+            updated = current.replace(changes)
+
+            conn.execute(_UPDATE, _record_params(updated))
+
+            if "title" in changes or "description" in changes:
+
+                conn.execute(_SEARCH_UPDATE, _search_params(task_id, updated.title, updated.description))
+
+        self._notify("update", [task_id])
+
+        return updated
+
+    def remove(self, task_id: int, if_versions: Optional[Container[int]] = None) -> bool:
+
+        with self._write() as conn:
+
+            if if_versions is not None:
+
+                row = conn.execute(_SELECT, (task_id,)).fetchone()
+
+                if row is not None and row[4] not in if_versions:
+
+                    raise VersionConflict(task_id)
+
+            removed = conn.execute(_DELETE, (task_id,)).rowcount > 0
+
+            conn.execute(_SEARCH_DELETE, (task_id,))
+
+        if removed:
+
+            self._notify("delete", [task_id])
+
+        return removed
+
+    def update_many(self, items: List[Tuple[int, Dict[str, Any]]]) -> List[Optional[TaskRecord]]:
+
+        # 全件を1トランザクションで読み書きし、UPDATE は executemany でまとめて流す
+        # Read and write every row in one transaction; the UPDATEs go out as one executemany
+
+        results: List[Optional[TaskRecord]] = []
+
+        current: Dict[int, TaskRecord] = {}
+
+        with self._write() as conn:
+
+            for task_id, changes in items:
+
+                record = current.get(task_id)
+
+                if record is None:
+
+                    row = conn.execute(_SELECT, (task_id,)).fetchone()
+
+                    record = None if row is None else _to_record(row)
+
+                if record is not None and changes:
+
+                    record = record.replace(changes)
+
+                    current[task_id] = record
+
+                results.append(record)
+
+            conn.executemany(_UPDATE, [_record_params(r) for r in current.values()])
+
+            conn.executemany(_SEARCH_UPDATE, [_search_params(r.id, r.title, r.description) for r in current.values()])
+
+        self._notify("update", list(current))
+
+        return results
+
+    def remove_many(self, task_ids: List[int]) -> List[bool]:
+
+        with self._write() as conn:
+
+            removed = [conn.execute(_DELETE, (task_id,)).rowcount > 0 for task_id in task_ids]
+
+            conn.executemany(_SEARCH_DELETE, [(task_id,) for task_id in task_ids])
+
+        self._notify("delete", [task_id for task_id, ok in zip(task_ids, removed) if ok])
+
+        return removed
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        sort: str = "id",
+        after_title: Optional[str] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+    ) -> Tuple[List[TaskRecord], Optional[int]]:
+
+        # 1件多く読んで続きの有無を判定する（LIMIT -1 は無制限）
+        # Read one extra row to know whether more follow (LIMIT -1 means no limit)
+
+        fetch = -1 if limit is None else limit + 1
+
+        if sort.lstrip("-") == "title":
+
+            cursor = (after_title, after_id) if after_title is not None and after_id is not None else ()
+
+        else:
+
+            cursor = (after_id,) if after_id is not None else ()
+
+        params: List[Any] = [int(completed)] if completed is not None else []
+
+        params += cursor
+
+        params += [bound for bound in (min_id, max_id) if bound is not None]
+
+        sql = _page_query(sort, completed is not None, bool(cursor), min_id is not None, max_id is not None)
+
+        with self._pool.connection() as conn:
+
+            rows = conn.execute(sql, (*params, fetch)).fetchall()
+
+        items = [_to_record(row) for row in rows[:limit]]
+
+        next_cursor = items[-1].id if limit is not None and len(rows) > limit else None
+
+        return items, next_cursor
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[TaskRecord], int]:
+
+        match = _match_expression(query)
+
+        if match is None:
+
+            return [], 0
+
+        with self._pool.connection() as conn:
+
+            rows = conn.execute(_SEARCH, (match, limit, offset)).fetchall()
+
+            total = conn.execute(_SEARCH_COUNT, (match,)).fetchone()[0]
+
+        return [_to_record(row) for row in rows], total
+
+    def count(self) -> int:
+
+        with self._pool.connection() as conn:
+
+            return conn.execute(_COUNT).fetchone()[0]
+
+    def collection_version(self) -> int:
+
+        with self._pool.connection() as conn:
+
+            return conn.execute(_META, ("version",)).fetchone()[0]
+
+    def close(self) -> None:
+
+        self._pool.close()
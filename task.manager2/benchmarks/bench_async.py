@@ -0,0 +1,98 @@
+# benchmarks/bench_async.py
+#
+# 同期ルーター（スレッドプール経由）と async ルーター（イベントループ上）のスループットを比較する。
+# ASGI アプリをプロセス内で直接呼ぶので、差はハンドラーの実行方法（スレッドプールへの受け渡し）に由来する。
+# レスポンスキャッシュは無効にして、毎回ストレージまで到達させる。
+# Compares requests/second of the sync router (threadpool) and the async router
+# (event loop) under concurrent load. The ASGI app is driven in-process, so the
+# difference comes from how handlers are run. The response cache is disabled so
+# every request reaches storage.
+#
+#   cd task.manager2 && python -m benchmarks.bench_async
+
+import asyncio
+import os
+import random
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.cache import response_cache
+from app.routers import tasks, tasks_async
+
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "64"))
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "20000"))
+
+TASKS = int(os.getenv("BENCH_TASKS", "1000"))
+
+# 読み取り 80% / 更新 20%
+# 80% reads / 20% updates
+
+READ_RATIO = float(os.getenv("BENCH_READ_RATIO", "0.8"))
+
+
+def _app(router) -> FastAPI:
+
+    app = FastAPI()
+
+    app.include_router(router)
+
+    return app
+
+
+async def _load(app: FastAPI) -> float:
+
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        await client.post("/tasks/bulk", json=[{"title": f"task {i}"} for i in range(TASKS)])
+
+        ids = [t["id"] for t in (await client.get("/tasks/")).json()]
+
+        per_worker = REQUESTS // CONCURRENCY
+
+        async def worker(seed: int) -> None:
+
+            rnd = random.Random(seed)
+
+            for _ in range(per_worker):
+
+                task_id = rnd.choice(ids)
+
+                if rnd.random() < READ_RATIO:
+
+                    r = await client.get(f"/tasks/{task_id}")
+
+                else:
+
+                    r = await client.put(f"/tasks/{task_id}", json={"completed": rnd.random() < 0.5})
+
+                assert r.status_code == 200, r.text
+
+        start = time.perf_counter()
+
+        await asyncio.gather(*(worker(n) for n in range(CONCURRENCY)))
+
+        return per_worker * CONCURRENCY / (time.perf_counter() - start)
+
+
+def main():
+
+    response_cache.enabled = False
+
+    results = {}
+
+    for name, router in (("sync", tasks.router), ("async", tasks_async.router)):
+
+        results[name] = asyncio.run(_load(_app(router)))
+
+        print(f"{name:>5}: {results[name]:8.0f} req/s  (concurrency={CONCURRENCY})")
+
+    print(f"async/sync: {results['async'] / results['sync']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
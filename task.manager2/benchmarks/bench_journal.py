@@ -0,0 +1,127 @@
+# benchmarks/bench_journal.py
+#
+# 先行書き込みログ（app/journal.py）付きのメモリ実装を測る
+#   write : スレッド数を変えて create を繰り返し、書き込み/秒と fsync 1回あたりの書き込み数（グループコミット）を測る
+#   start : BENCH_TASKS 件（既定 100万件）をスナップショットに書き、続きのログと合わせて起動時の復元時間を測る
+# Measures the in-memory store with the write-ahead log (app/journal.py).
+#   write : creates from 1..N threads; writes/second and writes per fsync (group commit)
+#   start : cold-start recovery time for BENCH_TASKS tasks (1M by default) in a
+#           snapshot plus a log tail
+#
+#   cd task.manager2 && python -m benchmarks.bench_journal
+
+import os
+import tempfile
+import threading
+import time
+
+from app.journal import TaskJournal
+from app.storage import InMemoryTaskRepository
+
+TASKS = int(os.getenv("BENCH_TASKS", "1000000"))
+
+WRITES = int(os.getenv("BENCH_WRITES", "20000"))
+
+THREADS = [int(n) for n in os.getenv("BENCH_THREADS", "1,4,16,64").split(",")]
+
+# 起動時に再生するログの件数（スナップショット以降の書き込み）
+# Writes in the log tail replayed at startup (made after the snapshot)
+
+TAIL = int(os.getenv("BENCH_TAIL", "50000"))
+
+
+def bench_writes(directory: str, threads: int, wait_for_commit: bool = True):
+
+    journal = TaskJournal(directory, snapshot_every=10**9, wait_for_commit=wait_for_commit)
+
+    repo = InMemoryTaskRepository(journal)
+
+    per_thread = WRITES // threads
+
+    def work():
+
+        for i in range(per_thread):
+
+            repo.create(f"task {i}")
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+
+    start = time.perf_counter()
+
+    for t in workers:
+
+        t.start()
+
+    for t in workers:
+
+        t.join()
+
+    elapsed = time.perf_counter() - start
+
+    repo.close()
+
+    return per_thread * threads / elapsed, per_thread * threads / max(journal.commits, 1)
+
+
+def bench_start(directory: str):
+
+    journal = TaskJournal(directory, snapshot_every=10**9, wait_for_commit=False)
+
+    repo = InMemoryTaskRepository(journal)
+
+    chunk = 10000
+
+    for start in range(0, TASKS, chunk):
+
+        repo.create_many([(f"Daily report {i % 100}", None) for i in range(start, min(start + chunk, TASKS))])
+
+    repo.snapshot()
+
+    for i in range(TAIL):
+
+        repo.update(1 + i % TASKS, {"completed": bool(i % 2)})
+
+    repo.close()
+
+    size = os.path.getsize(os.path.join(directory, "snapshot.bin"))
+
+    start = time.perf_counter()
+
+    restored = InMemoryTaskRepository(TaskJournal(directory))
+
+    elapsed = time.perf_counter() - start
+
+    assert restored.count() == TASKS
+
+    restored.close()
+
+    return elapsed, size
+
+
+def main():
+
+    print(f"write ({WRITES} creates, fsync per group commit)")
+
+    for threads in THREADS:
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            rate, per_fsync = bench_writes(directory, threads)
+
+        print(f"  threads={threads:3d}: {rate:9.0f} writes/s  {per_fsync:6.1f} writes/fsync")
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        rate, _ = bench_writes(directory, THREADS[-1], wait_for_commit=False)
+
+    print(f"  background fsync (threads={THREADS[-1]}): {rate:9.0f} writes/s")
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        elapsed, size = bench_start(directory)
+
+    print(f"start ({TASKS} tasks, snapshot {size / 1e6:.1f} MB + {TAIL} log entries): {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_memory.py
+#
+# インメモリストアの1タスクあたりのメモリ量を tracemalloc で測り、1000万件に外挿する
+#   models : 以前の持ち方（Pydantic の Task をそのまま保持）
+#   store  : InMemoryTaskRepository（__slots__ の TaskRecord + id/completed インデックス +
+#            completed 別のタイトル順インデックス。タスクごとに (タイトル, id) のタプルが1つ）
+# Measures bytes per task with tracemalloc and extrapolates to 10M tasks.
+#   models : the previous layout (Pydantic Task models kept as they are)
+#   store  : InMemoryTaskRepository (__slots__ TaskRecord + id/completed indexes + the
+#            per-completed title indexes, one (title, id) tuple per task)
+#
+#   cd task.manager2 && python -m benchmarks.bench_memory
+
+import gc
+import os
+import tracemalloc
+
+from app.schemes import Task
+from app.storage import InMemoryTaskRepository
+
+TASKS = int(os.getenv("BENCH_TASKS", "200000"))
+
+TARGET = 10_000_000
+
+
+def _title(i: int) -> str:
+
+    # リクエストごとに別オブジェクトになる文字列。値は少数のパターンの繰り返し（実データに近い）
+    # A fresh string object per task, as decoded from each request; values repeat
+    # a small set of patterns, as real task lists tend to
+
+    return f"Daily report {i % 100}"
+
+
+def _measure(build):
+
+    gc.collect()
+
+    tracemalloc.start()
+
+    keep = build()
+
+    current, _ = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+
+    del keep
+
+    return current / TASKS
+
+
+def build_models():
+
+    return {
+        i: Task(id=i, title=_title(i), description=None, completed=False)
+        for i in range(1, TASKS + 1)
+    }
+
+
+def build_store():
+
+    repo = InMemoryTaskRepository()
+
+    chunk = 10000
+
+    for start in range(0, TASKS, chunk):
+
+        repo.create_many([(_title(i), None) for i in range(start, min(start + chunk, TASKS))])
+
+    return repo
+
+
+def main():
+
+    for name, build in (("models", build_models), ("store", build_store)):
+
+        per_task = _measure(build)
+
+        print(f"{name:>6}: {per_task:6.0f} bytes/task -> {per_task * TARGET / 2**30:5.2f} GiB for {TARGET:,} tasks")
+
+
+if __name__ == "__main__":
+    main()
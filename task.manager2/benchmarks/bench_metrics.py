@@ -0,0 +1,105 @@
+# benchmarks/bench_metrics.py
+#
+# 計測（app/metrics.py）の有無でスループットを比べ、1リクエストあたりの追加コストを出す。
+# 設定は import 時に読まれるので、TASK_METRICS=1 / 0 の子プロセスでそれぞれ測る。
+# レスポンスキャッシュは無効にして、ストレージとシリアライズまで毎回通す。
+# Compares throughput with and without the instrumentation in app/metrics.py and
+# reports the added cost per request. Settings are read at import time, so each
+# variant runs in a child process with TASK_METRICS=1 / 0. The response cache is
+# disabled so every request goes through storage and serialization.
+#
+#   cd task.manager2 && python -m benchmarks.bench_metrics
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "20000"))
+
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "32"))
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+
+
+async def _load() -> float:
+
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        await client.post("/tasks/bulk", json=[{"title": f"task {i}"} for i in range(100)])
+
+        per_worker = REQUESTS // CONCURRENCY
+
+        async def worker(n: int) -> None:
+
+            for i in range(per_worker):
+
+                task_id = 1 + (n * per_worker + i) % 100
+
+                if i % 5:
+
+                    r = await client.get(f"/tasks/{task_id}")
+
+                else:
+
+                    r = await client.put(f"/tasks/{task_id}", json={"completed": bool(i % 2)})
+
+                assert r.status_code == 200, r.text
+
+        start = time.perf_counter()
+
+        await asyncio.gather(*(worker(n) for n in range(CONCURRENCY)))
+
+        return (time.perf_counter() - start) / (per_worker * CONCURRENCY)
+
+
+def _run(enabled: bool) -> float:
+
+    env = {**os.environ, "TASK_METRICS": "1" if enabled else "0", "TASK_RESPONSE_CACHE_MB": "0", "TASK_STORAGE": "memory"}
+
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_metrics", "--child"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+
+    if "--child" in sys.argv:
+
+        print(asyncio.run(_load()))
+
+        return
+
+    # 交互に ROUNDS 回ずつ測り、最速の回を使う（他のプロセスの影響を減らす）
+    # alternate ROUNDS runs of each and keep the fastest (reduces noise from other processes)
+
+    runs = {False: [], True: []}
+
+    for _ in range(ROUNDS):
+
+        for enabled in (False, True):
+
+            runs[enabled].append(_run(enabled))
+
+    off, on = min(runs[False]), min(runs[True])
+
+    print(f"metrics off: {off * 1e6:7.1f} us/request")
+
+    print(f"metrics on : {on * 1e6:7.1f} us/request  (+{(on - off) * 1e6:.1f} us, {on / off - 1:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
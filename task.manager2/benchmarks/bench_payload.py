@@ -0,0 +1,232 @@
+# benchmarks/bench_payload.py
+#
+# 大きな一覧レスポンス（GET /tasks/?limit=1000、タイトル 200 文字・説明 2000 文字）のスループット。
+#   1. シリアライズ: 以前の経路（Task を組み立てて TypeAdapter で JSON）と app/responses.py の dumps の比較
+#   2. 圧縮: Accept-Encoding を identity / gzip / zstd にした時の 1リクエストの時間と転送量。
+#      BENCH_LINK_MBIT の回線で送る時間を足した目安も出す
+# レスポンスキャッシュは無効にして、毎回シリアライズと圧縮まで通す。設定は import 時に読まれるので
+# 各 Accept-Encoding は子プロセスで測る（圧縮レベルなどは TASK_GZIP_LEVEL などでそのまま渡せる）。
+# Throughput of large list responses (GET /tasks/?limit=1000 with 200-character titles
+# and 2000-character descriptions).
+#   1. serialization: the previous path (build Task models, dump with a TypeAdapter)
+#      against dumps from app/responses.py
+#   2. compression: time per request and bytes on the wire with Accept-Encoding set to
+#      identity / gzip / zstd, plus an estimate including the transfer time over a
+#      BENCH_LINK_MBIT link
+# The response cache is disabled so every request is serialized and compressed. Settings
+# are read at import time, so each Accept-Encoding runs in a child process (levels etc.
+# pass through as TASK_GZIP_LEVEL and friends).
+#
+#   cd task.manager2 && python -m benchmarks.bench_payload
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+TASKS = int(os.getenv("BENCH_TASKS", "1000"))
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "200"))
+
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+
+LINK_MBIT = float(os.getenv("BENCH_LINK_MBIT", "100"))
+
+# 説明文を作る単語（日本語と英語を混ぜる）
+# words the texts are made of (Japanese and English mixed)
+
+_WORDS = (
+    "task review meeting deploy fix bug customer report update release notes API database "
+    "会議 準備 資料 確認 議事録 対応 連絡 見積 顧客 リリース"
+).split()
+
+
+def _text(rng: random.Random, length: int) -> str:
+
+    words: List[str] = []
+
+    size = 0
+
+    while size < length:
+
+        word = rng.choice(_WORDS) + (str(rng.randrange(1000)) if rng.random() < 0.2 else "")
+
+        words.append(word)
+
+        size += len(word) + 1
+
+    return " ".join(words)[:length]
+
+
+def _payload() -> List[dict]:
+
+    rng = random.Random(0)
+
+    return [{"title": _text(rng, 200), "description": _text(rng, 2000)} for _ in range(TASKS)]
+
+
+def _serialization() -> None:
+
+    from pydantic import TypeAdapter
+
+    from app.responses import dumps, orjson
+    from app.schemes import Task
+    from app.storage import TaskRecord
+
+    records = [TaskRecord(i + 1, p["title"], p["description"], i % 2 == 0) for i, p in enumerate(_payload())]
+
+    task_list = TypeAdapter(List[Task])
+
+    variants = {
+        "Task + TypeAdapter.dump_json": lambda: task_list.dump_json([r.to_task() for r in records]),
+        f"dict + dumps ({'orjson' if orjson is not None else 'pydantic-core'})": lambda: dumps([r.to_dict() for r in records]),
+    }
+
+    assert len({fn() for fn in variants.values()}) == 1, "encoders disagree"
+
+    size = len(next(iter(variants.values()))())
+
+    print(f"serialization of {TASKS} tasks ({size / 1e6:.2f} MB of JSON), best of {ROUNDS}:")
+
+    for name, fn in variants.items():
+
+        best = float("inf")
+
+        for _ in range(ROUNDS):
+
+            start = time.perf_counter()
+
+            for _ in range(20):
+
+                fn()
+
+            best = min(best, (time.perf_counter() - start) / 20)
+
+        print(f"  {name:40s} {best * 1e3:7.2f} ms  {size / best / 1e6:8.1f} MB/s")
+
+
+async def _load(accept_encoding: str) -> Tuple[float, float, str]:
+
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        payload = _payload()
+
+        for i in range(0, len(payload), 1000):
+
+            r = await client.post("/tasks/bulk", json=payload[i : i + 1000])
+
+            assert r.status_code == 200, r.text
+
+        sizes: List[int] = []
+
+        encodings = set()
+
+        per_worker = REQUESTS // CONCURRENCY
+
+        async def worker() -> None:
+
+            for _ in range(per_worker):
+
+                # 生のバイト列を数える（クライアント側の展開は測らない）
+                # count the raw bytes (client-side decompression is not timed)
+
+                request = client.build_request("GET", "/tasks/", params={"limit": 1000}, headers={"Accept-Encoding": accept_encoding})
+
+                r = await client.send(request, stream=True)
+
+                assert r.status_code == 200, r.status_code
+
+                size = 0
+
+                async for chunk in r.aiter_raw():
+
+                    size += len(chunk)
+
+                await r.aclose()
+
+                sizes.append(size)
+
+                encodings.add(r.headers.get("content-encoding", "identity"))
+
+        start = time.perf_counter()
+
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+
+        elapsed = (time.perf_counter() - start) / (per_worker * CONCURRENCY)
+
+        return elapsed, sum(sizes) / len(sizes), ",".join(sorted(encodings))
+
+
+def _run(accept_encoding: str) -> Tuple[float, float, str]:
+
+    env = {**os.environ, "TASK_RESPONSE_CACHE_MB": "0", "TASK_STORAGE": "memory", "TASK_JOURNAL_DIR": ""}
+
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_payload", "--child", accept_encoding],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    elapsed, size, encoding = out.stdout.strip().splitlines()[-1].split()
+
+    return float(elapsed), float(size), encoding
+
+
+def main():
+
+    if "--child" in sys.argv:
+
+        print(*asyncio.run(_load(sys.argv[sys.argv.index("--child") + 1])))
+
+        return
+
+    _serialization()
+
+    print()
+
+    from app.compression import available_encodings
+
+    variants = ["identity"] + available_encodings()[::-1]
+
+    # 交互に ROUNDS 回ずつ測り、最速の回を使う
+    # alternate ROUNDS runs of each and keep the fastest
+
+    runs = {variant: [] for variant in variants}
+
+    for _ in range(ROUNDS):
+
+        for variant in variants:
+
+            runs[variant].append(_run(variant))
+
+    print(f"GET /tasks/?limit=1000, {REQUESTS} requests, concurrency {CONCURRENCY}, best of {ROUNDS}:")
+
+    identity = min(runs["identity"])[1]
+
+    for variant in variants:
+
+        elapsed, size, encoding = min(runs[variant])
+
+        transfer = size * 8 / (LINK_MBIT * 1e6)
+
+        print(
+            f"  Accept-Encoding {variant:8s} -> {encoding:8s}: {elapsed * 1e3:7.2f} ms/request  {1 / elapsed:7.1f} req/s  "
+            f"{size / 1e3:8.1f} kB ({size / identity:5.1%})  + {LINK_MBIT:g} Mbit/s link: {(elapsed + transfer) * 1e3:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
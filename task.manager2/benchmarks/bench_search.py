@@ -0,0 +1,94 @@
+# benchmarks/bench_search.py
+#
+# GET /tasks/search の検索部分の時間を、全件を取得してクライアント側で絞り込む場合と比べる
+#   scan  : 全タスクを走査して部分文字列で絞り込む（これまでの唯一の方法）
+#   index : InMemoryTaskRepository.search（転置インデックス + BM25、初回の構築時間は別に表示）
+# Compares the search step of GET /tasks/search with fetching everything and
+# filtering on the client.
+#   scan  : walk every task and filter by substring (the only option before)
+#   index : InMemoryTaskRepository.search (inverted index + BM25; first-build time shown separately)
+#
+#   cd task.manager2 && python -m benchmarks.bench_search
+
+import os
+import random
+import time
+
+from app.storage import InMemoryTaskRepository
+
+TASKS = int(os.getenv("BENCH_TASKS", "100000"))
+
+QUERIES = int(os.getenv("BENCH_QUERIES", "200"))
+
+# 漢字2文字の語と英単語の語彙（各 VOCABULARY 語）
+# vocabulary of two-kanji words and English words (VOCABULARY of each)
+
+VOCABULARY = int(os.getenv("BENCH_VOCABULARY", "500"))
+
+_KANJI = "会議準備資料確認報告設計試験請求書発注納品契約更新調査分析計画予算顧客連絡対応修正検討開始終了作成提出承認"
+
+_rnd = random.Random(42)
+
+WORDS = [_rnd.choice(_KANJI) + _rnd.choice(_KANJI) for _ in range(VOCABULARY)] + [f"item{i}" for i in range(VOCABULARY)]
+
+
+def build() -> InMemoryTaskRepository:
+
+    rnd = random.Random(0)
+
+    repo = InMemoryTaskRepository()
+
+    items = [
+        (" ".join(rnd.sample(WORDS, 2)) + f" {i}", "の".join(rnd.sample(WORDS, 3)))
+        for i in range(TASKS)
+    ]
+
+    for start in range(0, TASKS, 10000):
+
+        repo.create_many(items[start : start + 10000])
+
+    return repo
+
+
+def main():
+
+    repo = build()
+
+    rnd = random.Random(1)
+
+    # 1語または2語の検索
+    # one- and two-word queries
+
+    queries = [" ".join(rnd.sample(WORDS, 1 + n % 2)) for n in range(QUERIES)]
+
+    start = time.perf_counter()
+
+    repo.search(queries[0], 20)
+
+    print(f"index build ({TASKS} tasks): {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+
+    for q in queries:
+
+        repo.search(q, 20)
+
+    indexed = (time.perf_counter() - start) / QUERIES
+
+    start = time.perf_counter()
+
+    for q in queries[:20]:
+
+        words = q.split()
+
+        [t for t in repo.all() if all(w in t.title or w in (t.description or "") for w in words)][:20]
+
+    scanned = (time.perf_counter() - start) / 20
+
+    print(f"scan : {scanned * 1000:8.2f} ms/query")
+
+    print(f"index: {indexed * 1000:8.2f} ms/query  ({scanned / indexed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# benchmarks/bench_startup.py
+#
+# 起動時間の計測（オートスケールで増えたワーカーが応答できるまでの時間）。
+#   既定     : uvicorn のプロセス起動から最初の GET / が 200 を返すまで、と app.main の import 時間
+#   --profile: python -X importtime で app.main の import をモジュール別に分解して表示する
+# ストレージなどの設定は環境変数でそのまま子プロセスに渡る（例: TASK_JOURNAL_DIR を付けると
+# 起動時のジャーナル復元も含めて測れる）。
+# Startup time: how long a freshly started worker takes to answer.
+#   default  : time from spawning uvicorn to the first 200 from GET /, and the import time of app.main
+#   --profile: per-module breakdown of importing app.main, from python -X importtime
+# Settings such as the storage backend pass through to the child processes as
+# environment variables (e.g. set TASK_JOURNAL_DIR to include journal recovery).
+#
+#   cd task.manager2 && python -m benchmarks.bench_startup
+#   cd task.manager2 && python -m benchmarks.bench_startup --profile
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+
+# --profile で表示するモジュールの数
+# number of modules listed by --profile
+
+TOP = int(os.getenv("BENCH_TOP", "20"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_SNIPPET = "import time; s = time.perf_counter(); import app.main; print(time.perf_counter() - s)"
+
+
+def _free_port() -> int:
+
+    with socket.socket() as s:
+
+        s.bind(("127.0.0.1", 0))
+
+        return s.getsockname()[1]
+
+
+def _time_to_first_response() -> float:
+
+    # プロセスの起動から GET / が 200 を返すまで（1ms 間隔で問い合わせる）
+    # from spawning the process until GET / returns 200 (polled every millisecond)
+
+    port = _free_port()
+
+    url = f"http://127.0.0.1:{port}/"
+
+    start = time.perf_counter()
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+
+    try:
+
+        with httpx.Client(timeout=1) as client:
+
+            while True:
+
+                try:
+
+                    if client.get(url).status_code == 200:
+
+                        return time.perf_counter() - start
+
+                except httpx.HTTPError:
+
+                    pass
+
+                if process.poll() is not None:
+
+                    raise RuntimeError("uvicorn exited before answering")
+
+                time.sleep(0.001)
+
+    finally:
+
+        process.terminate()
+
+        process.wait()
+
+
+def _import_time() -> float:
+
+    out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    return float(out.stdout.strip())
+
+
+def _importtime_breakdown() -> List[Tuple[str, int, int]]:
+
+    # (モジュール名, 自身の時間 µs, 配下を含む時間 µs) の一覧
+    # list of (module, self µs, cumulative µs)
+
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+
+    for line in out.stderr.splitlines():
+
+        if not line.startswith("import time:") or "self [us]" in line:
+
+            continue
+
+        own, cumulative, name = line[len("import time:"):].split("|")
+
+        rows.append((name.strip(), int(own), int(cumulative)))
+
+    return rows
+
+
+def _profile() -> None:
+
+    # 複数回の中央値で表示する（1回目はバイトコードのキャッシュ作成を含むので捨てる）
+    # medians over several runs (the first run, which may write bytecode caches, is discarded)
+
+    _importtime_breakdown()
+
+    runs = [_importtime_breakdown() for _ in range(ROUNDS)]
+
+    own: Dict[str, List[int]] = {}
+
+    cumulative: Dict[str, List[int]] = {}
+
+    for rows in runs:
+
+        for name, self_us, cumulative_us in rows:
+
+            own.setdefault(name, []).append(self_us)
+
+            cumulative.setdefault(name, []).append(cumulative_us)
+
+    own_median = {name: statistics.median(values) for name, values in own.items()}
+
+    total = statistics.median(cumulative.get("app.main", [0]))
+
+    print(f"import app.main: {total / 1000:.1f} ms (median of {ROUNDS})")
+
+    print()
+
+    print("by top-level package (self time):")
+
+    packages: Dict[str, float] = {}
+
+    for name, value in own_median.items():
+
+        packages[name.split(".")[0]] = packages.get(name.split(".")[0], 0) + value
+
+    for package, value in sorted(packages.items(), key=lambda item: -item[1])[:TOP]:
+
+        print(f"  {package:32s} {value / 1000:8.2f} ms")
+
+    print()
+
+    print("app modules (self / cumulative):")
+
+    for name in sorted(name for name in own_median if name == "app" or name.startswith("app.")):
+
+        print(f"  {name:32s} {own_median[name] / 1000:8.2f} ms {statistics.median(cumulative[name]) / 1000:8.2f} ms")
+
+    print()
+
+    print(f"slowest {TOP} modules (self time):")
+
+    for name, value in sorted(own_median.items(), key=lambda item: -item[1])[:TOP]:
+
+        print(f"  {name:48s} {value / 1000:8.2f} ms")
+
+
+def main() -> None:
+
+    if "--profile" in sys.argv:
+
+        _profile()
+
+        return
+
+    _import_time()
+
+    imports = [_import_time() for _ in range(ROUNDS)]
+
+    first = [_time_to_first_response() for _ in range(ROUNDS)]
+
+    print(f"import app.main                 : median {statistics.median(imports) * 1000:7.1f} ms   min {min(imports) * 1000:7.1f} ms")
+
+    print(f"uvicorn start -> first GET / 200: median {statistics.median(first) * 1000:7.1f} ms   min {min(first) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+# benchmarks/load.py
+#
+# /tasks に対する負荷試験。決まった乱数の種で同じリクエスト列を再現し、スループットと
+# p50/p95/p99 レイテンシを測って JSON に保存する（コミット間の比較用）。
+#   対象   : inprocess（ASGI アプリを直接呼ぶ）/ uvicorn（ローカルに起動）/ URL（起動済みのサーバー）
+#   負荷   : read-heavy（読み取り中心）/ write-heavy（更新・作成・削除中心）/ bulk（一括 API）
+# Load test for /tasks. A fixed seed replays the same request sequence; throughput
+# and p50/p95/p99 latency are measured and saved as JSON for comparison between commits.
+#   target : inprocess (call the ASGI app directly) / uvicorn (started locally) / a URL (running server)
+#   mix    : read-heavy / write-heavy (updates, creates, deletes) / bulk (the bulk endpoints)
+#
+#   cd task.manager2 && python -m benchmarks.load --target inprocess --tasks 10000 --concurrency 32
+#   cd task.manager2 && python -m benchmarks.load --target uvicorn --workers 4 --env TASK_STORAGE=shared
+#   cd task.manager2 && python -m benchmarks.load --compare benchmarks/results/before.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# 負荷の種類ごとの操作と比率
+# operations and their weights per mix
+
+MIXES: Dict[str, Dict[str, int]] = {
+    "read-heavy": {"get": 80, "list": 10, "update": 5, "create": 5},
+    "write-heavy": {"get": 20, "update": 40, "create": 25, "delete": 15},
+    "bulk": {"bulk_create": 40, "bulk_update": 30, "list_large": 20, "bulk_delete": 10},
+}
+
+BULK_SIZE = 100
+
+PAGE_SIZE = 50
+
+LARGE_PAGE_SIZE = 1000
+
+PERCENTILES = (50, 95, 99)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class Worker:
+
+    # 1本の並行クライアント。自分が作ったタスクだけを削除するので、ストアの大きさはほぼ一定に保たれる
+    # One concurrent client. It only deletes tasks it created, so the store size stays roughly constant
+
+    def __init__(self, client: httpx.AsyncClient, seed: int, max_id: int) -> None:
+
+        self.client = client
+
+        self.rnd = random.Random(seed)
+
+        self.max_id = max_id
+
+        self.created: List[int] = []
+
+    def _id(self) -> int:
+
+        return self.rnd.randint(1, self.max_id)
+
+    async def get(self) -> httpx.Response:
+
+        return await self.client.get(f"/tasks/{self._id()}")
+
+    async def list(self) -> httpx.Response:
+
+        return await self.client.get("/tasks/", params={"limit": PAGE_SIZE, "after_id": self._id()})
+
+    async def list_large(self) -> httpx.Response:
+
+        return await self.client.get("/tasks/", params={"limit": LARGE_PAGE_SIZE, "after_id": self._id()})
+
+    async def update(self) -> httpx.Response:
+
+        return await self.client.put(f"/tasks/{self._id()}", json={"completed": self.rnd.random() < 0.5})
+
+    async def create(self) -> httpx.Response:
+
+        r = await self.client.post("/tasks/", json={"title": f"load {self.rnd.random():.6f}", "description": "created by load test"})
+
+        if r.status_code == 201:
+
+            self.created.append(r.json()["id"])
+
+        return r
+
+    async def delete(self) -> httpx.Response:
+
+        if not self.created:
+
+            return await self.create()
+
+        return await self.client.delete(f"/tasks/{self.created.pop()}")
+
+    async def bulk_create(self) -> httpx.Response:
+
+        rows = [{"title": f"bulk {self.rnd.random():.6f}"} for _ in range(BULK_SIZE)]
+
+        r = await self.client.post("/tasks/bulk", json=rows)
+
+        if r.status_code == 200:
+
+            self.created.extend(item["id"] for item in r.json()["results"] if item["status"] == 201)
+
+        return r
+
+    async def bulk_update(self) -> httpx.Response:
+
+        rows = [{"id": self._id(), "completed": self.rnd.random() < 0.5} for _ in range(BULK_SIZE)]
+
+        return await self.client.patch("/tasks/bulk", json=rows)
+
+    async def bulk_delete(self) -> httpx.Response:
+
+        if not self.created:
+
+            return await self.bulk_create()
+
+        ids, self.created = self.created[-BULK_SIZE:], self.created[:-BULK_SIZE]
+
+        return await self.client.request("DELETE", "/tasks/bulk", json=ids)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+
+    # 最近順位法（nearest-rank）
+    # nearest-rank method
+
+    if not sorted_values:
+
+        return 0.0
+
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+
+    values = sorted(latencies)
+
+    summary: Dict[str, Any] = {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+    }
+
+    for pct in PERCENTILES:
+
+        summary[f"p{pct}_ms"] = round(1000 * percentile(values, pct), 3)
+
+    return summary
+
+
+async def seed_store(client: httpx.AsyncClient, tasks: int) -> int:
+
+    # 一括作成でストアを tasks 件にし、id の最大値を返す
+    # Fill the store to `tasks` tasks with bulk creates and return the largest id
+
+    max_id = 0
+
+    for start in range(0, tasks, 1000):
+
+        rows = [{"title": f"seed {i}", "description": "seeded" if i % 3 else None} for i in range(start, min(start + 1000, tasks))]
+
+        r = await client.post("/tasks/bulk", json=rows)
+
+        r.raise_for_status()
+
+        max_id = max([max_id] + [item["id"] for item in r.json()["results"] if item["status"] == 201])
+
+    return max_id
+
+
+async def run_mix(
+    client: httpx.AsyncClient,
+    mix: str,
+    max_id: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+) -> Dict[str, Any]:
+
+    weights = MIXES[mix]
+
+    operations = list(weights)
+
+    latencies: Dict[str, List[float]] = {op: [] for op in operations}
+
+    errors: Dict[str, int] = {op: 0 for op in operations}
+
+    started = time.perf_counter()
+
+    measure_from = started + warmup
+
+    stop_at = measure_from + duration
+
+    async def run_worker(n: int) -> None:
+
+        worker = Worker(client, seed * 1000 + n, max_id)
+
+        choose: Callable[[], str] = lambda: worker.rnd.choices(operations, weights=[weights[op] for op in operations])[0]
+
+        while True:
+
+            op = choose()
+
+            start = time.perf_counter()
+
+            if start >= stop_at:
+
+                return
+
+            try:
+
+                r = await getattr(worker, op)()
+
+                failed = r.status_code >= 500 or (r.status_code >= 400 and r.status_code != 404)
+
+            except httpx.HTTPError:
+
+                failed = True
+
+            end = time.perf_counter()
+
+            if start >= measure_from:
+
+                latencies[op].append(end - start)
+
+                errors[op] += failed
+
+    await asyncio.gather(*(run_worker(n) for n in range(concurrency)))
+
+    elapsed = time.perf_counter() - measure_from
+
+    everything = [value for values in latencies.values() for value in values]
+
+    result = summarize(everything, elapsed, sum(errors.values()))
+
+    result["operations"] = {op: summarize(latencies[op], elapsed, errors[op]) for op in operations}
+
+    return result
+
+
+def _free_port() -> int:
+
+    with socket.socket() as s:
+
+        s.bind(("127.0.0.1", 0))
+
+        return s.getsockname()[1]
+
+
+def start_uvicorn(workers: int, env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+
+    # task.manager2 をカレントにして uvicorn を起動し、応答するまで待つ
+    # Start uvicorn from task.manager2 and wait until it answers
+
+    port = _free_port()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=root,
+        env={**os.environ, **env},
+    )
+
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 30
+
+    while time.time() < deadline:
+
+        try:
+
+            if httpx.get(url + "/").status_code == 200:
+
+                return process, url
+
+        except httpx.HTTPError:
+
+            pass
+
+        if process.poll() is not None:
+
+            break
+
+        time.sleep(0.1)
+
+    process.terminate()
+
+    raise RuntimeError("uvicorn did not start")
+
+
+def _git_commit() -> Optional[str]:
+
+    try:
+
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+
+        return out.stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+
+    # 基準の結果と比べ、スループットの低下または p99 の悪化が tolerance（割合）を超えたものを返す
+    # Compare with a baseline; returns the mixes whose throughput dropped or p99 grew by more than `tolerance`
+
+    regressions = []
+
+    for mix, now in current["mixes"].items():
+
+        before = baseline.get("mixes", {}).get(mix)
+
+        if before is None:
+
+            continue
+
+        rps = now["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+
+        p99 = now["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+
+        print(f"  {mix:12s} throughput {rps:+7.1%}   p99 {p99:+7.1%}")
+
+        if rps < -tolerance or p99 > tolerance:
+
+            regressions.append(mix)
+
+    return regressions
+
+
+async def run(args: argparse.Namespace, base_url: str, transport: Optional[httpx.AsyncBaseTransport]) -> Dict[str, Any]:
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+
+        max_id = await seed_store(client, args.tasks)
+
+        results = {}
+
+        for mix in args.mix:
+
+            results[mix] = await run_mix(client, mix, max_id, args.concurrency, args.duration, args.warmup, args.seed)
+
+            r = results[mix]
+
+            print(
+                f"{mix:12s} {r['throughput_rps']:9.1f} req/s  "
+                f"p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  errors {r['errors']}"
+            )
+
+        return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description="Load test for the tasks API")
+
+    parser.add_argument("--target", default="inprocess", help="inprocess, uvicorn, or the base URL of a running server")
+
+    parser.add_argument("--mix", default=",".join(MIXES), help="comma-separated mixes: " + ", ".join(MIXES))
+
+    parser.add_argument("--tasks", type=int, default=10000, help="store size seeded before the run")
+
+    parser.add_argument("--concurrency", type=int, default=32)
+
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per mix")
+
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each mix")
+
+    parser.add_argument("--seed", type=int, default=1)
+
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (--target uvicorn)")
+
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="app setting, e.g. TASK_STORAGE=sqlite")
+
+    parser.add_argument("--output", help="JSON result file (default: benchmarks/results/load-<commit>-<target>.json)")
+
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed regression vs the baseline (0.1 = 10%%)")
+
+    args = parser.parse_args(argv)
+
+    args.mix = [m.strip() for m in args.mix.split(",") if m.strip()]
+
+    unknown = [m for m in args.mix if m not in MIXES]
+
+    if unknown:
+
+        parser.error(f"unknown mix: {', '.join(unknown)}")
+
+    env = dict(item.split("=", 1) for item in args.env)
+
+    process = None
+
+    if args.target == "inprocess":
+
+        # 設定は import 時に読まれるので、アプリを読み込む前に反映する
+        # settings are read at import time, so apply them before loading the app
+
+        os.environ.update(env)
+
+        from app.main import app
+
+        base_url, transport = "http://inprocess", httpx.ASGITransport(app=app)
+
+    elif args.target == "uvicorn":
+
+        process, base_url = start_uvicorn(args.workers, env)
+
+        transport = None
+
+    else:
+
+        base_url, transport = args.target.rstrip("/"), None
+
+    try:
+
+        mixes = asyncio.run(run(args, base_url, transport))
+
+    finally:
+
+        if process is not None:
+
+            process.terminate()
+
+            process.wait()
+
+    commit = _git_commit()
+
+    result = {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": "url" if args.target not in ("inprocess", "uvicorn") else args.target,
+        "config": {
+            "tasks": args.tasks,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "workers": args.workers,
+            "env": env,
+        },
+        "mixes": mixes,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{commit or 'unknown'}-{result['target']}.json")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    with open(output, "w", encoding="utf-8") as f:
+
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f"results: {output}")
+
+    if args.compare:
+
+        with open(args.compare, encoding="utf-8") as f:
+
+            baseline = json.load(f)
+
+        print(f"compared with {args.compare} ({baseline.get('commit')}):")
+
+        if (baseline.get("target"), baseline.get("config")) != (result["target"], result["config"]):
+
+            print("  warning: the baseline was run with a different target or config")
+
+        regressions = compare(result, baseline, args.tolerance)
+
+        if regressions:
+
+            print(f"regression beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
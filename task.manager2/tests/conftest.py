@@ -0,0 +1,25 @@
+# tests/conftest.py
+
+import pytest
+
+from app.feed import change_feed
+
+
+@pytest.fixture
+
+def feed():
+
+    # アプリのフィード（書き込み通知を受けている）を 4 件のリングにして空から始め、終わったら元の大きさに戻す
+    # the app's feed (registered as a write listener), emptied and shrunk to a 4-change ring; restored afterwards
+
+    capacity = change_feed.capacity
+
+    change_feed.capacity = 4
+
+    change_feed.reset()
+
+    yield change_feed
+
+    change_feed.capacity = capacity
+
+    change_feed.reset()
@@ -0,0 +1,68 @@
+# tests/test_compression.py
+
+import asyncio
+import gzip
+
+from app.compression import CompressionMiddleware, available_encodings, negotiate
+
+
+def test_compression_negotiates_and_skips_small_bodies():
+
+    assert negotiate("gzip, zstd", ["zstd", "gzip"]) == "zstd"
+
+    assert negotiate("gzip;q=1.0, zstd;q=0.5", ["zstd", "gzip"]) == "gzip"
+
+    assert negotiate("*;q=0.2, gzip;q=0", ["zstd", "gzip"]) == "zstd"
+
+    assert negotiate("identity", ["zstd", "gzip"]) is None
+
+    assert negotiate("", ["gzip"]) is None
+
+    assert "gzip" in available_encodings()
+
+    def respond(*chunks):
+
+        async def app(scope, receive, send):
+
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+
+            for i, chunk in enumerate(chunks):
+
+                await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+        return app
+
+    def call(app, accept="gzip"):
+
+        messages = []
+
+        async def send(message):
+
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", accept.encode())]}
+
+        asyncio.run(CompressionMiddleware(app, encodings=["gzip"], minimum_size=100)(scope, None, send))
+
+        return dict(messages[0]["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+    headers, body = call(respond(b"x" * 10))
+
+    assert b"content-encoding" not in headers and body == b"x" * 10
+
+    headers, body = call(respond(b"x" * 1000))
+
+    assert headers[b"content-encoding"] == b"gzip" and headers[b"vary"] == b"Accept-Encoding"
+
+    assert gzip.decompress(body) == b"x" * 1000
+
+    # ストリーミングはチャンクごとに圧縮し、つなげると1つの gzip になる
+    # streamed chunks are compressed one by one and join into a single gzip stream
+
+    headers, body = call(respond(b"a" * 10, b"b" * 10, b""))
+
+    assert headers[b"content-encoding"] == b"gzip" and gzip.decompress(body) == b"a" * 10 + b"b" * 10
+
+    headers, body = call(respond(b"x" * 1000), accept="identity")
+
+    assert b"content-encoding" not in headers and body == b"x" * 1000
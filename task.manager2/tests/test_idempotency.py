@@ -0,0 +1,48 @@
+# tests/test_idempotency.py
+
+import pytest
+
+from app.idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyMismatch
+
+
+def test_idempotency_cache_replays_and_stays_bounded():
+
+    cache = IdempotencyCache(max_bytes=4000, ttl=60)
+
+    assert cache.begin("k", "body") is None
+
+    with pytest.raises(IdempotencyConflict):
+
+        cache.begin("k", "body")
+
+    cache.complete("k", "body", (201, b"{}", {}))
+
+    assert cache.begin("k", "body") == (201, b"{}", {})
+
+    with pytest.raises(IdempotencyMismatch):
+
+        cache.begin("k", "other body")
+
+    # 上限を超えると古いものから追い出される
+    # past the budget the least recently used entries are evicted
+
+    for n in range(100):
+
+        cache.begin(n, "body")
+
+        cache.complete(n, "body", (201, b"x" * 100, {}))
+
+    assert cache.stats()["bytes"] <= 4000 and cache.evictions > 0
+
+    assert cache.begin(0, "body") is None
+
+    # 期限切れは保存されていないのと同じ
+    # an expired entry is the same as a missing one
+
+    expired = IdempotencyCache(max_bytes=4000, ttl=0)
+
+    expired.begin("k", "body")
+
+    expired.complete("k", "body", (201, b"{}", {}))
+
+    assert expired.begin("k", "body") is None
@@ -0,0 +1,688 @@
+# tests/test_storage.py
+
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from app.cache import ResponseCache
+from app.feed import ChangesGone
+from app.journal import JournalError, TaskJournal
+from app import storage_async
+from app.storage import InMemoryTaskRepository
+from app.storage_sqlite import SQLiteTaskRepository
+
+THREADS = 16
+
+ROUNDS = 200
+
+
+@pytest.fixture(params=["memory", "journal", "sqlite", "shared"])
+
+def repo(request, tmp_path):
+
+    if request.param == "memory":
+
+        yield InMemoryTaskRepository()
+
+    elif request.param == "journal":
+
+        # スナップショットも途中で何度か取られるよう間隔を小さくする
+        # a small interval so snapshots are also taken during the run
+
+        journaled = InMemoryTaskRepository(TaskJournal(str(tmp_path / "journal"), snapshot_every=500))
+
+        yield journaled
+
+        journaled.close()
+
+    else:
+
+        # "shared" は小さなブロックで id を先取りし、ブロックの境目を何度も通す
+        # "shared" leases ids in small blocks so block boundaries are crossed often
+
+        id_block = 7 if request.param == "shared" else 0
+
+        sqlite_repo = SQLiteTaskRepository(str(tmp_path / "tasks.db"), pool_size=THREADS, id_block=id_block)
+
+        yield sqlite_repo
+
+        sqlite_repo.close()
+
+
+def _run_threads(target, count=THREADS):
+
+    barrier = threading.Barrier(count)
+
+    errors = []
+
+    def runner(n):
+
+        try:
+
+            barrier.wait()
+
+            target(n)
+
+        except Exception as e:  # pragma: no cover - surfaced by the assert below
+
+            errors.append(e)
+
+    threads = [threading.Thread(target=runner, args=(n,)) for n in range(count)]
+
+    for t in threads:
+
+        t.start()
+
+    for t in threads:
+
+        t.join()
+
+    assert errors == []
+
+
+def test_concurrent_alloc_id_is_unique():
+
+    store = InMemoryTaskRepository()
+
+    seen = [[] for _ in range(THREADS)]
+
+    def work(n):
+
+        for _ in range(ROUNDS * 10):
+
+            seen[n].append(store.alloc_id())
+
+    _run_threads(work)
+
+    ids = [i for chunk in seen for i in chunk]
+
+    assert len(ids) == len(set(ids)) == THREADS * ROUNDS * 10
+
+
+def test_concurrent_create_update_delete_keeps_store_consistent(repo):
+
+    # 各スレッドが自分のタスクを作成・更新・削除し、最後に状態とインデックスを検証する
+    # each thread creates, updates and deletes its own tasks; state and indexes are checked at the end
+
+    expected = {}
+
+    lock = threading.Lock()
+
+    def work(n):
+
+        mine = {}
+
+        for r in range(ROUNDS):
+
+            task = repo.create(f"t{n}-{r}")
+
+            mine[task.id] = task.title
+
+            if r % 3 == 0:
+
+                title = f"t{n}-{r}-updated"
+
+                assert repo.update(task.id, {"title": title, "completed": True}) is not None
+
+                mine[task.id] = title
+
+            if r % 5 == 0:
+
+                assert repo.remove(task.id)
+
+                del mine[task.id]
+
+                assert repo.update(task.id, {"title": "ghost"}) is None
+
+        with lock:
+
+            expected.update(mine)
+
+    _run_threads(work)
+
+    everything, _ = repo.page()
+
+    assert {t.id: t.title for t in everything} == expected
+
+    assert repo.count() == len(expected)
+
+    done, _ = repo.page(completed=True)
+
+    todo, _ = repo.page(completed=False)
+
+    assert sorted(t.id for t in done + todo) == sorted(expected)
+
+    assert all(t.completed for t in done) and not any(t.completed for t in todo)
+
+
+def test_concurrent_updates_to_one_task_are_not_lost(repo):
+
+    # 同じタスクの別フィールドを並行して更新しても、どちらの更新も残る
+    # concurrent updates to different fields of one task both survive
+
+    task = repo.create("shared")
+
+    def work(n):
+
+        for r in range(ROUNDS):
+
+            if n % 2:
+
+                repo.update(task.id, {"title": f"title-{n}-{r}"})
+
+            else:
+
+                repo.update(task.id, {"description": f"desc-{n}-{r}"})
+
+        if n == 1:
+
+            repo.update(task.id, {"completed": True})
+
+    _run_threads(work, count=2)
+
+    final = repo.get(task.id)
+
+    assert final.title == f"title-1-{ROUNDS - 1}"
+
+    assert final.description == f"desc-0-{ROUNDS - 1}"
+
+    assert final.completed is True
+
+
+def test_search_follows_writes(repo):
+
+    # 作成・更新・削除がすぐ検索結果に反映され、日本語（バイグラム）と英語の両方で引ける
+    # creates, updates and deletes show up in search at once; Japanese (bigrams) and English both match
+
+    meeting = repo.create("定例会議の準備", "議事録を作る")
+
+    review = repo.create("Review PR", "会議の後で")
+
+    repo.create("買い物")
+
+    def ids(query, limit=10, offset=0):
+
+        records, total = repo.search(query, limit, offset)
+
+        return {r.id for r in records}, total
+
+    assert ids("会議") == ({meeting.id, review.id}, 2)
+
+    assert ids("議事録 準備") == ({meeting.id}, 1)
+
+    assert ids("REVIEW") == ({review.id}, 1)
+
+    assert ids("会") == ({meeting.id, review.id}, 2)
+
+    assert ids("会議 review") == ({review.id}, 1)
+
+    assert ids("存在しない") == (set(), 0)
+
+    repo.update(review.id, {"title": "Merge branch", "description": "done"})
+
+    assert ids("review") == (set(), 0)
+
+    assert ids("merge") == ({review.id}, 1)
+
+    repo.remove(meeting.id)
+
+    assert ids("会議") == (set(), 0)
+
+    created = repo.create_many([(f"bulk task {i}", None) for i in range(25)])
+
+    pages = [repo.search("bulk", 10, offset)[0] for offset in (0, 10, 20)]
+
+    assert sorted(r.id for page in pages for r in page) == [r.id for r in created]
+
+    assert repo.search("bulk", 10, 20)[1] == 25
+
+
+def test_sorted_and_range_pages_follow_writes(repo):
+
+    # 並び順・id の範囲・completed の組み合わせで、カーソルでたどったページが全件を並べ替えた結果と一致する
+    # （タイトルの変更・完了・削除の後も二次インデックスが追従している）
+    # for every combination of order, id range and completed, walking the pages by cursor
+    # matches a full sort of the store, also after title changes, completions and deletes
+
+    created = repo.create_many([(f"task {(i * 7) % 13:02d}", None) for i in range(40)])
+
+    for record in created[::3]:
+
+        repo.update(record.id, {"completed": True})
+
+    for record in created[::5]:
+
+        repo.update(record.id, {"title": f"renamed {record.id % 4}"})
+
+    for record in created[::11]:
+
+        repo.remove(record.id)
+
+    everything = repo.page()[0]
+
+    low, high = created[5].id, created[30].id
+
+    keys = {"id": lambda t: t.id, "title": lambda t: (t.title, t.id)}
+
+    for sort in ("id", "-id", "title", "-title"):
+
+        for completed in (None, False, True):
+
+            for min_id, max_id in ((None, None), (low, None), (None, high), (low, high)):
+
+                expected = sorted(
+                    (
+                        t for t in everything
+                        if (completed is None or t.completed is completed)
+                        and (min_id is None or t.id >= min_id)
+                        and (max_id is None or t.id <= max_id)
+                    ),
+                    key=keys[sort.lstrip("-")],
+                    reverse=sort.startswith("-"),
+                )
+
+                query = dict(sort=sort, completed=completed, min_id=min_id, max_id=max_id)
+
+                pages, after_title, after_id = [], None, None
+
+                while True:
+
+                    records, next_cursor = repo.page(limit=4, after_id=after_id, after_title=after_title, **query)
+
+                    pages += records
+
+                    if next_cursor is None:
+
+                        break
+
+                    after_title, after_id = records[-1].title, next_cursor
+
+                assert [t.id for t in pages] == [t.id for t in expected], query
+
+                assert [t.id for t in repo.page(**query)[0]] == [t.id for t in expected], query
+
+
+def _create_in_worker(path, n):
+
+    repo = SQLiteTaskRepository(path, pool_size=2, id_block=5)
+
+    try:
+
+        ids = [repo.create(f"w{n}-{r}").id for r in range(ROUNDS // 4)]
+
+        ids += [t.id for t in repo.create_many([(f"w{n}-bulk-{r}", None) for r in range(12)])]
+
+        return ids
+
+    finally:
+
+        repo.close()
+
+
+def test_workers_sharing_a_file_get_unique_ids_and_one_view(tmp_path):
+
+    # 別プロセスのワーカーが同じファイルに書き込んでも id は重複せず、全員が同じ内容を見る
+    # workers in separate processes writing to one file never share an id and see the same tasks
+
+    path = str(tmp_path / "shared.db")
+
+    workers = 4
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        results = list(pool.map(_create_in_worker, [path] * workers, range(workers)))
+
+    ids = [i for chunk in results for i in chunk]
+
+    assert len(ids) == len(set(ids)) == workers * (ROUNDS // 4 + 12)
+
+    # 通常の AUTOINCREMENT の挿入とも衝突しない
+    # plain AUTOINCREMENT inserts do not collide with leased ids either
+
+    plain = SQLiteTaskRepository(path)
+
+    try:
+
+        plain_id = plain.create("plain").id
+
+        assert plain_id > max(ids)
+
+        everything, _ = plain.page()
+
+        assert [t.id for t in everything] == sorted(ids + [plain_id])
+
+    finally:
+
+        plain.close()
+
+
+def _state(repo):
+
+    return [(t.id, t.title, t.description, t.completed, t.version) for t in repo.page()[0]]
+
+
+@pytest.mark.parametrize("snapshot_every", [1_000_000, 50])
+
+def test_journal_recovers_the_store_after_restart(tmp_path, snapshot_every):
+
+    # ログだけ / スナップショット + ログの続き のどちらからでも同じ状態に戻る
+    # the same state comes back from the log alone and from a snapshot plus the log tail
+
+    directory = str(tmp_path / "journal")
+
+    journal = TaskJournal(directory, snapshot_every=snapshot_every)
+
+    repo = InMemoryTaskRepository(journal)
+
+    created = repo.create_many([(f"bulk {i}", "説明" if i % 2 else None) for i in range(120)])
+
+    for record in created[::3]:
+
+        repo.update(record.id, {"completed": True, "title": f"{record.title} done"})
+
+    repo.remove_many([record.id for record in created[::7]])
+
+    last = repo.create("last")
+
+    repo.remove(last.id)
+
+    expected = _state(repo)
+
+    repo.close()
+
+    assert (journal.snapshots > 0) == (snapshot_every == 50)
+
+    restored = InMemoryTaskRepository(TaskJournal(directory, snapshot_every=snapshot_every))
+
+    try:
+
+        assert _state(restored) == expected
+
+        assert [t.id for t in restored.page(completed=True)[0]] == [i for i, _, _, done, _ in expected if done]
+
+        # 削除済みの最大 id も再利用しない
+        # the largest id is not reused even though it was deleted
+
+        assert restored.create("after restart").id == last.id + 1
+
+    finally:
+
+        restored.close()
+
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+
+    directory = tmp_path / "journal"
+
+    repo = InMemoryTaskRepository(TaskJournal(str(directory)))
+
+    repo.create("kept")
+
+    repo.close()
+
+    # クラッシュで最後の行が途中までしか書かれなかった状態
+    # a crash left the last line half-written
+
+    segment = sorted(directory.glob("wal.*.log"))[-1]
+
+    with open(segment, "ab") as f:
+
+        f.write(b'["p",2,"lo')
+
+    restored = InMemoryTaskRepository(TaskJournal(str(directory)))
+
+    try:
+
+        assert [t.title for t in restored.page()[0]] == ["kept"]
+
+    finally:
+
+        restored.close()
+
+
+def test_journal_write_error_fails_writes_instead_of_hanging(tmp_path, monkeypatch, feed):
+
+    directory = str(tmp_path / "journal")
+
+    journal = TaskJournal(directory)
+
+    repo = InMemoryTaskRepository(journal)
+
+    kept = repo.create("kept")
+
+    target = repo.create("target")
+
+    # ディスクがいっぱいになった状態
+    # the disk is full
+
+    def full(chunk):
+
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(journal, "_write", full)
+
+    result = []
+
+    def write():
+
+        try:
+
+            repo.update(target.id, {"title": "lost", "completed": True})
+
+        except JournalError as e:
+
+            result.append(e)
+
+    writer = threading.Thread(target=write)
+
+    writer.start()
+
+    writer.join(timeout=5)
+
+    assert not writer.is_alive() and len(result) == 1
+
+    # 以後の書き込みもコミットを待たずに、何も変えずに失敗する
+    # later writes fail at once, without waiting for a commit and without changing anything
+
+    with pytest.raises(JournalError, match="No space left"):
+
+        repo.create("also lost")
+
+    with pytest.raises(JournalError):
+
+        repo.remove(kept.id)
+
+    with pytest.raises(JournalError):
+
+        repo.create_many([("lost", None)])
+
+    # ディスクに届かなかった更新は戻され、読み手には通知される
+    # the update that never reached the disk is undone, and listeners hear about it
+
+    assert [(t.id, t.title, t.completed) for t in repo.all()] == [(kept.id, "kept", False), (target.id, "target", False)]
+
+    assert repo.get(target.id).title == "target" and repo.get(target.id + 1) is None
+
+    assert [t.id for t in repo.page(completed=True)[0]] == []
+
+    assert [t.title for t in repo.page(sort="title")[0]] == ["kept", "target"]
+
+    assert feed.read(0, 10) == [(1, "create", kept.id), (2, "create", target.id), (3, "update", target.id)]
+
+    repo.close()
+
+    restored = InMemoryTaskRepository(TaskJournal(directory))
+
+    try:
+
+        assert [(t.id, t.title, t.completed) for t in restored.all()] == [(kept.id, "kept", False), (target.id, "target", False)]
+
+    finally:
+
+        restored.close()
+
+
+def test_change_feed_follows_writes_and_drops_old_changes(repo, feed):
+
+    a = repo.create("a")
+
+    b = repo.create("b")
+
+    repo.update(a.id, {"completed": True})
+
+    repo.remove(b.id)
+
+    assert feed.read(0, 10) == [(1, "create", a.id), (2, "create", b.id), (3, "update", a.id), (4, "delete", b.id)]
+
+    assert feed.read(2, 1) == [(3, "update", a.id)]
+
+    repo.create_many([("c", None), ("d", None)])
+
+    # リングバッファから押し出された範囲と、まだ無い範囲は読めない
+    # ranges pushed out of the ring buffer, and ranges not written yet, are unavailable
+
+    assert not feed.available(1)
+
+    assert feed.available(2) and [seq for seq, _, _ in feed.read(2, 10)] == [3, 4, 5, 6]
+
+    assert not feed.available(7)
+
+    for since, epoch in ((1, None), (7, None), (2, "another epoch")):
+
+        with pytest.raises(ChangesGone) as gone:
+
+            feed.read(since, 10, epoch=epoch)
+
+        assert (gone.value.epoch, gone.value.last_seq) == (feed.epoch, 6)
+
+
+def test_response_cache_drops_task_keys_on_every_write():
+
+    cache = ResponseCache(max_bytes=4000)
+
+    # 作成でも同じ id の古い応答を捨てる（新しいストアは id を再利用する）
+    # a create also drops an old response for the same id (a fresh store reuses ids)
+
+    for operation in ("create", "update", "delete"):
+
+        cache.put(("task", 1), b"old", {}, cache.generation)
+
+        cache.put(("page", None), b"[old]", {}, cache.generation)
+
+        cache.on_write(operation, [1])
+
+        assert cache.get(("task", 1)) is None and cache.get(("page", None)) is None
+
+
+def test_response_cache_reads_the_shared_version_off_the_event_loop(tmp_path):
+
+    # 共有ストレージ: 他のワーカーの書き込みでキャッシュを捨てる。バージョンはイベントループでなくリポジトリのスレッドで読む
+    # shared storage: another worker's write drops the cache; the version is read on the repository's threads, not the event loop
+
+    path = str(tmp_path / "tasks.db")
+
+    mine, other = SQLiteTaskRepository(path, pool_size=2), SQLiteTaskRepository(path, pool_size=2)
+
+    threads, version = [], mine.collection_version
+
+    mine.collection_version = lambda: threads.append(threading.get_ident()) or version()
+
+    repo = storage_async.AsyncThreadedTaskRepository(mine, max_workers=1)
+
+    cache = ResponseCache(max_bytes=4000)
+
+    cache.async_validator = repo.collection_version
+
+    def lookup():
+
+        return asyncio.run(cache.get_async(("page", None)))
+
+    try:
+
+        assert lookup() is None
+
+        cache.put(("page", None), b"[]", {}, cache.generation)
+
+        assert lookup() == (b"[]", {})
+
+        other.create("a")
+
+        assert lookup() is None
+
+        assert len(threads) == 3 and threading.get_ident() not in threads
+
+    finally:
+
+        repo.close()
+
+        mine.close()
+
+        other.close()
+
+
+def test_collection_version_moves_only_when_something_changed(repo):
+
+    # 無い id の更新・削除や変更なしの更新では一覧の ETag（ストア全体のバージョン）を変えない
+    # updating or removing a missing id, or an empty update, leaves the store-wide version (list ETag) alone
+
+    task = repo.create("a")
+
+    version = repo.collection_version()
+
+    assert repo.update(10**6, {"title": "x"}) is None
+
+    assert not repo.remove(10**6)
+
+    assert repo.update(task.id, {}).version == task.version
+
+    repo.update_many([(10**6, {"completed": True})])
+
+    repo.remove_many([10**6])
+
+    assert repo.collection_version() == version
+
+    repo.update(task.id, {"completed": True})
+
+    assert repo.collection_version() != version
+
+
+def test_async_repository_shuts_down_the_old_executor_when_the_store_changes(tmp_path, monkeypatch):
+
+    stores = [SQLiteTaskRepository(str(tmp_path / name), pool_size=2) for name in ("old.db", "new.db")]
+
+    monkeypatch.setattr(storage_async, "_async_repository", None)
+
+    monkeypatch.setattr(storage_async, "get_repository", lambda: stores[0])
+
+    try:
+
+        old = storage_async.get_async_repository()
+
+        assert asyncio.run(old.create("a")).id == 1
+
+        assert storage_async.get_async_repository() is old
+
+        # アプリの再起動でリポジトリが作り直された
+        # an app restart recreated the repository
+
+        monkeypatch.setattr(storage_async, "get_repository", lambda: stores[1])
+
+        new = storage_async.get_async_repository()
+
+        assert new is not old and new.sync is stores[1]
+
+        with pytest.raises(RuntimeError, match="shutdown"):
+
+            asyncio.run(old.count())
+
+        assert asyncio.run(new.count()) == 0
+
+    finally:
+
+        storage_async.get_async_repository().close()
+
+        for store in stores:
+
+            store.close()
@@ -0,0 +1,610 @@
+# tests/test_tasks.py
+
+import asyncio
+import base64
+import importlib
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.config import settings
+from app.idempotency import idempotency_cache
+from app.schemes import MAX_BULK_ITEMS
+
+
+@pytest.fixture(params=["sync", "async"])
+
+def app(request, monkeypatch):
+
+    # TASK_ROUTES=sync / async の両方のルーターで同じテストを通す。ルーターは app.main の読み込み時に選ばれるので読み込み直す
+    # run every test against both routers (TASK_ROUTES=sync / async); app.main picks the router on import, so reload it
+
+    monkeypatch.setattr(settings, "task_routes", request.param)
+
+    return importlib.reload(main).app
+
+
+def test_restart_in_one_process_starts_from_an_empty_store(app):
+
+    # 同じプロセスで2回起動しても、前のストアのキャッシュ・保存した応答・変更フィードは残らない
+    # starting twice in one process leaves no cached responses, stored replies or changes from the previous store
+
+    with TestClient(app) as first:
+
+        old = first.post("/tasks/", json={"title": "old"}, headers={"Idempotency-Key": "k"}).json()
+
+        assert first.get(f"/tasks/{old['id']}").json()["title"] == "old"
+
+        assert [t["title"] for t in first.get("/tasks/").json()] == ["old"]
+
+        last_seq = first.get("/tasks/changes").json()["last_seq"]
+
+    with TestClient(app) as second:
+
+        assert second.get(f"/tasks/{old['id']}").status_code == 404
+
+        assert second.get("/tasks/").json() == []
+
+        assert second.get("/tasks/changes", params={"since": last_seq}).status_code == 410
+
+        # 新しいストアは同じ id を振り直す
+        # the new store hands out the same id again
+
+        new = second.post("/tasks/", json={"title": "new"}).json()
+
+        assert new["id"] == old["id"]
+
+        assert second.get(f"/tasks/{new['id']}").json()["title"] == "new"
+
+        assert [t["title"] for t in second.get("/tasks/").json()] == ["new"]
+
+        replay = second.post("/tasks/", json={"title": "old"}, headers={"Idempotency-Key": "k"})
+
+        assert replay.status_code == 201 and "Idempotent-Replayed" not in replay.headers
+
+        assert [c["id"] for c in second.get("/tasks/changes").json()["changes"]] == [new["id"], replay.json()["id"]]
+
+
+def test_pages_follow_the_next_cursor_header(app):
+
+    with TestClient(app) as client:
+
+        ids = [client.post("/tasks/", json={"title": f"t{i}"}).json()["id"] for i in range(7)]
+
+        client.put(f"/tasks/{ids[1]}", json={"completed": True})
+
+        # 続きがある間は X-Next-Cursor が返り、after_id にそのまま渡せる。最後のページには付かない
+        # X-Next-Cursor is returned while more tasks follow and works as after_id; the last page has none
+
+        seen, after_id = [], None
+
+        while True:
+
+            r = client.get("/tasks/", params={"limit": 3, **({"after_id": after_id} if after_id else {})})
+
+            assert r.status_code == 200
+
+            seen += [t["id"] for t in r.json()]
+
+            after_id = r.headers.get("X-Next-Cursor")
+
+            if after_id is None:
+
+                break
+
+            assert int(after_id) == seen[-1]
+
+        assert seen == ids
+
+        r = client.get("/tasks/", params={"limit": 3, "completed": False})
+
+        assert [t["id"] for t in r.json()] == [ids[0], ids[2], ids[3]]
+
+        r = client.get("/tasks/", params={"limit": 3, "completed": False, "after_id": r.headers["X-Next-Cursor"]})
+
+        assert [t["id"] for t in r.json()] == ids[4:]
+
+        assert "X-Next-Cursor" not in r.headers
+
+        assert client.get("/tasks/", params={"after_id": -1}).status_code == 422
+
+
+def _cursor(value):
+
+    # タイトル順のカーソルと同じ形（JSON を URL 用 base64 にし、末尾の = を落とす）
+    # shaped like a title-order cursor: URL-safe base64 of JSON, trailing = dropped
+
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_sorted_pages_follow_the_cursor_and_reject_bad_ones(app):
+
+    with TestClient(app) as client:
+
+        titles = ["pear", "apple", "fig", "apple", "banana", "りんご", "cherry"]
+
+        created = [row["task"] for row in client.post("/tasks/bulk", json=[{"title": t} for t in titles]).json()["results"]]
+
+        client.put(f"/tasks/{created[2]['id']}", json={"completed": True})
+
+        by_title = sorted((t["title"], t["id"]) for t in created)
+
+        def pages(**params):
+
+            seen, cursor = [], None
+
+            while True:
+
+                r = client.get("/tasks/", params={"limit": 3, **params, **({"cursor": cursor} if cursor else {})})
+
+                assert r.status_code == 200
+
+                seen += [(t["title"], t["id"]) for t in r.json()]
+
+                cursor = r.headers.get("X-Next-Cursor")
+
+                if cursor is None:
+
+                    return seen
+
+                # タイトル順のカーソルはページ最後の [タイトル, id]、id 順は最後の id
+                # a title-order cursor is the page's last [title, id]; an id-order one is its last id
+
+                if params["sort"].lstrip("-") == "title":
+
+                    assert cursor == _cursor(list(seen[-1]))
+
+                else:
+
+                    assert cursor == str(seen[-1][1])
+
+        # 同じタイトルは id 順。完了・id 範囲の絞り込みもカーソルで続けて読める
+        # equal titles go by id; the completed and id-range filters keep working across cursor pages
+
+        assert pages(sort="title") == by_title
+
+        assert pages(sort="-title") == by_title[::-1]
+
+        assert pages(sort="-id") == sorted(by_title, key=lambda t: -t[1])
+
+        assert pages(sort="title", completed=False) == [t for t in by_title if t[0] != "fig"]
+
+        low, high = created[1]["id"], created[4]["id"]
+
+        assert pages(sort="-title", min_id=low, max_id=high) == [t for t in by_title[::-1] if low <= t[1] <= high]
+
+        # 壊れたカーソル・別の並び順のカーソル・タイトル順での after_id は 422
+        # a malformed cursor, a cursor for another order, and after_id with a title order get 422
+
+        bad = [
+            {"sort": "title", "cursor": "not base64!"},
+            {"sort": "title", "cursor": _cursor(["apple"])},
+            {"sort": "title", "cursor": _cursor([1, 2])},
+            {"sort": "title", "cursor": _cursor(["apple", True])},
+            {"sort": "title", "cursor": "3"},
+            {"sort": "id", "cursor": _cursor(["apple", 2])},
+            {"sort": "-id", "cursor": "-1"},
+            {"sort": "title", "after_id": 2},
+            {"sort": "size"},
+        ]
+
+        for params in bad:
+
+            assert client.get("/tasks/", params=params).status_code == 422, params
+
+
+def test_bulk_reports_each_row_and_limits_the_batch(app):
+
+    with TestClient(app) as client:
+
+        r = client.post("/tasks/bulk", json=[{"title": "a"}, {"title": ""}, {"title": "b"}])
+
+        assert r.status_code == 200
+
+        created = r.json()
+
+        assert (created["succeeded"], created["failed"]) == (2, 1)
+
+        assert [row["status"] for row in created["results"]] == [201, 422, 201]
+
+        a, bad, b = created["results"]
+
+        assert a["task"]["title"] == "a" and b["id"] == a["id"] + 1
+
+        assert [e["loc"] for e in bad["error"]] == [["title"]]
+
+        r = client.patch("/tasks/bulk", json=[{"id": a["id"], "completed": True}, {"id": 999, "title": "x"}, {"title": "no id"}])
+
+        assert [row["status"] for row in r.json()["results"]] == [200, 404, 422]
+
+        assert r.json()["results"][0]["task"]["completed"] is True
+
+        r = client.request("DELETE", "/tasks/bulk", json=[b["id"], "abc", b["id"], 0])
+
+        assert [row["status"] for row in r.json()["results"]] == [200, 422, 404, 422]
+
+        # 失敗した行はどれも同じ形（{loc, msg, type} の配列）
+        # every failed row has the same shape (a list of {loc, msg, type})
+
+        failed = [row for row in created["results"] + r.json()["results"] if row["status"] >= 400]
+
+        assert all(set(e) == {"loc", "msg", "type"} for row in failed for e in row["error"])
+
+        assert failed[-2]["error"] == [{"loc": ["id"], "msg": "Task not found", "type": "not_found"}]
+
+        assert [e["type"] for e in failed[-1]["error"]] == ["greater_than_equal"]
+
+        # 上限を超えるバッチは行ごとの結果を作らず 422
+        # a batch over the limit is rejected as a whole with 422
+
+        too_many = [{"title": "x"}] * (MAX_BULK_ITEMS + 1)
+
+        assert client.post("/tasks/bulk", json=too_many).status_code == 422
+
+        assert client.request("DELETE", "/tasks/bulk", json=list(range(1, MAX_BULK_ITEMS + 2))).status_code == 422
+
+        assert [t["title"] for t in client.get("/tasks/").json()] == ["a"]
+
+
+def test_idempotency_key_replays_the_first_response(app):
+
+    with TestClient(app) as client:
+
+        key = {"Idempotency-Key": "k1"}
+
+        first = client.post("/tasks/", json={"title": "a"}, headers=key)
+
+        replay = client.post("/tasks/", json={"title": "a"}, headers=key)
+
+        assert first.status_code == replay.status_code == 201 and "Idempotent-Replayed" not in first.headers
+
+        assert replay.headers["Idempotent-Replayed"] == "true"
+
+        assert replay.json() == first.json() and replay.headers["ETag"] == first.headers["ETag"]
+
+        # 同じキーで本文が違えば 422。キー無しならいつも新しく作る
+        # the same key with another body gets 422; without a key every request creates a task
+
+        assert client.post("/tasks/", json={"title": "b"}, headers=key).status_code == 422
+
+        assert client.post("/tasks/", json={"title": "a"}).json()["id"] == first.json()["id"] + 1
+
+        # 最初の要求がまだ処理中（キャッシュに処理中の印がある）の間、同じキーの再送は 409。
+        # 最初の要求が失敗して印が外れれば、同じキーでやり直せる
+        # while the first request is still running (the cache marks its key in progress) a retry
+        # with the key gets 409; once that request fails and releases the key, the retry goes through
+
+        idempotency_cache.begin(("create", "k2"), "first request")
+
+        retry = {"Idempotency-Key": "k2"}
+
+        assert client.post("/tasks/", json={"title": "slow"}, headers=retry).status_code == 409
+
+        idempotency_cache.release(("create", "k2"))
+
+        slow = client.post("/tasks/", json={"title": "slow"}, headers=retry)
+
+        assert slow.status_code == 201
+
+        assert client.post("/tasks/", json={"title": "slow"}, headers=retry).json() == slow.json()
+
+        # 一括作成も同じ。キーはエンドポイントごとなので、作成で使った k1 とはぶつからない
+        # bulk creates work the same way; keys are per endpoint, so this does not collide with the k1 used above
+
+        batch = [{"title": "x"}, {"title": ""}]
+
+        bulk = client.post("/tasks/bulk", json=batch, headers=key)
+
+        again = client.post("/tasks/bulk", json=batch, headers=key)
+
+        assert bulk.status_code == again.status_code == 200 and again.headers["Idempotent-Replayed"] == "true"
+
+        assert again.json() == bulk.json() and [row["status"] for row in bulk.json()["results"]] == [201, 422]
+
+        assert client.post("/tasks/bulk", json=batch[:1], headers=key).status_code == 422
+
+        assert [t["title"] for t in client.get("/tasks/").json()] == ["a", "a", "slow", "x"]
+
+
+def test_export_streams_every_task_as_ndjson(app):
+
+    with TestClient(app) as client:
+
+        client.post("/tasks/bulk", json=[{"title": f"t{i}", "description": "説明"} for i in range(2500)])
+
+        client.put("/tasks/2", json={"completed": True})
+
+        r = client.get("/tasks/export")
+
+        assert r.status_code == 200 and r.headers["content-type"] == "application/x-ndjson"
+
+        lines = r.text.splitlines()
+
+        assert [json.loads(line)["id"] for line in lines] == list(range(1, 2501))
+
+        assert json.loads(lines[1]) == {"id": 2, "title": "t1", "description": "説明", "completed": True}
+
+        r = client.get("/tasks/export", params={"completed": True})
+
+        assert [json.loads(line)["id"] for line in r.text.splitlines()] == [2]
+
+
+def test_search_ranks_matches_and_pages_with_offset(app):
+
+    with TestClient(app) as client:
+
+        in_description = client.post("/tasks/", json={"title": "Review PR", "description": "会議の後でコメントに返信する"}).json()
+
+        in_title = client.post("/tasks/", json={"title": "定例会議", "description": "議事録を作る"}).json()
+
+        client.post("/tasks/", json={"title": "買い物"})
+
+        # 関連度順（タイトルの一致が説明の一致より上）。一致総数は X-Total-Count、全部返した時は X-Next-Cursor 無し
+        # relevance order (a title match above a description match); the total is in X-Total-Count, no X-Next-Cursor when all were returned
+
+        r = client.get("/tasks/search", params={"q": "会議"})
+
+        assert r.status_code == 200 and r.headers["X-Total-Count"] == "2" and "X-Next-Cursor" not in r.headers
+
+        assert r.json() == [in_title, in_description]
+
+        assert client.get("/tasks/search", params={"q": "会議 review"}).json() == [in_description]
+
+        # 更新・削除はすぐ検索に反映される
+        # updates and deletes show up in search at once
+
+        client.put(f"/tasks/{in_description['id']}", json={"title": "Merge branch", "description": "done"})
+
+        client.delete(f"/tasks/{in_title['id']}")
+
+        r = client.get("/tasks/search", params={"q": "会議"})
+
+        assert r.json() == [] and r.headers["X-Total-Count"] == "0"
+
+        assert [t["id"] for t in client.get("/tasks/search", params={"q": "MERGE"}).json()] == [in_description["id"]]
+
+        # X-Next-Cursor は次の offset。たどると一致したタスクを1回ずつ全部返す
+        # X-Next-Cursor is the next offset; following it returns every match exactly once
+
+        created = client.post("/tasks/bulk", json=[{"title": f"bulk task {i}"} for i in range(25)]).json()["results"]
+
+        pages, offset = [], 0
+
+        while offset is not None:
+
+            r = client.get("/tasks/search", params={"q": "bulk", "limit": 10, "offset": offset})
+
+            assert r.headers["X-Total-Count"] == "25"
+
+            pages.append([t["id"] for t in r.json()])
+
+            offset = r.headers.get("X-Next-Cursor")
+
+        assert [len(page) for page in pages] == [10, 10, 5]
+
+        assert sorted(sum(pages, [])) == [row["id"] for row in created]
+
+        for params in ({}, {"q": ""}, {"q": "x", "offset": 10001}, {"q": "x", "limit": 0}):
+
+            assert client.get("/tasks/search", params=params).status_code == 422
+
+
+def _read_events(client, path, count, headers=()):
+
+    # TestClient は本文の終わりまで待つので、終わらない SSE はアプリの ASGI を直接呼んで読み、
+    # count 件のイベントが届いたら切断する（TestClient のイベントループ上で動かす）
+    # TestClient waits for the end of the body, so the endless SSE stream is read by calling
+    # the ASGI app directly, disconnecting after `count` events (on TestClient's event loop)
+
+    async def read():
+
+        events, started, done, buffer = [], [], asyncio.Event(), [b""]
+
+        async def receive():
+
+            if not started:
+
+                started.append(True)
+
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            await done.wait()
+
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+
+            if message["type"] != "http.response.body":
+
+                assert message["status"] == 200 and (b"content-type", b"text/event-stream; charset=utf-8") in message["headers"]
+
+                return
+
+            *blocks, buffer[0] = (buffer[0] + message.get("body", b"")).split(b"\n\n")
+
+            # ": keep-alive" などのコメントだけのブロックは飛ばす
+            # skip comment-only blocks such as ": keep-alive"
+
+            fields = [dict(line.split(": ", 1) for line in block.decode().split("\n") if not line.startswith(":")) for block in blocks]
+
+            events.extend(event for event in fields if event)
+
+            if len(events) >= count:
+
+                done.set()
+
+        route, _, query = path.partition("?")
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": route,
+            "raw_path": route.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+
+        await asyncio.wait_for(client.app(scope, receive, send), 5)
+
+        return events[:count]
+
+    return client.portal.call(read)
+
+
+def test_changes_follow_writes_as_json_and_server_sent_events(app, feed):
+
+    with TestClient(app) as client:
+
+        a = client.post("/tasks/", json={"title": "a"}).json()
+
+        b = client.post("/tasks/", json={"title": "b"}).json()
+
+        a = client.put(f"/tasks/{a['id']}", json={"completed": True}).json()
+
+        client.delete(f"/tasks/{b['id']}")
+
+        # 変更は古い順に、今のタスク（削除済みなら null）を付けて返る。続きは since=last_seq
+        # changes come oldest first with the task's current state (null once deleted); continue with since=last_seq
+
+        r = client.get("/tasks/changes")
+
+        assert r.status_code == 200
+
+        epoch = r.json()["epoch"]
+
+        assert r.json() == {
+            "epoch": epoch,
+            "last_seq": 4,
+            "changes": [
+                {"seq": 1, "op": "create", "id": a["id"], "task": a},
+                {"seq": 2, "op": "create", "id": b["id"], "task": None},
+                {"seq": 3, "op": "update", "id": a["id"], "task": a},
+                {"seq": 4, "op": "delete", "id": b["id"], "task": None},
+            ],
+        }
+
+        assert [c["seq"] for c in client.get("/tasks/changes", params={"since": 1, "limit": 2}).json()["changes"]] == [2, 3]
+
+        assert client.get("/tasks/changes", params={"since": 4}).json() == {"epoch": epoch, "last_seq": 4, "changes": []}
+
+        # SSE: イベント id は "<epoch>:<seq>"、event は操作、data は JSON の変更
+        # SSE: the event id is "<epoch>:<seq>", the event is the operation and data the change as JSON
+
+        events = _read_events(client, "/tasks/changes/stream?since=2", 2)
+
+        assert [(e["id"], e["event"]) for e in events] == [(f"{epoch}:3", "update"), (f"{epoch}:4", "delete")]
+
+        assert json.loads(events[0]["data"]) == {"seq": 3, "op": "update", "id": a["id"], "task": a}
+
+        # 再接続は Last-Event-ID から続き、続けられない id（別の epoch）なら resync イベントで今の位置を知らせる
+        # a reconnect continues from Last-Event-ID; an id it cannot continue (another epoch) gets a resync event with the current position
+
+        client.post("/tasks/", json={"title": "c"})
+
+        events = _read_events(client, "/tasks/changes/stream", 1, [("Last-Event-ID", f"{epoch}:4")])
+
+        assert (events[0]["id"], events[0]["event"]) == (f"{epoch}:5", "create")
+
+        events = _read_events(client, "/tasks/changes/stream", 1, [("Last-Event-ID", "old:3")])
+
+        assert events[0]["event"] == "resync" and json.loads(events[0]["data"]) == {"epoch": epoch, "last_seq": 5}
+
+        # 4 件のリングから押し出された since、別の epoch は 410 と再読み込みの位置
+        # a since pushed out of the 4-change ring, or another epoch, gets 410 with the position to reload from
+
+        client.post("/tasks/", json={"title": "d"})
+
+        assert client.get("/tasks/changes", params={"since": 2}).json()["last_seq"] == 6
+
+        for params in ({"since": 1}, {"since": 2, "epoch": "old"}):
+
+            r = client.get("/tasks/changes", params=params)
+
+            assert r.status_code == 410 and (r.json()["detail"]["epoch"], r.json()["detail"]["last_seq"]) == (epoch, 6)
+
+
+def test_etags_answer_conditional_requests(app):
+
+    with TestClient(app) as client:
+
+        task = client.post("/tasks/", json={"title": "a"})
+
+        etag = task.headers["ETag"]
+
+        task_id = task.json()["id"]
+
+        r = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+
+        assert r.status_code == 304 and r.content == b""
+
+        listing = client.get("/tasks/")
+
+        assert client.get("/tasks/", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+
+        # 古い ETag での更新・削除は 412、現在の ETag なら通る
+        # an update or delete with a stale ETag gets 412; the current ETag goes through
+
+        updated = client.put(f"/tasks/{task_id}", json={"completed": True}, headers={"If-Match": etag})
+
+        assert updated.status_code == 200 and updated.headers["ETag"] != etag
+
+        assert client.put(f"/tasks/{task_id}", json={"title": "b"}, headers={"If-Match": etag}).status_code == 412
+
+        assert client.delete(f"/tasks/{task_id}", headers={"If-Match": etag}).status_code == 412
+
+        assert client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag}).status_code == 200
+
+        assert client.get("/tasks/", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 200
+
+        assert client.delete(f"/tasks/{task_id}", headers={"If-Match": updated.headers["ETag"]}).status_code == 200
+
+
+def _sample(text, name):
+
+    # Prometheus 形式の本文から name の値を取り出す（無ければ 0）
+    # the value of one sample in a Prometheus text body (0 when absent)
+
+    for line in text.splitlines():
+
+        if line.startswith(name + " "):
+
+            return float(line.rsplit(" ", 1)[1])
+
+    return 0.0
+
+
+def test_metrics_count_requests_by_route(app):
+
+    with TestClient(app) as client:
+
+        count = 'http_request_duration_seconds_count{method="GET",route="/tasks/{task_id}",status="404"}'
+
+        before = _sample(client.get("/metrics").text, count)
+
+        client.post("/tasks/", json={"title": "a"})
+
+        client.get("/tasks/999")
+
+        client.get("/tasks/998")
+
+        r = client.get("/metrics")
+
+        assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+        assert _sample(r.text, count) == before + 2
+
+        assert _sample(r.text, "task_store_size") == 1
+
+        assert 'task_storage_operation_seconds_count{operation="create"}' in r.text
+
+        assert 'task_request_phase_duration_seconds_count{phase="storage",method="POST",route="/tasks/"}' in r.text
+
+        assert "# TYPE http_request_duration_seconds histogram" in r.text
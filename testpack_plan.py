@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+testpack_plan.py
+- Compiled, cached view of TaskManagerAPI_TestPack.xlsx shared by the scripts
+  (generate_automation_from_02.py, check_06.py, update_excel.py, run_all_cases_v2.py).
+- The workbook is read once (all sheets in one openpyxl load) and compiled into:
+  * sheets    : every sheet as a DataFrame
+  * generated : 06_Automation rows parsed from 02_TestCases (METHOD_RE / JSON_BLOCK_RE / normalize_url)
+  * cases     : 06_Automation rows ready to run (templates pre-split into literal/variable parts,
+                expectations pre-parsed)
+- The result is pickled next to the workbook (<workbook>.plan.pickle, or PLAN_CACHE) and keyed by
+  the workbook's SHA-256 plus a SHA-256 of the code that builds it (this file and
+  generate_automation_from_02.py), so it is rebuilt when either the workbook or that code changes.
+  It is a local cache written by these scripts; delete it at any time.
+"""
+import os, re, math, pickle, hashlib
+from functools import lru_cache
+import pandas as pd
+
+PLAN_FORMAT = 1
+
+VAR_SPLIT_RE = re.compile(r"\{\{(\w+)\}\}")
+
+def plan_cache_path(excel_path):
+    return os.getenv("PLAN_CACHE") or excel_path + ".plan.pickle"
+
+def workbook_hash(excel_path):
+    h = hashlib.sha256()
+    with open(excel_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# Files whose code shapes the compiled plan (compile_case here, build_rows and its helpers there)
+PLAN_SOURCES = ("testpack_plan.py", "generate_automation_from_02.py")
+
+@lru_cache(maxsize=None)
+def code_hash():
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in PLAN_SOURCES:
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def is_nan(x):
+    return isinstance(x, float) and math.isnan(x)
+
+def split_template(s):
+    # "/tasks/{{task_id}}" -> ["/tasks/", "task_id", ""]: even items are literal text, odd items variable names
+    return VAR_SPLIT_RE.split(s)
+
+def render(parts, vars):
+    # Unknown variables stay as "{{name}}", like the old string replacement
+    out = []
+    for i, p in enumerate(parts):
+        if i % 2 == 0:
+            out.append(p)
+        else:
+            out.append(str(vars[p]) if p in vars else "{{" + p + "}}")
+    return "".join(out)
+
+def compile_case(idx, row):
+    url_path = row.get("URL","/")
+    body_raw = row.get("ボディ(JSON)","")
+    if is_nan(url_path):
+        url_path = "/"
+    if is_nan(body_raw):
+        body_raw = ""
+    url_path = str(url_path)
+    expect_status = str(row.get("期待ステータス","200")).strip()
+    return {
+        "idx": int(idx),
+        "tcid": str(row.get("テストケースID","")).strip(),
+        "method": str(row.get("メソッド","GET")).strip().upper(),
+        "url_path": url_path,
+        "url_parts": split_template(url_path),
+        "body_raw": body_raw,
+        "body_parts": split_template(body_raw) if isinstance(body_raw, str) else None,
+        "expect_status": expect_status,
+        "ok_set": {s.strip() for s in expect_status.split("|") if s.strip()},
+        "save_as": str(row.get("save_as（任意）","")).strip(),
+        "expect_contains": str(row.get("expect_contains（任意）","")).strip(),
+    }
+
+def compile_plan(excel_path, digest):
+    from generate_automation_from_02 import build_rows
+    sheets = pd.read_excel(excel_path, sheet_name=None)
+    plan = {"format": PLAN_FORMAT, "code": code_hash(), "workbook": digest, "sheets": sheets, "generated": None, "cases": None}
+    if "02_TestCases" in sheets:
+        plan["generated"] = build_rows(sheets["02_TestCases"])
+    if "06_Automation" in sheets:
+        plan["cases"] = [compile_case(idx, row) for idx, row in sheets["06_Automation"].iterrows()]
+    return plan
+
+def save_plan(excel_path, plan):
+    cache = plan_cache_path(excel_path)
+    tmp = cache + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache)
+
+def load_plan(excel_path):
+    digest = workbook_hash(excel_path)
+    try:
+        with open(plan_cache_path(excel_path), "rb") as f:
+            plan = pickle.load(f)
+        if plan.get("format") == PLAN_FORMAT and plan.get("code") == code_hash() and plan.get("workbook") == digest:
+            return plan
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+    plan = compile_plan(excel_path, digest)
+    save_plan(excel_path, plan)
+    return plan
+
+def refresh_plan(excel_path, plan, written_sheets):
+    # After a script rewrote some sheets itself ({"05_Report": df, ...}), update the cache
+    # with those frames and the new hash instead of re-reading the whole workbook next time.
+    # Not for 06_Automation: its cases must be compiled from the values as read back from Excel.
+    plan["sheets"].update(written_sheets)
+    plan["workbook"] = workbook_hash(excel_path)
+    save_plan(excel_path, plan)
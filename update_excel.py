@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os, json, datetime, sys
 import pandas as pd
+from testpack_plan import load_plan, refresh_plan
 
 EXCEL_PATH = os.getenv("EXCEL_PATH", "TaskManagerAPI_TestPack.xlsx")
 RESULTS_DIR = os.getenv("RESULTS_DIR", "./results")
@@ -61,11 +62,13 @@ def main():
         sys.exit(1)
 
     # Read existing sheets
-    xls = pd.ExcelFile(EXCEL_PATH)
-    if "03_ExecutionLog" in xls.sheet_names:
-        df_exec = pd.read_excel(xls, sheet_name="03_ExecutionLog")
+    plan = load_plan(EXCEL_PATH)
+    sheets = plan["sheets"]
+    columns = ["実行日", "実行者", "テストケースID", "実際の結果", "ステータス（Pass/Fail）", "証跡（スクショ/ログのパス）", "備考"]
+    if "03_ExecutionLog" in sheets:
+        df_exec = sheets["03_ExecutionLog"]
     else:
-        df_exec = pd.DataFrame(columns=["実行日", "実行者", "テストケースID", "実際の結果", "ステータス（Pass/Fail）", "証跡（スクショ/ログのパス）", "備考"])
+        df_exec = pd.DataFrame(columns=columns)
 
     today = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -78,12 +81,14 @@ def main():
         verdict = judge(tcid, status)
         new_rows.append([today, EXECUTOR, tcid, body, verdict, body_path, ""])
 
-    df_new = pd.DataFrame(new_rows, columns=df_exec.columns)
+    # By name: after run_all_cases_v2.py --export-log the sheet also has a RUN_ID column.
+    # These rows have no RUN_ID; the next --export-log carries them into the execution log
+    df_new = pd.DataFrame(new_rows, columns=columns)
     df_exec_out = pd.concat([df_exec, df_new], ignore_index=True)
 
     # Update report sheet if present
-    if "05_Report" in xls.sheet_names:
-        df_report = pd.read_excel(xls, sheet_name="05_Report")
+    if "05_Report" in sheets:
+        df_report = sheets["05_Report"]
         # Compute stats from df_exec_out
         executed = len(df_exec_out)
         passed = int((df_exec_out["ステータス（Pass/Fail）"] == "Pass").sum())
@@ -105,9 +110,11 @@ def main():
         with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
             df_exec_out.to_excel(writer, index=False, sheet_name="03_ExecutionLog")
             df_report.to_excel(writer, index=False, sheet_name="05_Report")
+        refresh_plan(EXCEL_PATH, plan, {"03_ExecutionLog": df_exec_out, "05_Report": df_report})
     else:
         with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
             df_exec_out.to_excel(writer, index=False, sheet_name="03_ExecutionLog")
+        refresh_plan(EXCEL_PATH, plan, {"03_ExecutionLog": df_exec_out})
 
     print("[OK] Excel updated:", EXCEL_PATH)
 